@@ -1,17 +1,43 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, g
+from encoding import jsonify
 from firebase_service import FirebaseService
+from async_firebase_service import AsyncFirebaseService
+from concurrency import fan_out
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 import secrets
-import jwt
 import datetime
-from datetime import timedelta
 from functools import wraps
+import instrumentation
+import logging
+import logging_setup
+import metrics
+import moderation
+import passwords
+import conditional
+import duplicates
+import encoding
+import filters
+import live
+import rate_limit
+import replicas
+import response_cache
+import search
+import singleflight
+import tokens
 
 app = Flask(__name__)
 CORS(app)
 
+# Firestore-aware (and with orjson faster) JSON, gzip/brotli for large responses; registered first so
+# compression runs after every other after_request hook
+encoding.init_app(app)
+
+# JSON logs with request ids, written from a background thread
+logging_setup.setup_logging(app)
+logger = logging.getLogger(__name__)
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -19,8 +45,100 @@ load_dotenv()
 app.config['SECRET_KEY'] = os.environ.get('ADMIN_SECRET_KEY', secrets.token_hex(16)) # Secret key for JWT tokens - keep this secure
 ADMIN_REGISTRATION_KEY = os.environ.get('ADMIN_REGISTRATION_KEY', 'villanova-optima-admin-2025') # registration key required to create admin accounts
 
+if 'ADMIN_SECRET_KEY' not in os.environ:
+    # each server worker would sign tokens with its own random key and reject the others'
+    logger.warning('ADMIN_SECRET_KEY is not set, tokens will only be valid in this process')
+
+# token buckets of all limiters, per process or shared through Redis (RATE_LIMIT_REDIS_URL)
+rate_limit_store = rate_limit.store_from_env()
+
+# login attempts are limited per client ip and per email, checked before any hashing or Firestore read
+login_ip_limiter = rate_limit.RateLimiter(
+    float(os.environ.get('LOGIN_IP_PER_MINUTE', 20)), int(os.environ.get('LOGIN_IP_BURST', 10)),
+    store=rate_limit_store, prefix='login-ip:')
+login_email_limiter = rate_limit.RateLimiter(
+    float(os.environ.get('LOGIN_EMAIL_PER_MINUTE', 5)), int(os.environ.get('LOGIN_EMAIL_BURST', 5)),
+    store=rate_limit_store, prefix='login-email:')
+
+# authenticated requests are limited per admin and across all admins; endpoints cost different
+# amounts of tokens (analytics scan whole collections), override with RATE_LIMIT_COSTS="endpoint=cost,..."
+REQUEST_COSTS = {
+    'get_analytics_summary': 10,
+    'get_community_task_stats': 10,
+    'get_posts': 2,
+    'get_users': 2,
+    'get_admin_logs': 2,
+    'get_community_tasks': 2,
+    'rebuild_user_timeline': 5,
+    'get_post_clusters': 5,
+    'bulk_delete_posts': 10,
+    'rescore_moderation_queue': 10
+}
+REQUEST_COSTS.update(rate_limit.parse_costs(os.environ.get('RATE_LIMIT_COSTS', '')))
+request_limiter = rate_limit.RequestLimiter(
+    per_admin=rate_limit.RateLimiter(
+        float(os.environ.get('RATE_LIMIT_PER_MINUTE', 300)), int(os.environ.get('RATE_LIMIT_BURST', 100)),
+        store=rate_limit_store, prefix='admin:'),
+    global_limit=rate_limit.RateLimiter(
+        float(os.environ.get('RATE_LIMIT_GLOBAL_PER_MINUTE', 3000)), int(os.environ.get('RATE_LIMIT_GLOBAL_BURST', 500)),
+        store=rate_limit_store, prefix='global:'),
+    costs=REQUEST_COSTS
+)
+
 firebase_service = FirebaseService()
 
+# identical concurrent reads (analytics, stats, dashboard lists) share one Firestore execution
+singleflight.coalesce_service(firebase_service)
+
+# in-memory search over users and posts, built on the first search and kept current with writes (see search.py)
+search_index = search.index_service(firebase_service, search.SearchIndex())
+
+# near-duplicate posts (spam waves) from MinHash/LSH buckets, built like the search index (see duplicates.py)
+duplicate_index = duplicates.index_service(firebase_service, duplicates.DuplicateIndex())
+BULK_DELETE_LIMIT = 500
+
+# fan-out heavy reads (user details, task participants, analytics) can go through the async client
+# so their independent queries run concurrently; enable with FIRESTORE_ASYNC=1
+async_firebase_service = AsyncFirebaseService() if os.environ.get('FIRESTORE_ASYNC', '0') == '1' else None
+
+# analytics may be a minute old: served from memory and refreshed in the background once stale
+analytics_cache = response_cache.ResponseCache(
+    'analytics_response',
+    ttl=float(os.environ.get('ANALYTICS_CACHE_TTL', 60)),
+    stale_ttl=float(os.environ.get('ANALYTICS_CACHE_STALE_TTL', 300)),
+    max_entries=int(os.environ.get('ANALYTICS_CACHE_MAX_ENTRIES', 256))
+)
+
+# short-lived access tokens verified in memory, refresh tokens, revocations synced from Firestore (see tokens.py)
+signing_keys, signing_kid = tokens.signing_keys_from_env(app.config['SECRET_KEY'])
+token_service = tokens.TokenService(
+    signing_keys, signing_kid,
+    revocations=tokens.RevocationList(firebase_service),
+    legacy_key=app.config['SECRET_KEY']
+)
+
+# count Firestore reads/writes per request (Server-Timing header + per-route totals)
+instrumentation.instrument_service(firebase_service)
+instrumentation.init_app(app)
+
+# per-route request counts, latency histograms and errors, served on /metrics
+metrics.init_app(app)
+
+# admins, categories and task summaries are served from listener-fed replicas (see replicas.py)
+replicas.init_app(app)
+
+# Firestore/Storage clients are created on first use in each process, so importing the app is cheap
+# and safe before fork; warm_up() does the connecting ahead of the first request instead
+def init_worker():
+    '''Give a forked server worker its own Firestore client (see gunicorn.conf.py)'''
+    firebase_service.reconnect()
+
+def warm_up():
+    '''Connect to Firestore and load revocations and replicas now rather than in the first requests'''
+    firebase_service.warm_up()
+    token_service.revocations.ensure_started()
+    replicas.start(firebase_service.db)
+
 # decorator for JWT token validation
 def token_required(f):
     @wraps(f)
@@ -39,22 +157,65 @@ def token_required(f):
             }), 401
         
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_admin = firebase_service.get_admin(data['admin_id'])
-            if not current_admin:
-                return jsonify({
-                    'success': False,
-                    'message': 'Invalid admin token'
-                }), 401
+            claims = token_service.decode(token)
+            if claims.get('legacy'):
+                # tokens issued before access tokens carried claims, valid until their 24h expiry
+                current_admin = firebase_service.get_admin(claims['admin_id'])
+                if not current_admin:
+                    return jsonify({
+                        'success': False,
+                        'message': 'Invalid admin token'
+                    }), 401
+            else:
+                # signed claims are trusted as is, no admin lookup on the auth path
+                current_admin = {
+                    'id': claims['admin_id'],
+                    'email': claims.get('email', ''),
+                    'name': claims.get('name', '')
+                }
+            g.token_claims = claims
         except:
             return jsonify({
                 'success': False,
                 'message': 'Token is invalid'
             }), 401
         
+        rejected = request_limiter.check(current_admin['id'], request.endpoint)
+        if rejected:
+            scope, retry_after = rejected
+            metrics.RATE_LIMITED.inc(route=instrumentation.route_name(), scope=scope)
+            response = jsonify({
+                'success': False,
+                'message': 'Rate limit exceeded'
+            })
+            response.headers['Retry-After'] = rate_limit.retry_after_header(retry_after)
+            return response, 429
+        
         return f(current_admin, *args, **kwargs)
     return decorated
 
+# readiness
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    # 200 once this process reached Firestore, 503 (and warm-up on the next probe) until then
+    try:
+        if not firebase_service.is_warm():
+            warm_up()
+        return jsonify({
+            'success': True,
+            'ready': True,
+            'pid': os.getpid(),
+            'warm_up_ms': round(firebase_service.warmed_up[1] * 1000, 2),
+            'replicas': {replica.collection: replica.state for replica in replicas.ALL}
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'ready': False,
+            'error': str(e)
+        }), 503
+
 # admin auth routes
 
 @app.route('/api/admin/login', methods=['POST'])
@@ -71,6 +232,13 @@ def admin_login():
                 'error': 'Email and password are required'
             }), 400
         
+        # reject brute force floods before doing any work
+        for reason, limiter, key in (('ip', login_ip_limiter, request.remote_addr or ''),
+                                     ('email', login_email_limiter, email.strip().lower())):
+            retry_after = limiter.hit(key)
+            if retry_after:
+                return login_throttled(reason, retry_after)
+        
         # authenticate admin
         admin_user = firebase_service.login_admin(email, password)
         # check if auth successful
@@ -79,22 +247,86 @@ def admin_login():
                 'success': False,
                 'error': 'Invalid credentials'
             }), 401
+        login_email_limiter.reset(email.strip().lower())
         
-        # gen JWT token
-        token = jwt.encode({
-            'admin_id': admin_user['id'],
-            'exp': datetime.datetime.now(datetime.timezone.utc) + timedelta(hours=24)
-        }, app.config['SECRET_KEY'], algorithm='HS256')
+        # gen access + refresh token
+        issued = token_service.issue(admin_user)
         
         return jsonify({
             'success': True,
-            'token': token,
+            **issued,
             'admin': {
                 'id': admin_user['id'],
                 'email': admin_user['email'],
                 'name': admin_user.get('name', '')
             }
         })
+    except passwords.HashingBusy as e:
+        return login_throttled('busy', 1, str(e))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+def login_throttled(reason, retry_after, error='Too many login attempts, try again later'):
+    metrics.LOGIN_THROTTLED.inc(reason=reason)
+    response = jsonify({'success': False, 'error': error})
+    response.headers['Retry-After'] = rate_limit.retry_after_header(retry_after)
+    return response, 429 if reason != 'busy' else 503
+
+@app.route('/api/admin/token/refresh', methods=['POST'])
+def refresh_token():
+    '''Exchange a refresh token for a new access and refresh token (refresh tokens are single use)'''
+    try:
+        data = request.json or dict()
+        refresh = data.get('refreshToken')
+        
+        if not refresh:
+            return jsonify({
+                'success': False,
+                'error': 'refreshToken is required'
+            }), 400
+        
+        try:
+            claims = token_service.decode(refresh, typ='refresh')
+        except tokens.InvalidToken:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid refresh token'
+            }), 401
+        
+        # picks up name/email changes and stops deleted admins from refreshing
+        admin_user = firebase_service.get_admin(claims['admin_id'])
+        if not admin_user:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid refresh token'
+            }), 401
+        
+        token_service.revoke(claims)
+        
+        return jsonify({
+            'success': True,
+            **token_service.issue(admin_user)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/admin/logout', methods=['POST'])
+@token_required
+def admin_logout(current_admin):
+    '''Revoke the current access token and, if given, the refresh token'''
+    try:
+        token_service.revoke(g.token_claims)
+        
+        refresh = (request.get_json(silent=True) or dict()).get('refreshToken')
+        if refresh:
+            try:
+                claims = token_service.decode(refresh, typ='refresh')
+                if claims['admin_id'] == current_admin['id']:
+                    token_service.revoke(claims)
+            except tokens.InvalidToken:
+                pass # already expired or revoked
+        
+        return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
@@ -129,6 +361,8 @@ def admin_register():
             'success': True,
             'admin': admin_user
         })
+    except passwords.HashingBusy as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         return jsonify({
             'success': False,
@@ -168,9 +402,11 @@ def get_posts(current_admin):
         # extract pagination params
         limit = request.args.get('limit', 50, type=int)
         start_after = request.args.get('startAfter')
+        # narrowed by Firestore, see filters.py for the parameters
+        post_filters = filters.parse('posts', request.args)
         
         # Get posts with pagination
-        posts_data = firebase_service.get_all_posts(limit=limit, start_after=start_after)
+        posts_data = firebase_service.get_all_posts(limit=limit, start_after=start_after, filters=post_filters)
         
         return jsonify({
             'success': True,
@@ -187,12 +423,18 @@ def get_posts(current_admin):
 @token_required
 def get_post_details(current_admin, post_id):
     try:
-        post = firebase_service.get_post(post_id) # get post details
+        # polling clients send the ETag back, answer 304 from the document's metadata alone
+        not_modified = conditional.check(firebase_service.get_update_time, 'posts', post_id)
+        if not_modified:
+            return not_modified
         
-        return jsonify({
+        post, update_time = firebase_service.get_post(post_id, versioned=True) # get post details
+        
+        response = jsonify({
             'success': True,
             'post': post
         })
+        return conditional.add_validators(response, *conditional.validators('posts', post_id, update_time))
     except Exception as e:
         return jsonify({
             'success': False,
@@ -215,6 +457,75 @@ def delete_posts(current_admin, post_id):
             'error': str(e)
         }), 400
 
+@app.route('/api/admin/posts/clusters', methods=['GET'])
+@token_required
+def get_post_clusters(current_admin):
+    '''Groups of near-duplicate posts, largest first (?minSize=&threshold=&limit=)'''
+    try:
+        min_size = max(2, request.args.get('minSize', 3, type=int))
+        threshold = request.args.get('threshold', duplicates.THRESHOLD, type=float)
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+        
+        if not 0 < threshold <= 1:
+            return jsonify({
+                'success': False,
+                'error': 'threshold must be between 0 and 1'
+            }), 400
+        
+        if not duplicate_index.ensure_started(firebase_service.db):
+            response = jsonify({
+                'success': False,
+                'error': 'Duplicate index is still building, try again shortly'
+            })
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        
+        clusters = duplicate_index.clusters(min_size=min_size, threshold=threshold)
+        
+        return jsonify({
+            'success': True,
+            'clusters': duplicate_index.hydrate(firebase_service.db, clusters[:limit]),
+            'total': len(clusters)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/api/admin/posts/bulk-delete', methods=['POST'])
+@token_required
+def bulk_delete_posts(current_admin):
+    '''Delete up to BULK_DELETE_LIMIT posts, e.g. the post_ids of a cluster'''
+    try:
+        data = request.json or dict()
+        post_ids = data.get('postIds')
+        
+        if not isinstance(post_ids, list) or not post_ids or not all(isinstance(post_id, str) for post_id in post_ids):
+            return jsonify({
+                'success': False,
+                'error': 'postIds must be a non-empty list of post ids'
+            }), 400
+        if len(post_ids) > BULK_DELETE_LIMIT:
+            return jsonify({
+                'success': False,
+                'error': f'At most {BULK_DELETE_LIMIT} posts can be deleted at once'
+            }), 400
+        
+        result = firebase_service.delete_posts(post_ids, admin_id=current_admin['id'])
+        
+        return jsonify({
+            'success': True,
+            'deleted': result['deleted'],
+            'missing': result['missing'],
+            'message': f"{len(result['deleted'])} posts have been deleted"
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
 @app.route('/api/admin/posts/<post_id>/content', methods=['PUT'])
 @token_required
 def update_post_content(current_admin, post_id):
@@ -266,8 +577,9 @@ def get_users(current_admin):
         # Extract pagination params
         limit = request.args.get('limit', 50, type=int)
         start_after = request.args.get('startAfter')
+        user_filters = filters.parse('users', request.args) # narrowed by Firestore, see filters.py
         
-        users_data = firebase_service.get_all_users(limit=limit, start_after=start_after) # get users with pagination
+        users_data = firebase_service.get_all_users(limit=limit, start_after=start_after, filters=user_filters) # get users with pagination
         
         return jsonify({
             'success': True,
@@ -280,23 +592,96 @@ def get_users(current_admin):
             'error': str(e)
         }), 400
 
+# how the posts embedded in a user's details are returned: newest N (default), a page with a
+# cursor, only the count, or every post (can be very large for heavy posters)
+USER_POSTS_MODES = ('recent', 'page', 'count', 'all')
+
 @app.route('/api/admin/users/<user_id>', methods=['GET'])
 @token_required
 def get_user_details(current_admin, user_id):
     try:
-        # get user profile
-        user = firebase_service.get_user_profile(user_id)
+        posts_mode = request.args.get('posts', 'recent')
+        if posts_mode not in USER_POSTS_MODES:
+            return jsonify({
+                'success': False,
+                'error': f'posts must be one of: {", ".join(USER_POSTS_MODES)}'
+            }), 400
+        posts_limit = max(1, min(request.args.get('postsLimit', 20, type=int), 100))
+        posts_start_after = request.args.get('postsStartAfter') if posts_mode == 'page' else None
         
-        # get user's posts
-        posts = firebase_service.get_user_posts(user_id)
+        if async_firebase_service:
+            user, posts = async_firebase_service.run(async_firebase_service.get_user_details(
+                user_id,
+                posts_mode=posts_mode,
+                posts_limit=posts_limit,
+                posts_start_after=posts_start_after
+            ))
+        else:
+            if posts_mode == 'count':
+                read_posts = lambda: firebase_service.count_user_posts(user_id)
+            elif posts_mode == 'all':
+                read_posts = lambda: firebase_service.get_user_posts(user_id)
+            else:
+                read_posts = lambda: firebase_service.get_user_posts(user_id, limit=posts_limit, start_after=posts_start_after)
+            
+            # profile and posts don't depend on each other, read them concurrently
+            user, posts = fan_out(lambda: firebase_service.get_user_profile(user_id), read_posts)
         
         # add posts to user data
-        user['posts'] = posts
+        if posts_mode == 'count':
+            user['post_count'] = posts
+        else:
+            user['posts'] = posts
+        if posts_mode == 'page':
+            user['last_post'] = posts[-1]['id'] if len(posts) == posts_limit else None
         
-        return jsonify({
+        # the body depends on the user and their posts, so the ETag is a hash of the body itself
+        response = jsonify({
             'success': True,
             'user': user
         })
+        response.add_etag()
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/api/admin/users/<user_id>/feed', methods=['GET'])
+@token_required
+def get_user_feed(current_admin, user_id):
+    '''View a user's friends feed as they see it (newest posts of the user and their friends)'''
+    try:
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+        last_post = request.args.get('lastPost')
+        
+        feed = firebase_service.get_friends_feed(user_id, limit=limit, last_post=last_post)
+        
+        return jsonify({
+            'success': True,
+            'posts': feed['posts'],
+            'last_post': feed['last_post']
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/api/admin/users/<user_id>/timeline/rebuild', methods=['POST'])
+@token_required
+def rebuild_user_timeline(current_admin, user_id):
+    '''Rebuild a user's precomputed feed timeline (see timelines.py)'''
+    try:
+        entries = firebase_service.rebuild_timeline(user_id, admin_id=current_admin['id'])
+        
+        return jsonify({
+            'success': True,
+            'message': f'Timeline of user {user_id} rebuilt with {entries} posts',
+            'entries': entries
+        })
     except Exception as e:
         return jsonify({
             'success': False,
@@ -339,17 +724,182 @@ def delete_user(current_admin, user_id):
             'error': str(e)
         }), 400
 
+# Search routes
+
+@app.route('/api/admin/search', methods=['GET'])
+@token_required
+def search_documents(current_admin):
+    '''Ranked search over usernames, emails and post content (?q=&type=all|users|posts&page=&limit=)'''
+    try:
+        query = request.args.get('q', '')
+        kind = request.args.get('type', 'all')
+        page = max(1, request.args.get('page', 1, type=int))
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+        
+        if not query.strip():
+            return jsonify({
+                'success': False,
+                'error': 'Missing search query'
+            }), 400
+        if kind not in ('all', search.USERS, search.POSTS):
+            return jsonify({
+                'success': False,
+                'error': f'Unknown search type {kind}, expected all, users or posts'
+            }), 400
+        
+        if not search_index.ensure_started(firebase_service.db):
+            response = jsonify({
+                'success': False,
+                'error': 'Search index is still building, try again shortly'
+            })
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        
+        hits, total, truncated = search_index.search(
+            query, kind=None if kind == 'all' else kind, offset=(page - 1) * limit, limit=limit
+        )
+        
+        return jsonify({
+            'success': True,
+            'results': search_index.hydrate(firebase_service.db, hits),
+            'total': total,
+            'truncated': truncated,
+            'page': page,
+            'limit': limit
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+# Moderation queue routes (see moderation.py)
+
+@app.route('/api/admin/moderation/queue', methods=['GET'])
+@token_required
+def get_moderation_queue(current_admin):
+    '''The highest priority open items, without claiming them (?limit=)'''
+    try:
+        limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+        
+        return jsonify({
+            'success': True,
+            'items': firebase_service.get_moderation_queue(limit=limit)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/api/admin/moderation/claim', methods=['POST'])
+@token_required
+def claim_moderation_items(current_admin):
+    '''Lease the highest priority open items to the calling admin ({count, leaseSeconds})'''
+    try:
+        data = request.json or dict()
+        count = data.get('count', 1)
+        lease_seconds = data.get('leaseSeconds', moderation.LEASE_SECONDS)
+        
+        if not isinstance(count, int) or not 1 <= count <= moderation.MAX_CLAIM:
+            return jsonify({
+                'success': False,
+                'error': f'count must be between 1 and {moderation.MAX_CLAIM}'
+            }), 400
+        if not isinstance(lease_seconds, int) or not 30 <= lease_seconds <= moderation.MAX_LEASE_SECONDS:
+            return jsonify({
+                'success': False,
+                'error': f'leaseSeconds must be between 30 and {moderation.MAX_LEASE_SECONDS}'
+            }), 400
+        
+        items = firebase_service.claim_moderation_items(current_admin['id'], count=count, lease_seconds=lease_seconds)
+        
+        return jsonify({
+            'success': True,
+            'items': items
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/api/admin/moderation/<post_id>/release', methods=['POST'])
+@token_required
+def release_moderation_item(current_admin, post_id):
+    try:
+        firebase_service.release_moderation_item(post_id, current_admin['id'])
+        
+        return jsonify({
+            'success': True,
+            'message': f'Moderation item {post_id} is back in the queue'
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/api/admin/moderation/<post_id>/resolve', methods=['POST'])
+@token_required
+def resolve_moderation_item(current_admin, post_id):
+    '''Close a claimed item ({resolution: dismiss|delete, note})'''
+    try:
+        data = request.json or dict()
+        resolution = data.get('resolution')
+        
+        if resolution not in moderation.RESOLUTIONS:
+            return jsonify({
+                'success': False,
+                'error': 'resolution must be dismiss or delete'
+            }), 400
+        
+        firebase_service.resolve_moderation_item(post_id, current_admin['id'], resolution, note=data.get('note'))
+        
+        return jsonify({
+            'success': True,
+            'message': f'Moderation item {post_id} resolved ({resolution})'
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/api/admin/moderation/rescore', methods=['POST'])
+@token_required
+def rescore_moderation_queue(current_admin):
+    '''Score the recent posts now instead of waiting for the periodic scoring'''
+    try:
+        result = firebase_service.rescore_moderation_queue(admin_id=current_admin['id'])
+        
+        return jsonify({
+            'success': True,
+            'scored': result['scored'],
+            'queued': result['queued'],
+            'dropped': result['dropped']
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
 # Analytics routes
 
 @app.route('/api/admin/analytics/summary', methods=['GET'])
 @token_required
+@analytics_cache.cached(args={'days': 30})
 def get_analytics_summary(current_admin):
     try:
         # extract time period
         days = request.args.get('days', 30, type=int)
         
         # get analytics summary
-        summary = firebase_service.get_analytics_summary(days=days)
+        if async_firebase_service:
+            summary = async_firebase_service.run(async_firebase_service.get_analytics_summary(days=days))
+        else:
+            summary = firebase_service.get_analytics_summary(days=days)
         
         return jsonify({
             'success': True,
@@ -383,6 +933,24 @@ def get_admin_logs(current_admin):
             'error': str(e)
         }), 400
 
+@app.route('/api/admin/live', methods=['GET'])
+@token_required
+def live_dashboard(current_admin):
+    # new logs and summary deltas pushed as Server-Sent Events, from listeners shared by all streams (see live.py)
+    try:
+        connection = live.hub.subscribe(firebase_service.db, current_admin['id'])
+        return live.response(firebase_service.db, connection)
+    except live.TooManyConnections as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
 # Community
 
 @app.route('/api/admin/community-tasks', methods=['GET'])
@@ -409,13 +977,21 @@ def get_community_tasks(current_admin):
 @token_required
 def get_community_task(current_admin, task_id):
     try:
+        # unchanged task: 304 without resolving the participant lists
+        not_modified = conditional.check(firebase_service.get_update_time, 'community_tasks', task_id)
+        if not_modified:
+            return not_modified
         
-        task = firebase_service.get_community_task(task_id=task_id)
+        if async_firebase_service:
+            task, update_time = async_firebase_service.run(async_firebase_service.get_community_task(task_id=task_id, versioned=True))
+        else:
+            task, update_time = firebase_service.get_community_task(task_id=task_id, versioned=True)
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'task': task
         })
+        return conditional.add_validators(response, *conditional.validators('community_tasks', task_id, update_time))
     except Exception as e:
         return jsonify({
             'sucess': False,
@@ -468,7 +1044,6 @@ def create_community_task(current_admin):
             'community_task': task
         })
     except Exception as e:
-        print(f'Error: {e}')
         return jsonify({
             'success': False,
             'error': str(e)
@@ -507,7 +1082,6 @@ def update_community_task(current_admin, task_id):
             'task': updated_task
         })
     except Exception as e:
-        print(f'Error: {e}')
         return jsonify({
             'success': False,
             'error': str(e)
@@ -535,6 +1109,7 @@ def delete_community_task_route(current_admin, task_id):
 
 @app.route('/api/admin/community-tasks/stats', methods=['GET'])
 @token_required
+@analytics_cache.cached()
 def get_community_task_stats(current_admin):
     try:
         stats = firebase_service.get_community_task_stats()
@@ -653,7 +1228,26 @@ def delete_task_category(current_admin, category_id):
             'error': str(e)
         }), 400
 
-# Start server
+# Operational routes
+
+@app.route('/api/admin/metrics/firestore', methods=['GET'])
+@token_required
+def get_firestore_metrics(current_admin):
+    '''Firestore reads/writes/latency aggregated per route since this process started'''
+    try:
+        return jsonify({
+            'success': True,
+            'read_budget': instrumentation.READ_BUDGET,
+            'latency_budget_ms': instrumentation.LATENCY_BUDGET_MS,
+            'routes': instrumentation.route_totals.snapshot()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+# Start server (development only, use `python -m serve` in production)
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001)) # we use 5001 for now to use a different port than the main API
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
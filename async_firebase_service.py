@@ -0,0 +1,250 @@
+# async_firebase_service.py
+'''
+Async read path for the fan-out heavy admin endpoints, built on Firestore's AsyncClient.
+
+Independent reads are issued concurrently with asyncio.gather, so an endpoint costs about as
+long as its slowest read instead of the sum of all of them. The client lives on one background
+event loop per process (gRPC async channels are bound to the loop that created them); Flask
+handlers call into it through `run()`.
+'''
+import asyncio
+import datetime
+import logging
+import os
+import threading
+import time
+
+from google.cloud import firestore as gcloud_firestore
+
+import firebase_service
+import instrumentation
+import logging_setup
+import records
+
+logger = logging.getLogger(__name__)
+
+ASYNC_TIMEOUT = float(os.environ.get('FIRESTORE_ASYNC_TIMEOUT', 30))
+
+
+class _LoopThread:
+    '''A daemon thread running an event loop that coroutines can be submitted to from any thread'''
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='firestore-async', daemon=True)
+        self.thread.start()
+
+
+class AsyncFirebaseService:
+    def __init__(self, client_factory=None):
+        # client_factory() must return an AsyncClient-like object; defaults to the firebase app's project/credentials
+        self._client_factory = client_factory or self._default_client
+        self._lock = threading.Lock()
+        self._loop_thread = None
+        self._client = None
+
+    @staticmethod
+    def _default_client():
+        app = firebase_service.firebase_app()
+        return gcloud_firestore.AsyncClient(
+            project=app.project_id,
+            credentials=app.credential.get_credential()
+        )
+
+    def _loop(self):
+        # created lazily and per process: neither the loop thread nor gRPC channels survive fork
+        with self._lock:
+            if self._loop_thread is None or self._loop_thread.pid != os.getpid():
+                self._loop_thread = _LoopThread()
+                self._client = None
+            return self._loop_thread.loop
+
+    @property
+    def db(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    def run(self, coroutine, timeout=ASYNC_TIMEOUT):
+        '''Run a coroutine of this service on its event loop and wait for the result (thread-safe)'''
+        stats = instrumentation.current_stats()
+
+        async def accounted():
+            # reads made on the loop thread still count towards the calling request
+            token = instrumentation.attach(stats)
+            try:
+                return await coroutine
+            finally:
+                instrumentation.detach(token)
+
+        future = asyncio.run_coroutine_threadsafe(accounted(), self._loop())
+        return future.result(timeout)
+
+    # helpers
+
+    async def _get(self, ref):
+        started = time.perf_counter()
+        snapshot = await ref.get()
+        instrumentation.record(reads=1, round_trips=1, seconds=time.perf_counter() - started)
+        return snapshot
+
+    async def _stream(self, query):
+        instrumentation.record(round_trips=1)
+        started = time.perf_counter()
+        docs = [doc async for doc in query.stream()]
+        instrumentation.record(reads=len(docs), seconds=time.perf_counter() - started)
+        return docs
+
+    async def _get_all(self, refs):
+        if not refs:
+            return []
+        instrumentation.record(round_trips=1)
+        started = time.perf_counter()
+        snapshots = [snapshot async for snapshot in self.db.get_all(refs)]
+        instrumentation.record(reads=len(snapshots), seconds=time.perf_counter() - started)
+        return snapshots
+
+    async def _count(self, query):
+        # aggregation query: the server counts, billed as one read per batch of up to 1000 index entries
+        started = time.perf_counter()
+        result = await query.count().get()
+        instrumentation.record(reads=1, round_trips=1, seconds=time.perf_counter() - started)
+        return int(result[0][0].value)
+
+    # User methods
+
+    async def get_user_profile(self, user_id):
+        try:
+            user_doc = await self._get(self.db.collection('users').document(user_id))
+
+            if not user_doc.exists:
+                raise Exception('User not found')
+
+            return records.USER.from_snapshot(user_doc)
+        except Exception as e:
+            logging_setup.log_failure(logger, 'async get_user_profile', e)
+            raise e
+
+    async def get_user_posts(self, user_id, limit=None, start_after=None):
+        '''Get posts created by a specific user, all of them or the newest `limit` (after post `start_after`)'''
+        try:
+            query = self.db.collection('posts').where('userId', '==', user_id)
+
+            if limit:
+                query = query.order_by('createdAt', direction=gcloud_firestore.Query.DESCENDING).limit(limit)
+                if start_after:
+                    last_doc = await self._get(self.db.collection('posts').document(start_after))
+                    if last_doc.exists:
+                        query = query.start_after(last_doc)
+
+            return [records.POST_WITH_COUNTS.from_snapshot(doc) for doc in await self._stream(query)]
+        except Exception as e:
+            logging_setup.log_failure(logger, 'async get_user_posts', e)
+            raise e
+
+    async def count_user_posts(self, user_id):
+        '''Number of posts by a user, without reading the posts themselves'''
+        try:
+            return await self._count(self.db.collection('posts').where('userId', '==', user_id))
+        except Exception as e:
+            logging_setup.log_failure(logger, 'async count_user_posts', e)
+            raise e
+
+    async def get_user_details(self, user_id, posts_mode='all', posts_limit=None, posts_start_after=None):
+        '''
+        User profile and their posts, read concurrently. Returns (user, posts) where posts is the
+        post count for posts_mode 'count' and a list of posts otherwise.
+        '''
+        if posts_mode == 'count':
+            posts_read = self.count_user_posts(user_id)
+        elif posts_mode == 'all':
+            posts_read = self.get_user_posts(user_id)
+        else:
+            posts_read = self.get_user_posts(user_id, limit=posts_limit, start_after=posts_start_after)
+        user, posts = await asyncio.gather(self.get_user_profile(user_id), posts_read)
+        return user, posts
+
+    # Community features
+
+    async def get_community_task(self, task_id, versioned=False):
+        '''Get details of a specific community task, resolving all participants in one batched read'''
+        try:
+            task_doc = await self._get(self.db.collection('community_tasks').document(task_id))
+
+            if not task_doc.exists:
+                raise Exception('Community task not found')
+
+            task_data = records.TASK.from_snapshot(task_doc)
+
+            participant_ids = task_data.get('participants') or []
+            completed_ids = task_data.get('completed_by') or []
+
+            # completed_by is usually a subset of participants, read every user only once
+            unique_ids = list(dict.fromkeys(participant_ids + completed_ids))
+            users_ref = self.db.collection('users')
+            snapshots = await self._get_all([users_ref.document(user_id) for user_id in unique_ids])
+            users = {
+                snapshot.id: {
+                    'id': snapshot.id,
+                    'username': snapshot.to_dict().get('username', ''),
+                    'email': snapshot.to_dict().get('email', '')
+                }
+                for snapshot in snapshots if snapshot.exists
+            }
+
+            task_data['participants'] = [users[user_id] for user_id in participant_ids if user_id in users]
+            task_data['completed_by'] = [users[user_id] for user_id in completed_ids if user_id in users]
+
+            if versioned:
+                return task_data, task_doc.update_time
+            return task_data
+        except Exception as e:
+            logging_setup.log_failure(logger, 'async get_community_task', e)
+            raise e
+
+    # Analytics methods
+
+    async def get_analytics_summary(self, days=30):
+        '''Same summary as FirebaseService.get_analytics_summary with all queries in flight at once'''
+        try:
+            end_date = datetime.datetime.now()
+            start_date = end_date - datetime.timedelta(days=days)
+
+            users_ref = self.db.collection('users')
+            posts_ref = self.db.collection('posts')
+
+            users_count, new_users, new_posts, posts = await asyncio.gather(
+                self._count(users_ref),
+                self._count(users_ref.where('createdAt', '>=', start_date)),
+                self._count(posts_ref.where('createdAt', '>=', start_date)),
+                self._stream(posts_ref.select(['comments'])) # one pass over posts for post and comment totals
+            )
+
+            total_comments = 0
+            new_comments = 0
+            for post in posts:
+                comments = post.to_dict().get('comments', [])
+                total_comments += len(comments)
+                for comment in comments:
+                    comment_date = comment.get('createdAt', None)
+                    if comment_date:
+                        try:
+                            comment_datetime = datetime.datetime.fromisoformat(comment_date.replace('Z', '+00:00'))
+                            if comment_datetime >= start_date:
+                                new_comments += 1
+                        except (ValueError, TypeError):
+                            pass # skip comments with invalid dates
+
+            return {
+                'total_users': users_count,
+                'new_users': new_users,
+                'total_posts': len(posts),
+                'new_posts': new_posts,
+                'total_comments': total_comments,
+                'new_comments': new_comments,
+                'period_days': days
+            }
+        except Exception as e:
+            logging_setup.log_failure(logger, 'async get_analytics_summary', e)
+            raise e
@@ -0,0 +1,21 @@
+# benchmarks/bench_wsgi.py
+'''
+WSGI app for load tests: admin_api backed by a seeded local dataset instead of Firestore.
+
+BENCH_SCALE sets the number of seeded documents, BENCH_BACKEND_LATENCY_MS the simulated
+Firestore round trip time. Each server worker seeds its own copy.
+'''
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import seed # noqa: E402
+from local_firestore import LocalFirestore # noqa: E402
+from run_benchmarks import load_app # noqa: E402
+
+db = LocalFirestore(latency=float(os.environ.get('BENCH_BACKEND_LATENCY_MS', 0)) / 1000)
+seed.seed(db, int(os.environ.get('BENCH_SCALE', 2000)))
+app = load_app(db).app
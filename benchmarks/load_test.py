@@ -0,0 +1,175 @@
+# benchmarks/load_test.py
+'''
+Throughput of the production server (python -m serve) by worker count.
+
+    python benchmarks/load_test.py --workers 1,2,4,8 --threads 8 --concurrency 64 --duration 15
+
+For each worker count a server is started on the local benchmark dataset (see bench_wsgi.py),
+hammered by --concurrency keep-alive clients for --duration seconds, then stopped with SIGTERM
+(exercising the graceful drain). Prints requests/second and latency percentiles per worker count
+and writes them as JSON.
+'''
+import argparse
+import datetime
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import seed # noqa: E402
+import tokens # noqa: E402
+from run_benchmarks import _percentile # noqa: E402
+
+SECRET_KEY = 'load-test-secret'
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not come up')
+
+
+def start_server(port, workers, args):
+    env = dict(os.environ)
+    env.update({
+        'ADMIN_SECRET_KEY': SECRET_KEY,
+        'BENCH_SCALE': str(args.scale),
+        'BENCH_BACKEND_LATENCY_MS': str(args.backend_latency_ms),
+        'PYTHONPATH': os.pathsep.join([REPO_ROOT, BENCH_DIR, env.get('PYTHONPATH', '')]),
+        'LOG_LEVEL': 'WARNING',
+    })
+    command = [
+        sys.executable, '-m', 'serve',
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers),
+        '--worker-class', args.worker_class,
+        '--threads', str(args.threads),
+        '--app', 'bench_wsgi:app',
+    ]
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL)
+
+
+def run_load(port, path, token, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        failed = 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            local.append((time.perf_counter() - started) * 1000)
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / elapsed,
+        'latency_ms': {
+            'p50': _percentile(latencies, 50),
+            'p90': _percentile(latencies, 90),
+            'p99': _percentile(latencies, 99),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4', help='comma separated worker counts')
+    parser.add_argument('--worker-class', default='gthread', choices=['gthread', 'gevent', 'sync'])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=32, help='concurrent keep-alive clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load per worker count')
+    parser.add_argument('--path', default='/api/admin/posts?limit=20')
+    parser.add_argument('--scale', type=int, default=2000, help='documents seeded per worker')
+    parser.add_argument('--backend-latency-ms', type=float, default=5.0, help='simulated Firestore round trip')
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results', 'load_test.json'))
+    args = parser.parse_args()
+
+    token_service = tokens.TokenService({'default': SECRET_KEY}, 'default', access_ttl=3600)
+    token = token_service.issue({'id': seed.BENCH_ADMIN_ID, 'email': seed.BENCH_ADMIN_EMAIL})['token']
+
+    results = []
+    for workers in [int(w) for w in args.workers.split(',') if w]:
+        port = _free_port()
+        server = start_server(port, workers, args)
+        try:
+            _wait_until_up(port)
+            run_load(port, args.path, token, min(args.concurrency, 4), 2) # warm every worker up
+            result = run_load(port, args.path, token, args.concurrency, args.duration)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+        result['workers'] = workers
+        results.append(result)
+        print(f'workers={workers:<3} rps={result["rps"]:8.1f} p50={result["latency_ms"]["p50"]:.1f}ms '
+              f'p99={result["latency_ms"]["p99"]:.1f}ms errors={result["errors"]}')
+
+    if results and results[0]['rps']:
+        for result in results:
+            result['speedup'] = result['rps'] / results[0]['rps']
+
+    report = {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'worker_class': args.worker_class,
+        'threads': args.threads,
+        'concurrency': args.concurrency,
+        'path': args.path,
+        'backend_latency_ms': args.backend_latency_ms,
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,664 @@
+# benchmarks/local_firestore.py
+'''
+In-memory stand-in for the subset of the Firestore client API that FirebaseService uses.
+
+It lets the benchmarks drive admin_api.py end to end against a seeded dataset without
+credentials or network, and it counts document reads/writes the same way Firestore bills them
+(one read per document returned, one write per document touched).
+'''
+import copy
+import datetime
+import enum
+import heapq
+import threading
+import time
+import uuid
+
+from firebase_admin import firestore
+
+_UTC = datetime.timezone.utc
+
+
+def _normalize(value):
+    '''Firestore stores naive datetimes as UTC, do the same so comparisons work'''
+    if isinstance(value, datetime.datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=_UTC)
+    return value
+
+
+def _get_field(data, field_path):
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None, False
+        value = value[part]
+    return value, True
+
+
+def _matches(data, field, op, value):
+    current, present = _get_field(data, field)
+    if not present:
+        return False # documents missing the field never match a filter
+    current = _normalize(current)
+    value = _normalize(value)
+    try:
+        if op == '==':
+            return current == value
+        if op == '!=':
+            return current != value
+        if op == '<':
+            return current < value
+        if op == '<=':
+            return current <= value
+        if op == '>':
+            return current > value
+        if op == '>=':
+            return current >= value
+        if op == 'in':
+            return current in value
+        if op == 'not-in':
+            return current not in value
+        if op in ('array_contains', 'array-contains'):
+            return isinstance(current, list) and value in current
+        if op in ('array_contains_any', 'array-contains-any'):
+            return isinstance(current, list) and any(v in current for v in value)
+    except TypeError:
+        return False # mismatched types never match in Firestore
+    raise ValueError(f'Unsupported operator {op}')
+
+
+class Stats:
+    '''Read/write counters for the whole local database'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reads = 0
+        self.writes = 0
+        self.queries = 0
+
+    def add(self, reads=0, writes=0, queries=0):
+        with self.lock:
+            self.reads += reads
+            self.writes += writes
+            self.queries += queries
+
+    def snapshot(self):
+        with self.lock:
+            return {'reads': self.reads, 'writes': self.writes, 'queries': self.queries}
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path):
+        value, _ = _get_field(self._data or {}, field_path)
+        return value
+
+
+class DocumentReference:
+    def __init__(self, client, collection_name, doc_id):
+        self._client = client
+        self._collection = collection_name
+        self.id = doc_id
+        self.path = f'{collection_name}/{doc_id}'
+
+    def get(self, field_paths=None, transaction=None):
+        self._client._round_trip()
+        self._client.stats.add(reads=1, queries=1)
+        return self._client._snapshot(self._collection, self.id, field_paths)
+
+    def set(self, data, merge=False):
+        self._client._round_trip()
+        self._set(data, merge)
+
+    def update(self, data):
+        self._client._round_trip()
+        self._update(data)
+
+    def delete(self):
+        self._client._round_trip()
+        self._delete()
+
+    # write without the simulated round trip (batches pay it once on commit)
+
+    def _set(self, data, merge=False):
+        self._client._write(self._collection, self.id, data, merge=merge, merge_maps=merge)
+        self._client.stats.add(writes=1)
+
+    def _update(self, data):
+        if not self._client._exists(self._collection, self.id):
+            raise Exception(f'No document to update: {self.path}')
+        self._client._write(self._collection, self.id, data, merge=True)
+        self._client.stats.add(writes=1)
+
+    def _delete(self):
+        self._client._delete(self._collection, self.id)
+        self._client.stats.add(writes=1)
+
+    def collection(self, name):
+        return self._client.collection(f'{self.path}/{name}')
+
+
+class Query:
+    def __init__(self, client, collection_name, filters=(), orders=(), limit=None, cursor=None, fields=None):
+        self._client = client
+        self._collection = collection_name
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes):
+        params = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit': self._limit,
+            'cursor': self._cursor,
+            'fields': self._fields,
+        }
+        params.update(changes)
+        return Query(self._client, self._collection, **params)
+
+    def where(self, field_path, op_string, value):
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=('after', document_fields_or_snapshot))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy(cursor=('at', document_fields_or_snapshot))
+
+    def _sort_key(self, doc_id, data):
+        key = []
+        for field, direction in self._orders:
+            value, _ = _get_field(data, field)
+            value = _normalize(value)
+            key.append(_Reversed(value) if direction == firestore.Query.DESCENDING else _Ordered(value))
+        key.append(doc_id)
+        return key
+
+    def _candidates(self):
+        docs = self._client._collection_docs(self._collection)
+        ids = None
+        residual = []
+        for field, op, value in self._filters:
+            if op == '==' and _hashable(value):
+                matched = self._client._eq_lookup(self._collection, field, value)
+                ids = matched if ids is None else ids & matched
+            else:
+                residual.append((field, op, value))
+        source = ((doc_id, docs[doc_id]) for doc_id in ids) if ids is not None else docs.items()
+        for doc_id, data in source:
+            if all(_matches(data, f, o, v) for f, o, v in residual):
+                if all(_get_field(data, field)[1] for field, _ in self._orders):
+                    yield doc_id, data
+
+    def _cursor_key(self):
+        kind, position = self._cursor
+        if isinstance(position, DocumentSnapshot):
+            data = position._data or {}
+            return kind, self._sort_key(position.id, data)
+        # dict of field values, compare on the order_by fields only
+        key = []
+        for field, direction in self._orders:
+            value = _normalize(position.get(field))
+            key.append(_Reversed(value) if direction == firestore.Query.DESCENDING else _Ordered(value))
+        return kind, key
+
+    def _results(self, billed=True):
+        if billed:
+            self._client._round_trip()
+            self._client.stats.add(queries=1)
+        candidates = self._candidates()
+        keyed = ((self._sort_key(doc_id, data), doc_id) for doc_id, data in candidates)
+
+        if self._cursor is not None:
+            kind, cursor_key = self._cursor_key()
+            width = len(cursor_key)
+            if kind == 'after':
+                keyed = (item for item in keyed if item[0][:width] > cursor_key)
+            else:
+                keyed = (item for item in keyed if item[0][:width] >= cursor_key)
+
+        if self._limit is not None:
+            ordered = heapq.nsmallest(self._limit, keyed)
+        else:
+            ordered = sorted(keyed)
+        return [doc_id for _, doc_id in ordered]
+
+    def stream(self, transaction=None):
+        doc_ids = self._results()
+        for doc_id in doc_ids:
+            self._client.stats.add(reads=1)
+            yield self._client._snapshot(self._collection, doc_id, self._fields)
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        return self._client._listen(self, callback)
+
+
+class ChangeType(enum.Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class DocumentChange:
+    def __init__(self, type, document):
+        self.type = type
+        self.document = document
+
+
+class Watch:
+    '''
+    Snapshot listener on a query. Like Firestore's, callbacks run on a background thread: the
+    first with every matching document, then after writes to the collection with the changes.
+    '''
+
+    def __init__(self, client, query, callback):
+        self._client = client
+        self._query = query
+        self._callback = callback
+        self._versions = None # document id -> update time of the last snapshot sent
+        self._closed = False
+
+    @property
+    def is_active(self):
+        return not self._closed
+
+    def unsubscribe(self):
+        self._closed = True
+        self._client._unlisten(self)
+
+    def _push(self):
+        client = self._client
+        with client._lock:
+            doc_ids = self._query._results(billed=False)
+            snapshots = [client._snapshot(self._query._collection, doc_id) for doc_id in doc_ids]
+        versions = {snapshot.id: snapshot.update_time for snapshot in snapshots}
+        previous = self._versions
+        if previous is None:
+            changes = [DocumentChange(ChangeType.ADDED, snapshot) for snapshot in snapshots]
+        else:
+            changes = [
+                DocumentChange(ChangeType.ADDED if snapshot.id not in previous else ChangeType.MODIFIED, snapshot)
+                for snapshot in snapshots
+                if snapshot.id not in previous or previous[snapshot.id] != snapshot.update_time
+            ]
+            changes.extend(
+                DocumentChange(ChangeType.REMOVED, client._snapshot(self._query._collection, doc_id))
+                for doc_id in previous if doc_id not in versions
+            )
+            if not changes:
+                return
+        self._versions = versions
+        client.stats.add(reads=max(len(changes), 1)) # billed per document sent
+        if not self._closed:
+            self._callback(snapshots, changes, datetime.datetime.now(_UTC))
+
+
+class CollectionReference(Query):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, self._collection, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+    def list_documents(self):
+        return [self.document(doc_id) for doc_id in list(self._client._collection_docs(self._collection))]
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(('set', reference, data, merge))
+
+    def update(self, reference, data):
+        self._ops.append(('update', reference, data, True))
+
+    def delete(self, reference):
+        self._ops.append(('delete', reference, None, False))
+
+    def commit(self):
+        self._client._round_trip()
+        for op, reference, data, merge in self._ops:
+            reference = getattr(reference, '_wrapped', reference)
+            if op == 'delete':
+                reference._delete()
+            elif op == 'update':
+                reference._update(data)
+            else:
+                reference._set(data, merge=merge)
+        self._ops = []
+
+
+class Transaction(WriteBatch):
+    '''
+    Transaction driven by firestore.transactional. The database lock is held from begin to commit
+    or rollback, so transactions run one at a time and never need retrying.
+    '''
+
+    def __init__(self, client):
+        super().__init__(client)
+        self._id = None
+        self._max_attempts = 1
+        self._read_only = False
+
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    def _begin(self, retry_id=None):
+        self._client._lock.acquire()
+        self._id = uuid.uuid4().bytes
+
+    def _commit(self):
+        try:
+            self.commit()
+        finally:
+            self._clean_up()
+        return []
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _clean_up(self):
+        self._ops = []
+        if self._id is not None:
+            self._id = None
+            self._client._lock.release()
+
+
+class LocalFirestore:
+    '''
+    Thread-safe in-memory database exposing collection()/batch() like firestore.Client.
+    `latency` (seconds) is slept on every round trip to mimic network time to Firestore.
+    '''
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._lock = threading.RLock()
+        self._collections = {}
+        self._meta = {}
+        self._eq_indexes = {}
+        self.stats = Stats()
+        self._watches = []
+        self._dirty = [] # watches with writes not yet pushed
+        self._listening = threading.Condition()
+        self._dispatcher = None
+
+    # client API
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return Transaction(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for reference in references:
+            yield reference.get(field_paths=field_paths)
+
+    # listeners
+
+    def _listen(self, query, callback):
+        watch = Watch(self, query, callback)
+        with self._listening:
+            self._watches.append(watch)
+            self._dirty.append(watch)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='local-firestore-listeners', daemon=True)
+                self._dispatcher.start()
+            self._listening.notify()
+        return watch
+
+    def _unlisten(self, watch):
+        with self._listening:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _notify(self, collection):
+        if not self._watches:
+            return
+        with self._listening:
+            for watch in self._watches:
+                if watch._query._collection == collection and watch not in self._dirty:
+                    self._dirty.append(watch)
+            self._listening.notify()
+
+    def _dispatch(self):
+        while True:
+            with self._listening:
+                while not self._dirty:
+                    self._listening.wait()
+                watch = self._dirty.pop(0)
+            try:
+                watch._push()
+            except Exception: # a failing callback closes its listener, like Firestore's
+                watch._closed = True
+
+    def flush_listeners(self, timeout=5.0):
+        '''Wait until every write so far has reached the listeners (for tests and benchmarks)'''
+        deadline = time.time() + timeout
+        while self._dirty and time.time() < deadline:
+            time.sleep(0.001)
+
+    # internals
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _collection_docs(self, name):
+        return self._collections.setdefault(name, {})
+
+    def _exists(self, collection, doc_id):
+        return doc_id in self._collection_docs(collection)
+
+    def _snapshot(self, collection, doc_id, field_paths=None):
+        reference = DocumentReference(self, collection, doc_id)
+        data = self._collection_docs(collection).get(doc_id)
+        create_time, update_time = self._meta.get((collection, doc_id), (None, None))
+        if data is not None and field_paths is not None:
+            data = {f: data[f] for f in field_paths if f in data}
+        return DocumentSnapshot(reference, data, create_time, update_time)
+
+    def _eq_lookup(self, collection, field, value):
+        with self._lock:
+            index = self._eq_indexes.get((collection, field))
+            if index is None:
+                index = {}
+                for doc_id, data in self._collection_docs(collection).items():
+                    current, present = _get_field(data, field)
+                    if present and _hashable(current):
+                        index.setdefault(_normalize(current), set()).add(doc_id)
+                self._eq_indexes[(collection, field)] = index
+            return set(index.get(_normalize(value), ()))
+
+    def _reindex(self, collection, doc_id, old, new):
+        for (indexed_collection, field), index in self._eq_indexes.items():
+            if indexed_collection != collection:
+                continue
+            if old is not None:
+                value, present = _get_field(old, field)
+                if present and _hashable(value):
+                    index.get(_normalize(value), set()).discard(doc_id)
+            if new is not None:
+                value, present = _get_field(new, field)
+                if present and _hashable(value):
+                    index.setdefault(_normalize(value), set()).add(doc_id)
+
+    def _write(self, collection, doc_id, data, merge=False, merge_maps=False):
+        now = datetime.datetime.now(_UTC)
+        with self._lock:
+            docs = self._collection_docs(collection)
+            old = docs.get(doc_id)
+            new = copy.deepcopy(old) if (merge and old is not None) else {}
+            for key, value in data.items():
+                if merge_maps:
+                    _merge(new, key, value, now)
+                else:
+                    _apply(new, key, value, now)
+            docs[doc_id] = new
+            create_time = self._meta.get((collection, doc_id), (now, now))[0]
+            self._meta[(collection, doc_id)] = (create_time, now)
+            self._reindex(collection, doc_id, old, new)
+        self._notify(collection)
+
+    def _delete(self, collection, doc_id):
+        with self._lock:
+            old = self._collection_docs(collection).pop(doc_id, None)
+            self._meta.pop((collection, doc_id), None)
+            if old is not None:
+                self._reindex(collection, doc_id, old, None)
+        self._notify(collection)
+
+    def load(self, collection, doc_id, data):
+        '''Bulk-load a document without counting it as a write (used for seeding)'''
+        now = datetime.datetime.now(_UTC)
+        docs = self._collection_docs(collection)
+        docs[doc_id] = {key: _normalize(value) for key, value in data.items()}
+        self._meta[(collection, doc_id)] = (now, now)
+
+    def count(self, collection):
+        return len(self._collection_docs(collection))
+
+
+def _apply(target, key, value, now):
+    parts = key.split('.')
+    for part in parts[:-1]:
+        target = target.setdefault(part, {})
+    field = parts[-1]
+    if value is firestore.SERVER_TIMESTAMP:
+        target[field] = now
+    elif value is firestore.DELETE_FIELD:
+        target.pop(field, None)
+    elif isinstance(value, firestore.ArrayUnion):
+        current = list(target.get(field) or [])
+        current.extend(v for v in value.values if v not in current)
+        target[field] = current
+    elif isinstance(value, firestore.ArrayRemove):
+        target[field] = [v for v in (target.get(field) or []) if v not in value.values]
+    elif isinstance(value, firestore.Increment):
+        target[field] = (target.get(field) or 0) + value.value
+    else:
+        target[field] = _normalize(copy.deepcopy(value))
+
+
+def _merge(target, key, value, now):
+    # set(merge=True) merges nested maps field by field, update() replaces them
+    if isinstance(value, dict):
+        current = target.get(key)
+        if not isinstance(current, dict):
+            current = target[key] = {}
+        for nested_key, nested_value in value.items():
+            _merge(current, nested_key, nested_value, now)
+    else:
+        _apply(target, key, value, now)
+
+
+def _hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+class _Ordered:
+    '''Sort wrapper following Firestore's cross-type ordering closely enough for benchmarks'''
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def _rank(self):
+        value = self.value
+        if value is None:
+            return 0
+        if isinstance(value, bool):
+            return 1
+        if isinstance(value, (int, float)):
+            return 2
+        if isinstance(value, datetime.datetime):
+            return 3
+        if isinstance(value, str):
+            return 4
+        return 5
+
+    def _cmp_key(self):
+        rank = self._rank()
+        return (rank, self.value if rank in (1, 2, 3, 4) else repr(self.value))
+
+    def __lt__(self, other):
+        return self._cmp_key() < other._cmp_key()
+
+    def __gt__(self, other):
+        return self._cmp_key() > other._cmp_key()
+
+    def __le__(self, other):
+        return self._cmp_key() <= other._cmp_key()
+
+    def __ge__(self, other):
+        return self._cmp_key() >= other._cmp_key()
+
+    def __eq__(self, other):
+        return self._cmp_key() == other._cmp_key()
+
+
+class _Reversed(_Ordered):
+    __slots__ = ()
+
+    def __lt__(self, other):
+        return self._cmp_key() > other._cmp_key()
+
+    def __gt__(self, other):
+        return self._cmp_key() < other._cmp_key()
+
+    def __le__(self, other):
+        return self._cmp_key() >= other._cmp_key()
+
+    def __ge__(self, other):
+        return self._cmp_key() <= other._cmp_key()
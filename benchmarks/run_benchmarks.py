@@ -0,0 +1,371 @@
+# benchmarks/run_benchmarks.py
+'''
+Benchmark every admin_api.py route through the Flask test client against a seeded local dataset.
+
+    python benchmarks/run_benchmarks.py --scales 1000,100000 --output benchmarks/results/current.json
+    python benchmarks/run_benchmarks.py --scales 1000 --baseline benchmarks/results/baseline.json
+
+Each scale runs in its own subprocess so peak RSS is measured per dataset size. Results are
+written as JSON; with --baseline the run is compared route by route and exits non-zero when a
+route regresses past the tolerance.
+'''
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import seed # noqa: E402 (needs BENCH_DIR on sys.path)
+
+DEFAULT_SCALES = '1000,100000,1000000'
+
+
+def load_app(db):
+    '''Import admin_api with its FirebaseService bound to the local database'''
+    import firebase_service
+
+    class LocalFirebaseService(firebase_service.FirebaseService):
+        def __init__(self):
+            super().__init__(db=db)
+
+    firebase_service.FirebaseService = LocalFirebaseService
+    # scenarios hit every route from one admin and one address over and over
+    for limit in ('LOGIN_IP_PER_MINUTE', 'LOGIN_EMAIL_PER_MINUTE', 'RATE_LIMIT_PER_MINUTE', 'RATE_LIMIT_GLOBAL_PER_MINUTE'):
+        os.environ.setdefault(limit, '0')
+    # measure the cost of every call, not a result reused from the previous iteration
+    os.environ.setdefault('SINGLEFLIGHT_REUSE_SECONDS', '0')
+    os.environ.setdefault('ANALYTICS_CACHE_TTL', '0')
+    os.environ.setdefault('ANALYTICS_CACHE_STALE_TTL', '0')
+    import admin_api
+    return admin_api
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Targets:
+    '''Hands out fresh document ids so mutating routes never hit the same document twice'''
+
+    def __init__(self, db, counts):
+        self.db = db
+        self.counts = counts
+        self.serial = 0
+
+    def next_serial(self):
+        self.serial += 1
+        return self.serial
+
+    def post_id(self, i):
+        return f'post-{i % self.counts["posts"]:08d}'
+
+    def user_id(self, i):
+        return f'user-{i % self.counts["users"]:07d}'
+
+    def task_id(self, i):
+        return f'task-{i % self.counts["community_tasks"]:06d}'
+
+    def category_id(self, i):
+        return f'category-{i % self.counts["categories"]:03d}'
+
+    def disposable(self, collection, data):
+        doc_id = f'bench-{collection}-{self.next_serial()}'
+        self.db.load(collection, doc_id, dict(data))
+        return doc_id
+
+    def post_with_comment(self):
+        serial = self.next_serial()
+        post_id = self.disposable('posts', {
+            'userId': self.user_id(serial),
+            'username': 'bench',
+            'content': 'bench post',
+            'likes': [],
+            'comments': [{'id': f'bench-comment-{serial}', 'userId': self.user_id(serial), 'content': 'x'}],
+            'createdAt': datetime.datetime.now(datetime.timezone.utc),
+        })
+        return post_id, f'bench-comment-{serial}'
+
+
+def build_scenarios(admin_api, targets):
+    '''(name, method, path, json_body) factories keyed by the admin_api view they exercise'''
+    future = (datetime.datetime.now() + datetime.timedelta(days=30)).strftime('%d/%m/%Y %H:%M')
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    def post_with_comment(i):
+        post_id, comment_id = targets.post_with_comment()
+        return 'DELETE', f'/api/admin/posts/{post_id}/comments/{comment_id}', None
+
+    def disposable_post(i):
+        post_id = targets.disposable('posts', {'userId': targets.user_id(i), 'content': 'x', 'likes': [], 'comments': [], 'createdAt': now})
+        return 'DELETE', f'/api/admin/posts/{post_id}', None
+
+    def disposable_posts(i):
+        post_ids = [
+            targets.disposable('posts', {'userId': targets.user_id(i), 'content': 'x', 'likes': [], 'comments': [], 'createdAt': now})
+            for _ in range(20)
+        ]
+        return 'POST', '/api/admin/posts/bulk-delete', {'postIds': post_ids}
+
+    def disposable_user(i):
+        user_id = targets.disposable('users', {'username': f'bench{i}', 'email': f'bench{i}@example.com', 'friends': [], 'createdAt': now})
+        return 'DELETE', f'/api/admin/users/{user_id}', None
+
+    def disposable_task(i):
+        task_id = targets.disposable('community_tasks', {'title': f'bench task {i}', 'participants': [], 'completed_by': [], 'created_at': now})
+        return 'DELETE', f'/api/admin/community-tasks/{task_id}', None
+
+    def disposable_category(i):
+        category_id = targets.disposable('categories', {'category_name': f'bench category {i}', 'created_at': now})
+        return 'DELETE', f'/api/admin/community-tasks/categories/{category_id}', None
+
+    return {
+        'token_required': lambda i: ('GET', '/__bench/auth', None),
+        'admin_login': lambda i: ('POST', '/api/admin/login', {'email': seed.BENCH_ADMIN_EMAIL, 'password': seed.BENCH_ADMIN_PASSWORD}),
+        'admin_register': lambda i: ('POST', '/api/admin/register', {
+            'email': f'bench-register-{targets.next_serial()}@example.com',
+            'password': 'bench-password',
+            'name': 'Bench',
+            'registrationKey': admin_api.ADMIN_REGISTRATION_KEY,
+        }),
+        'admin_profile': lambda i: ('GET', '/api/admin/profile', None),
+        'get_posts': lambda i: ('GET', '/api/admin/posts?limit=50', None),
+        'get_posts_filtered': lambda i: ('GET', f'/api/admin/posts?limit=50&userId={targets.user_id(i)}&minLikes=5', None),
+        'get_post_details': lambda i: ('GET', f'/api/admin/posts/{targets.post_id(i)}', None),
+        'update_post_content': lambda i: ('PUT', f'/api/admin/posts/{targets.post_id(i)}/content', {'content': f'edited {i}'}),
+        'delete_comment': post_with_comment,
+        'delete_posts': disposable_post,
+        'bulk_delete_posts': disposable_posts,
+        'get_post_clusters': lambda i: ('GET', '/api/admin/posts/clusters?minSize=2', None),
+        'get_moderation_queue': lambda i: ('GET', '/api/admin/moderation/queue?limit=20', None),
+        'claim_moderation_items': lambda i: ('POST', '/api/admin/moderation/claim', {'count': 1, 'leaseSeconds': 30}),
+        'rescore_moderation_queue': lambda i: ('POST', '/api/admin/moderation/rescore', None),
+        'get_users': lambda i: ('GET', '/api/admin/users?limit=50', None),
+        'get_users_filtered': lambda i: ('GET', '/api/admin/users?limit=50&suspended=true', None),
+        'get_user_details': lambda i: ('GET', f'/api/admin/users/{targets.user_id(i)}', None),
+        'get_user_feed': lambda i: ('GET', f'/api/admin/users/{targets.user_id(i)}/feed?limit=20', None),
+        'search_documents': lambda i: ('GET', f'/api/admin/search?q={seed.WORDS[i % len(seed.WORDS)]}+{seed.WORDS[(i * 7) % len(seed.WORDS)][:3]}', None),
+        'rebuild_user_timeline': lambda i: ('POST', f'/api/admin/users/{targets.user_id(i)}/timeline/rebuild', None),
+        'suspend_user': lambda i: ('POST', f'/api/admin/users/{targets.user_id(i)}/suspend', {'suspended': i % 2 == 0}),
+        'delete_user': disposable_user,
+        'get_analytics_summary': lambda i: ('GET', '/api/admin/analytics/summary?days=30', None),
+        'get_admin_logs': lambda i: ('GET', '/api/admin/logs?limit=100', None),
+        'get_community_tasks': lambda i: ('GET', '/api/admin/community-tasks?limit=50', None),
+        'get_community_task': lambda i: ('GET', f'/api/admin/community-tasks/{targets.task_id(i)}', None),
+        'create_community_task': lambda i: ('POST', '/api/admin/community-tasks', {
+            'title': f'bench task {targets.next_serial()}',
+            'category': 'category-0',
+            'reward_minutes': 30,
+            'deadline': future,
+        }),
+        'update_community_task': lambda i: ('PUT', f'/api/admin/community-tasks/{targets.task_id(i)}', {'reward_minutes': 10 + i % 50}),
+        'delete_community_task_route': disposable_task,
+        'get_community_task_stats': lambda i: ('GET', '/api/admin/community-tasks/stats', None),
+        'get_community_task_categories': lambda i: ('GET', '/api/admin/community-tasks/categories', None),
+        'get_task_category': lambda i: ('GET', f'/api/admin/community-tasks/categories/{targets.category_id(i)}', None),
+        'create_task_category': lambda i: ('POST', '/api/admin/community-tasks/categories', {
+            'category_name': f'bench category {targets.next_serial()}',
+            'category_type': 'social',
+            'description': 'bench',
+        }),
+        'update_task_category': lambda i: ('PUT', f'/api/admin/community-tasks/categories/{targets.category_id(i)}', {'description': f'bench {i}'}),
+        'delete_task_category': disposable_category,
+    }
+
+
+def run_scale(scale, iterations, warmup, max_seconds, routes):
+    '''Seed a fresh database with `scale` documents and benchmark each route against it'''
+    from local_firestore import LocalFirestore
+
+    db = LocalFirestore()
+    seed_started = time.perf_counter()
+    counts = seed.seed(db, scale)
+    seed_seconds = time.perf_counter() - seed_started
+
+    admin_api = load_app(db)
+    app = admin_api.app
+
+    @app.route('/__bench/auth', methods=['GET'])
+    @admin_api.token_required
+    def bench_auth(current_admin):
+        return 'ok'
+
+    token = admin_api.token_service.issue({
+        'id': seed.BENCH_ADMIN_ID,
+        'email': seed.BENCH_ADMIN_EMAIL,
+        'name': 'Benchmark Admin'
+    })['token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    # searches and clusters are timed against built indexes, not the one-off background builds
+    admin_api.search_index.build(admin_api.firebase_service.db)
+    admin_api.duplicate_index.build(admin_api.firebase_service.db)
+    admin_api.firebase_service.rescore_moderation_queue()
+    admin_api.replicas.start(admin_api.firebase_service.db)
+    db.flush_listeners() # replicas serve reads from their first snapshot on
+
+    targets = Targets(db, counts)
+    scenarios = build_scenarios(admin_api, targets)
+    if routes:
+        scenarios = {name: scenarios[name] for name in routes}
+
+    client = app.test_client()
+    results = {}
+    for name, scenario in scenarios.items():
+        latencies = []
+        reads = []
+        writes = []
+        errors = 0
+        started = time.perf_counter()
+        for i in range(warmup + iterations):
+            method, path, body = scenario(i)
+            before = db.stats.snapshot()
+            call_started = time.perf_counter()
+            response = client.open(path, method=method, json=body, headers=headers)
+            elapsed = time.perf_counter() - call_started
+            after = db.stats.snapshot()
+            if i < warmup:
+                continue
+            latencies.append(elapsed * 1000)
+            reads.append(after['reads'] - before['reads'])
+            writes.append(after['writes'] - before['writes'])
+            if response.status_code >= 400:
+                errors += 1
+            if time.perf_counter() - started > max_seconds:
+                break
+
+        results[name] = {
+            'iterations': len(latencies),
+            'errors': errors,
+            'latency_ms': {
+                'p50': _percentile(latencies, 50),
+                'p90': _percentile(latencies, 90),
+                'p99': _percentile(latencies, 99),
+                'mean': statistics.fmean(latencies) if latencies else None,
+                'max': max(latencies) if latencies else None,
+            },
+            'reads_per_call': statistics.fmean(reads) if reads else None,
+            'writes_per_call': statistics.fmean(writes) if writes else None,
+        }
+        if latencies:
+            print(f'[{scale}] {name}: p50={results[name]["latency_ms"]["p50"]:.2f}ms reads/call={results[name]["reads_per_call"]:.1f}', file=sys.stderr)
+
+    return {
+        'scale': scale,
+        'documents': counts,
+        'seed_seconds': seed_seconds,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'routes': results,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, tolerance):
+    '''Return human readable regressions of current against baseline'''
+    regressions = []
+    baseline_scales = {str(run['scale']): run for run in baseline.get('runs', [])}
+    for run in current['runs']:
+        base_run = baseline_scales.get(str(run['scale']))
+        if not base_run:
+            continue
+        for name, result in run['routes'].items():
+            base = base_run['routes'].get(name)
+            if not base:
+                continue
+            for pct in ('p50', 'p99'):
+                now_ms, base_ms = result['latency_ms'][pct], base['latency_ms'][pct]
+                if now_ms and base_ms and now_ms > base_ms * (1 + tolerance):
+                    regressions.append(f'[{run["scale"]}] {name} {pct}: {base_ms:.2f}ms -> {now_ms:.2f}ms')
+            for counter in ('reads_per_call', 'writes_per_call'):
+                now_count, base_count = result[counter], base[counter]
+                if now_count is not None and base_count is not None and now_count > base_count:
+                    regressions.append(f'[{run["scale"]}] {name} {counter}: {base_count:.1f} -> {now_count:.1f}')
+        if base_run.get('peak_rss_kb') and run['peak_rss_kb'] > base_run['peak_rss_kb'] * (1 + tolerance):
+            regressions.append(f'[{run["scale"]}] peak_rss_kb: {base_run["peak_rss_kb"]} -> {run["peak_rss_kb"]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default=DEFAULT_SCALES, help='comma separated total document counts')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=30.0, help='time budget per route')
+    parser.add_argument('--routes', default='', help='comma separated subset of routes to run')
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results', 'latest.json'))
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown before flagging')
+    parser.add_argument('--single-scale', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    routes = [r for r in args.routes.split(',') if r]
+
+    if args.single_scale:
+        # child process: one scale, result as json on stdout
+        result = run_scale(args.single_scale, args.iterations, args.warmup, args.max_seconds, routes)
+        json.dump(result, sys.stdout)
+        return 0
+
+    runs = []
+    for scale in [int(s) for s in args.scales.split(',') if s]:
+        with tempfile.TemporaryFile(mode='w+') as out:
+            command = [
+                sys.executable, os.path.abspath(__file__),
+                '--single-scale', str(scale),
+                '--iterations', str(args.iterations),
+                '--warmup', str(args.warmup),
+                '--max-seconds', str(args.max_seconds),
+                '--routes', args.routes,
+            ]
+            subprocess.run(command, stdout=out, check=True)
+            out.seek(0)
+            runs.append(json.load(out))
+
+    report = {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'git_revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'iterations': args.iterations,
+        'runs': runs,
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print('Regressions against baseline:')
+            for line in regressions:
+                print(f'  {line}')
+            return 1
+        print('No regressions against baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
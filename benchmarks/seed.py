@@ -0,0 +1,117 @@
+# benchmarks/seed.py
+'''Deterministic dataset generator for the local benchmark database'''
+import datetime
+import hashlib
+import random
+
+# share of the total document count that goes to each collection
+MIX = {
+    'users': 0.10,
+    'posts': 0.80,
+    'admin_logs': 0.08,
+    'community_tasks': 0.02,
+}
+CATEGORY_COUNT = 20
+
+BENCH_ADMIN_ID = 'bench-admin'
+BENCH_ADMIN_EMAIL = 'bench-admin@example.com'
+BENCH_ADMIN_PASSWORD = 'bench-password'
+
+WORDS = (
+    'focus study run gym read code walk sleep meal water call family friend team goal streak '
+    'screen time reward phone offline park coffee class exam project music draw cook clean'
+).split()
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed(db, total_docs, random_seed=2025):
+    '''Fill db with roughly total_docs documents spread across the admin collections'''
+    rng = random.Random(random_seed)
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    counts = {name: max(1, int(total_docs * share)) for name, share in MIX.items()}
+
+    db.load('admins', BENCH_ADMIN_ID, {
+        'id': BENCH_ADMIN_ID,
+        'email': BENCH_ADMIN_EMAIL,
+        'password': hashlib.sha256(BENCH_ADMIN_PASSWORD.encode()).hexdigest(),
+        'name': 'Benchmark Admin',
+        'created_at': now,
+    })
+
+    user_ids = [f'user-{i:07d}' for i in range(counts['users'])]
+    for i, user_id in enumerate(user_ids):
+        db.load('users', user_id, {
+            'email': f'{user_id}@example.com',
+            'username': f'user{i}',
+            'friends': rng.sample(user_ids, min(len(user_ids), rng.randint(0, 15))),
+            'suspended': rng.random() < 0.02,
+            'createdAt': now - datetime.timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+        })
+
+    for i in range(counts['posts']):
+        author = rng.randrange(len(user_ids))
+        created = now - datetime.timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+        comments = []
+        for c in range(rng.randint(0, 5)):
+            commenter = rng.randrange(len(user_ids))
+            comments.append({
+                'id': f'comment-{i}-{c}',
+                'userId': user_ids[commenter],
+                'username': f'user{commenter}',
+                'content': _text(rng, rng.randint(3, 20)),
+                'createdAt': (created + datetime.timedelta(minutes=rng.randint(1, 600))).isoformat(),
+            })
+        content = _text(rng, rng.randint(5, 60))
+        likes = rng.sample(user_ids, min(len(user_ids), rng.randint(0, 20)))
+        db.load('posts', f'post-{i:08d}', {
+            'userId': user_ids[author],
+            'username': f'user{author}',
+            'content': content,
+            'likes': likes,
+            'comments': comments,
+            'likeCount': len(likes),
+            'commentCount': len(comments),
+            'editedByAdmin': False,
+            'createdAt': created,
+        })
+
+    category_names = [f'category-{i}' for i in range(CATEGORY_COUNT)]
+    for i, name in enumerate(category_names):
+        db.load('categories', f'category-{i:03d}', {
+            'id': f'category-{i:03d}',
+            'category_name': name,
+            'category_type': rng.choice(['social', 'sports', 'academic']),
+            'description': _text(rng, 10),
+            'created_at': now,
+        })
+
+    for i in range(counts['community_tasks']):
+        participants = rng.sample(user_ids, min(len(user_ids), rng.randint(0, 50)))
+        db.load('community_tasks', f'task-{i:06d}', {
+            'id': f'task-{i:06d}',
+            'title': f'Community task {i}',
+            'category': rng.choice(category_names),
+            'reward_minutes': rng.randint(5, 120),
+            'deadline': now + datetime.timedelta(days=rng.randint(-30, 30)),
+            'created_at': now - datetime.timedelta(days=rng.randint(0, 60)),
+            'participants': participants,
+            'completed_by': participants[:len(participants) // 2],
+            'created_by': BENCH_ADMIN_ID,
+        })
+
+    for i in range(counts['admin_logs']):
+        db.load('admin_logs', f'log-{i:08d}', {
+            'admin_id': BENCH_ADMIN_ID,
+            'action_type': rng.choice(['POST_DELETED', 'POST_EDITED', 'USER_SUSPENDED', 'COMMENT_DELETED']),
+            'details': {'post_id': f'post-{rng.randrange(counts["posts"]):08d}'},
+            'timestamp': now - datetime.timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+            'ip_address': None,
+        })
+
+    counts['categories'] = CATEGORY_COUNT
+    counts['admins'] = 1
+    return counts
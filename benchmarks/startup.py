@@ -0,0 +1,139 @@
+# benchmarks/startup.py
+'''
+Cold start of the admin API: import time, first request and warm requests, each run in a fresh
+interpreter.
+
+    python benchmarks/startup.py --runs 5
+    python benchmarks/startup.py --runs 5 --warm-up           # admin_api.warm_up() before the first request
+    python benchmarks/startup.py --backend firestore          # real project, FIREBASE_CREDENTIALS
+
+import_ms is `import admin_api` (the local dataset is seeded before, and not counted),
+warm_up_ms the explicit warm-up if requested, first_request_ms the first authenticated
+GET --path and warm_* the --requests after it. The median of every number over --runs
+processes is reported and written as JSON, with the heavy modules the process had loaded by
+then (google.cloud.storage should only be there after an upload).
+'''
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+HEAVY_MODULES = ('google.cloud.firestore', 'google.cloud.storage', 'grpc', 'orjson', 'brotli')
+
+
+def run_once(backend, scale, latency, path, requests, warm_up):
+    '''One cold start in this process, timings in milliseconds'''
+    if backend == 'local':
+        import seed
+        from local_firestore import LocalFirestore
+        from run_benchmarks import load_app
+
+        db = LocalFirestore(latency=latency)
+        seed.seed(db, scale)
+        started = time.perf_counter()
+        admin_api = load_app(db)
+        admin_id = seed.BENCH_ADMIN_ID
+    else:
+        started = time.perf_counter()
+        import admin_api
+        admin_id = 'startup-benchmark'
+    result = {'import_ms': (time.perf_counter() - started) * 1000}
+
+    token = admin_api.token_service.issue({'id': admin_id, 'email': '', 'name': 'Startup Benchmark'})['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    client = admin_api.app.test_client()
+
+    if warm_up:
+        started = time.perf_counter()
+        admin_api.warm_up()
+        result['warm_up_ms'] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    response = client.get(path, headers=headers)
+    result['first_request_ms'] = (time.perf_counter() - started) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f'GET {path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}')
+
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get(path, headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+    result['warm_median_ms'] = statistics.median(latencies)
+    result['warm_max_ms'] = max(latencies)
+    result['modules'] = [name for name in HEAVY_MODULES if name in sys.modules]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['local', 'firestore'], default='local')
+    parser.add_argument('--scale', type=int, default=1000, help='documents seeded for the local backend')
+    parser.add_argument('--latency-ms', type=float, default=0, help='simulated round trip of the local backend')
+    parser.add_argument('--path', default='/api/admin/posts?limit=20')
+    parser.add_argument('--requests', type=int, default=20, help='warm requests after the first')
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes to take the median over')
+    parser.add_argument('--warm-up', action='store_true', help='call admin_api.warm_up() before the first request')
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results', 'startup.json'))
+    parser.add_argument('--single-run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single_run:
+        # child process: one cold start, result as json on stdout
+        result = run_once(args.backend, args.scale, args.latency_ms / 1000, args.path, args.requests, args.warm_up)
+        json.dump(result, sys.stdout)
+        return 0
+
+    runs = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryFile(mode='w+') as out:
+            command = [
+                sys.executable, os.path.abspath(__file__), '--single-run',
+                '--backend', args.backend,
+                '--scale', str(args.scale),
+                '--latency-ms', str(args.latency_ms),
+                '--path', args.path,
+                '--requests', str(args.requests),
+            ] + (['--warm-up'] if args.warm_up else [])
+            subprocess.run(command, stdout=out, check=True)
+            out.seek(0)
+            runs.append(json.load(out))
+
+    summary = {
+        name: round(statistics.median(run[name] for run in runs), 2)
+        for name in runs[0] if name.endswith('_ms')
+    }
+    report = {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': args.backend,
+        'path': args.path,
+        'warm_up': args.warm_up,
+        'median': summary,
+        'modules': runs[0]['modules'],
+        'runs': runs,
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, value in summary.items():
+        print(f'{name:>18} {value:10.2f}')
+    print(f'Results written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
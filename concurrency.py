@@ -0,0 +1,59 @@
+# concurrency.py
+'''
+Bounded thread pool for running independent service calls of one request concurrently.
+
+    user, posts = fan_out(
+        lambda: firebase_service.get_user_profile(user_id),
+        lambda: firebase_service.get_user_posts(user_id, limit=20),
+    )
+
+Calls run with a copy of the caller's context, so Firestore accounting and the request id
+follow them into the pool. The first call runs on the calling thread, and calls made from
+inside a pool thread run inline, so nested fan-outs can never deadlock the pool.
+'''
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+FAN_OUT_WORKERS = int(os.environ.get('FAN_OUT_WORKERS', 16))
+FAN_OUT_TIMEOUT = float(os.environ.get('FAN_OUT_TIMEOUT', 30))
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_in_pool = threading.local()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _lock:
+        # pool threads don't survive fork, workers build their own
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix='fan-out')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _run_in_pool(context, call):
+    _in_pool.active = True
+    try:
+        return context.run(call)
+    finally:
+        _in_pool.active = False
+
+
+def fan_out(*calls, timeout=FAN_OUT_TIMEOUT):
+    '''Run zero-argument callables concurrently and return their results in order (re-raises the first error)'''
+    if len(calls) <= 1 or getattr(_in_pool, 'active', False):
+        return [call() for call in calls]
+
+    executor = _get_executor()
+    futures = [executor.submit(_run_in_pool, contextvars.copy_context(), call) for call in calls[1:]]
+    try:
+        first = calls[0]()
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+    return [first] + [future.result(timeout=timeout) for future in futures]
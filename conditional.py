@@ -0,0 +1,55 @@
+# conditional.py
+'''
+HTTP conditional requests (ETag / Last-Modified) for single-document endpoints.
+
+Validators come from the Firestore document's update_time, which changes on every write. When a
+request carries If-None-Match or If-Modified-Since, the route first reads only the document's
+metadata (no fields, no related documents) and answers 304 if nothing changed, so polling an
+unchanged record never rebuilds or serializes its body.
+'''
+import hashlib
+
+from flask import Response, request
+
+
+def validators(collection, doc_id, update_time):
+    '''(etag, last modified) of a document version'''
+    digest = hashlib.sha1(f'{collection}/{doc_id}@{update_time.isoformat() if update_time else ""}'.encode()).hexdigest()
+    return digest[:20], update_time
+
+
+def is_conditional():
+    return bool(request.if_none_match) or request.if_modified_since is not None
+
+
+def is_fresh(etag, last_modified):
+    '''Whether the client's cached copy is still current'''
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since is not None and last_modified is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def add_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache' # clients must revalidate, but may keep a copy
+    return response
+
+
+def not_modified(etag, last_modified):
+    return add_validators(Response(status=304), etag, last_modified)
+
+
+def check(get_update_time, collection, doc_id):
+    '''304 response if the request's validators match the document's current version, else None'''
+    if not is_conditional():
+        return None
+    update_time = get_update_time(collection, doc_id)
+    if update_time is None:
+        return None # missing document, let the route answer
+    current = validators(collection, doc_id, update_time)
+    return not_modified(*current) if is_fresh(*current) else None
@@ -0,0 +1,445 @@
+# duplicates.py
+'''
+In-process near-duplicate detection over post content, for /api/admin/posts/clusters.
+
+A post's content is normalized (case-folded, links reduced to their host, numbers to 0,
+punctuation and spacing collapsed) and cut into overlapping SHINGLE-byte shingles. Its MinHash
+signature is computed by one-permutation hashing: every shingle is hashed once into one of
+BANDS x ROWS bins, each bin keeps its smallest hash, and empty bins borrow from the next filled
+one. Two signatures agree in a bin with probability equal to the Jaccard similarity of the
+shingle sets, so spam variants that change a few words, numbers or tracking links stay close.
+
+Signatures are split into BANDS bands of ROWS bins; posts sharing any band land in the same
+bucket of a per-band hash table (LSH). Checking a post therefore takes BANDS dictionary
+lookups whatever the number of posts, and only posts sharing a bucket are compared. With the
+defaults (10 bands of 6 rows) a pair at similarity 0.8 shares a bucket 95% of the time, one at
+0.5 only 15%; pairs in a shared bucket are kept when their signatures agree in at least
+DUPLICATES_THRESHOLD of the bins. Clusters are the connected groups of such pairs, found from
+the buckets holding more than one post.
+
+Each process builds its index in a background thread on its first request, covering the posts
+of the last DUPLICATES_WINDOW_DAYS (0 for all of them), keeps it current with the posts created,
+edited and deleted through its FirebaseService (index_service), and every
+DUPLICATES_REFRESH_SECONDS picks up posts created or edited elsewhere and drops those that left
+the window. An indexed post takes roughly 1.2 KB.
+'''
+import datetime
+import logging
+import operator
+import os
+import re
+import threading
+import time
+import zlib
+from array import array
+from functools import wraps
+
+import metrics
+import records
+
+BANDS = int(os.environ.get('DUPLICATES_BANDS', 10))
+ROWS = int(os.environ.get('DUPLICATES_ROWS', 6))
+THRESHOLD = float(os.environ.get('DUPLICATES_THRESHOLD', 0.8))
+WINDOW_DAYS = float(os.environ.get('DUPLICATES_WINDOW_DAYS', 30))
+REFRESH_SECONDS = float(os.environ.get('DUPLICATES_REFRESH_SECONDS', 60))
+MIN_CHARS = int(os.environ.get('DUPLICATES_MIN_CHARS', 20)) # shorter posts ("nice!") are alike by nature
+SHINGLE = 5
+HASHES = BANDS * ROWS
+COMPACT_RATIO = 0.2
+MAX_COMPARISONS = 32 # bucket members compared when a post is added, so a large wave stays O(1) per post
+MAX_ANCHORS = 8 # per bucket while clustering
+
+_MASK = 0xffffffff
+_ROTATION = 0x9e3779b1 # offsets a borrowed bin by its distance, so it only matches the same borrow
+_CHANGE_FIELDS = ('createdAt', 'editedAt')
+_FIELDS = ['content'] + list(_CHANGE_FIELDS)
+CLOCK_SKEW = datetime.timedelta(minutes=5) # refresh overlap, re-indexing a post is harmless
+
+DOCUMENTS = metrics.registry.gauge('admin_api_duplicates_documents', 'Posts in the near-duplicate index')
+BUILD_SECONDS = metrics.registry.gauge('admin_api_duplicates_build_seconds', 'Duration of the last near-duplicate index build')
+NEAR_DUPLICATES = metrics.registry.counter(
+    'admin_api_duplicate_posts_total',
+    'Posts indexed while a near-duplicate of them was already indexed'
+)
+
+logger = logging.getLogger(__name__)
+
+_LINK = re.compile(r'https?://(?:www\.)?([^/\s?#]+)\S*')
+_NUMBER = re.compile(r'\d+')
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    if not isinstance(text, str):
+        return ''
+    text = _LINK.sub(r' \1 ', text.casefold())
+    text = _NUMBER.sub('0', text)
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def signature(text):
+    '''MinHash signature of a text as HASHES unsigned 32-bit ints, None when it is too short to compare'''
+    normalized = normalize(text)
+    if len(normalized) < MIN_CHARS:
+        return None
+    data = normalized.encode()
+
+    bins = [None] * HASHES
+    for i in range(len(data) - SHINGLE + 1):
+        h = zlib.crc32(data[i:i + SHINGLE])
+        b = h % HASHES
+        if bins[b] is None or h < bins[b]:
+            bins[b] = h
+
+    # densify: an empty bin takes the next filled bin's value, offset by the distance
+    if None in bins:
+        filled = [b for b in range(HASHES) if bins[b] is not None]
+        for b in range(HASHES):
+            if bins[b] is None:
+                source = next((f for f in filled if f > b), filled[0])
+                distance = (source - b) % HASHES
+                bins[b] = (bins[source] + distance * _ROTATION) & _MASK
+    return array('I', bins)
+
+
+def _band_keys(sig):
+    return [hash(tuple(sig[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+
+def _timestamp(value):
+    return value.timestamp() if isinstance(value, datetime.datetime) else time.time()
+
+
+class DuplicateIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.state = 'empty' # building, ready or failed
+        self.signatures = array('I') # docno * HASHES -> the post's signature
+        self.created = array('d') # docno -> creation time (epoch seconds)
+        self.ids = [] # docno -> post id, None once removed
+        self.docnos = dict() # post id -> docno
+        self.buckets = [dict() for _ in range(BANDS)] # band key -> docno, or list of docnos once shared
+        self.shared = set() # (band, key) of the buckets holding more than one docno
+        self.tombstones = 0
+        self.watermarks = dict() # change field -> newest value indexed
+        self.versions = dict() # post id -> (createdAt, editedAt) of the snapshot indexed
+
+    def __len__(self):
+        return len(self.docnos)
+
+    # writes
+
+    def add(self, post_id, content, created_at=None):
+        '''Index (or re-index) a post, returns whether it is a near-duplicate of an indexed post'''
+        sig = signature(content)
+        with self.lock:
+            readded = self._remove(post_id)
+            self._maybe_compact()
+            if sig is None:
+                return False
+            docno = len(self.ids)
+            self.ids.append(post_id)
+            self.docnos[post_id] = docno
+            self.signatures.extend(sig)
+            self.created.append(_timestamp(created_at))
+
+            candidates = set()
+            for band, key in enumerate(_band_keys(sig)):
+                members = self._insert(band, key, docno)
+                if members:
+                    candidates.update(self._newest_live(members))
+            duplicate = any(
+                self.similarity(docno, other) >= THRESHOLD
+                for other in sorted(candidates, reverse=True)[:MAX_COMPARISONS]
+            )
+        if duplicate and not readded: # an edit or a refresh of a post counted already
+            NEAR_DUPLICATES.inc()
+        return duplicate
+
+    def _newest_live(self, members):
+        '''The newest MAX_COMPARISONS members of a bucket that weren't removed'''
+        live = []
+        for docno in reversed(members):
+            if self.ids[docno] is not None:
+                live.append(docno)
+                if len(live) >= MAX_COMPARISONS:
+                    break
+        return live
+
+    def _insert(self, band, key, docno):
+        '''Add a docno to a bucket, returns the bucket's other members'''
+        buckets = self.buckets[band]
+        members = buckets.get(key)
+        if members is None:
+            buckets[key] = docno
+            return None
+        if isinstance(members, int):
+            buckets[key] = [members, docno]
+            self.shared.add((band, key))
+            return [members]
+        members.append(docno)
+        return members[:-1]
+
+    def add_snapshot(self, snapshot):
+        '''Index a post unless this version of it (createdAt, editedAt) already is'''
+        data = snapshot.to_dict() or dict()
+        version = tuple(data.get(field) for field in _CHANGE_FIELDS)
+        with self.lock:
+            unchanged = any(version) and self.versions.get(snapshot.id) == version
+        if not unchanged: # refreshes overlap by CLOCK_SKEW and see most posts twice
+            self.add(snapshot.id, data.get('content'), data.get('createdAt'))
+        with self.lock:
+            if any(version):
+                self.versions[snapshot.id] = version
+            for field in _CHANGE_FIELDS:
+                value = data.get(field)
+                if isinstance(value, datetime.datetime) and (field not in self.watermarks or value > self.watermarks[field]):
+                    self.watermarks[field] = value
+
+    def remove(self, post_id):
+        with self.lock:
+            self._remove(post_id)
+            self._maybe_compact()
+
+    def _remove(self, post_id):
+        '''Tombstone a post's docno, returns whether it was indexed'''
+        self.versions.pop(post_id, None)
+        docno = self.docnos.pop(post_id, None)
+        if docno is None:
+            return False
+        self.ids[docno] = None
+        self.tombstones += 1
+        return True
+
+    def _maybe_compact(self):
+        if self.tombstones > 1000 and self.tombstones > COMPACT_RATIO * len(self.ids):
+            self._compact()
+
+    def _compact(self):
+        '''Renumber the live posts and rebuild the buckets without the removed ones'''
+        signatures, created, ids = self.signatures, self.created, self.ids
+        self.signatures, self.created, self.ids = array('I'), array('d'), []
+        self.docnos = dict()
+        self.buckets = [dict() for _ in range(BANDS)]
+        self.shared = set()
+        self.tombstones = 0
+        for docno, post_id in enumerate(ids):
+            if post_id is None:
+                continue
+            sig = signatures[docno * HASHES:(docno + 1) * HASHES]
+            new = len(self.ids)
+            self.ids.append(post_id)
+            self.docnos[post_id] = new
+            self.signatures.extend(sig)
+            self.created.append(created[docno])
+            for band, key in enumerate(_band_keys(sig)):
+                self._insert(band, key, new)
+
+    def similarity(self, a, b):
+        '''Estimated Jaccard similarity of two indexed posts (by docno)'''
+        sigs = self.signatures
+        first, second = a * HASHES, b * HASHES
+        return sum(map(operator.eq, sigs[first:first + HASHES], sigs[second:second + HASHES])) / HASHES
+
+    # building
+
+    def ensure_started(self, db):
+        '''Start building the index in the background (once per process), returns whether it is ready'''
+        with self.lock:
+            if self.pid != os.getpid():
+                self._reset() # a copy inherited through fork, without the thread keeping it current
+            if self.state in ('empty', 'failed'):
+                self.state = 'building'
+                threading.Thread(target=self._run, args=(db,), name='duplicates-index', daemon=True).start()
+            return self.state == 'ready'
+
+    def _run(self, db):
+        try:
+            self.build(db)
+        except Exception as e:
+            logger.exception('Building the near-duplicate index failed: %s', e)
+            self.state = 'failed'
+            return
+        while True:
+            time.sleep(REFRESH_SECONDS)
+            try:
+                self.refresh(db)
+            except Exception as e:
+                logger.warning('Refreshing the near-duplicate index failed: %s', e)
+
+    def _cutoff(self):
+        if WINDOW_DAYS <= 0:
+            return None
+        return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=WINDOW_DAYS)
+
+    def build(self, db):
+        '''Index the posts of the window'''
+        started = time.perf_counter()
+        build_start = datetime.datetime.now(datetime.timezone.utc)
+        query = db.collection('posts')
+        cutoff = self._cutoff()
+        if cutoff is not None:
+            query = query.where('createdAt', '>=', cutoff)
+        for snapshot in query.select(_FIELDS).stream():
+            self.add_snapshot(snapshot)
+        with self.lock:
+            for field in _CHANGE_FIELDS:
+                self.watermarks.setdefault(field, build_start)
+            self.state = 'ready'
+        BUILD_SECONDS.set(time.perf_counter() - started)
+        DOCUMENTS.set(len(self))
+        logger.info('Near-duplicate index built: %d posts, %d shared buckets in %.1fs', len(self), len(self.shared), time.perf_counter() - started)
+
+    def refresh(self, db):
+        '''Index the posts created or edited since the last build or refresh, drop those older than the window'''
+        cutoff = self._cutoff()
+        for field in _CHANGE_FIELDS:
+            since = self.watermarks[field] - CLOCK_SKEW
+            query = db.collection('posts').where(field, '>', since).order_by(field).select(_FIELDS)
+            for snapshot in query.stream():
+                data = snapshot.to_dict() or dict()
+                created = data.get('createdAt')
+                if cutoff is None or not isinstance(created, datetime.datetime) or created >= cutoff:
+                    self.add_snapshot(snapshot)
+        if cutoff is not None:
+            oldest = cutoff.timestamp()
+            with self.lock:
+                expired = [
+                    post_id for docno, post_id in enumerate(self.ids)
+                    if post_id is not None and self.created[docno] < oldest
+                ]
+                for post_id in expired:
+                    self.remove(post_id)
+        DOCUMENTS.set(len(self))
+
+    # queries
+
+    def similar(self, post_id, limit=None):
+        '''Ids of the indexed near-duplicates of an indexed post (the first limit found)'''
+        with self.lock:
+            docno = self.docnos.get(post_id)
+            if docno is None:
+                return []
+            sig = self.signatures[docno * HASHES:(docno + 1) * HASHES]
+            candidates = set()
+            for band, key in enumerate(_band_keys(sig)):
+                members = self.buckets[band].get(key)
+                if isinstance(members, list):
+                    candidates.update(members)
+            candidates.discard(docno)
+            found = []
+            for other in candidates:
+                if self.ids[other] is not None and self.similarity(docno, other) >= THRESHOLD:
+                    found.append(self.ids[other])
+                    if limit is not None and len(found) >= limit:
+                        break
+            return found
+
+    def clusters(self, min_size=2, threshold=THRESHOLD):
+        '''Groups of near-duplicate posts as [{post_ids (newest first), size, similarity}], largest first'''
+        with self.lock:
+            ids = self.ids
+            parent = dict()
+
+            def find(docno):
+                root = docno
+                while parent.get(root, root) != root:
+                    root = parent[root]
+                while docno != root: # path compression
+                    parent[docno], docno = root, parent.get(docno, docno)
+                return root
+
+            # the members of a shared bucket are compared with a few anchors (members that matched no
+            # earlier anchor) instead of each other, so a wave of n posts costs about n comparisons
+            checked = set()
+            lowest = dict() # root -> lowest similarity of the pairs joined into its cluster
+            for band, key in self.shared:
+                anchors = []
+                for docno in self.buckets[band][key]:
+                    if ids[docno] is None:
+                        continue
+                    for anchor in anchors:
+                        if (anchor, docno) in checked:
+                            continue # compared in another band
+                        checked.add((anchor, docno))
+                        score = self.similarity(anchor, docno)
+                        if score < threshold:
+                            continue
+                        a, b = find(anchor), find(docno)
+                        low = min(score, lowest.get(a, 1.0))
+                        if a != b:
+                            parent[b] = parent[a] = a
+                            low = min(low, lowest.pop(b, 1.0))
+                        lowest[a] = low
+                        break
+                    else:
+                        if len(anchors) < MAX_ANCHORS:
+                            anchors.append(docno)
+
+            groups = dict()
+            for docno in parent:
+                groups.setdefault(find(docno), []).append(docno)
+
+            clusters = []
+            for root, members in groups.items():
+                members.sort(key=lambda docno: self.created[docno], reverse=True)
+                if len(members) < min_size:
+                    continue
+                clusters.append({
+                    'post_ids': [ids[docno] for docno in members],
+                    'size': len(members),
+                    'similarity': round(lowest.get(root, 1.0), 3),
+                    'first_seen': datetime.datetime.fromtimestamp(self.created[members[-1]], datetime.timezone.utc),
+                    'last_seen': datetime.datetime.fromtimestamp(self.created[members[0]], datetime.timezone.utc)
+                })
+            clusters.sort(key=lambda cluster: (-cluster['size'], -cluster['last_seen'].timestamp()))
+            return clusters
+
+    def hydrate(self, db, clusters):
+        '''Attach the newest post of each cluster as its sample; posts deleted since they were indexed are dropped'''
+        refs = [db.collection('posts').document(cluster['post_ids'][0]) for cluster in clusters]
+        samples = dict()
+        if refs:
+            for snapshot in db.get_all(refs, field_paths=records.POST_SUMMARY.projection):
+                if snapshot.exists:
+                    samples[snapshot.id] = records.POST_SUMMARY.from_snapshot(snapshot)
+
+        for cluster in clusters:
+            newest = cluster['post_ids'][0]
+            if newest not in samples:
+                self.remove(newest) # the rest are checked when they are deleted or listed next
+            cluster['sample'] = samples.get(newest)
+        return clusters
+
+
+def index_service(service, index):
+    '''Keep the index current with the post writes made through a FirebaseService instance'''
+
+    def after(name, update):
+        method = getattr(service, name)
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            result = method(*args, **kwargs)
+            try:
+                update(result, *args, **kwargs)
+            except Exception as e:
+                logger.warning('Updating the near-duplicate index after %s failed: %s', name, e)
+            return result
+        setattr(service, name, wrapper)
+
+    def reindex(post_id):
+        snapshot = service.db.collection('posts').document(post_id).get(field_paths=_FIELDS)
+        if snapshot.exists:
+            index.add_snapshot(snapshot)
+
+    after('create_post', lambda post_id, user_id, content: index.add(post_id, content))
+    after('update_post_content', lambda result, post_id, new_content, admin_id=None: reindex(post_id))
+    after('delete_post', lambda result, post_id, admin_id=None: index.remove(post_id))
+    after('delete_posts', lambda result, post_ids, admin_id=None: [index.remove(post_id) for post_id in result['deleted']])
+    service.duplicate_index = index
+    return index
@@ -0,0 +1,119 @@
+# encoding.py
+'''
+Response encoding: JSON serialization of Firestore values and compression of large bodies.
+
+- jsonify() is a drop-in for flask.jsonify. It uses orjson when installed (`pip install orjson`,
+  several times faster on large lists) and Flask's encoder otherwise; both render Firestore
+  values the same way: timestamps as ISO 8601, document references as their path, GeoPoints
+  as {latitude, longitude} and records (records.py) as objects. Services can therefore return
+  documents as read.
+- init_app() compresses responses of at least COMPRESS_MIN_BYTES with brotli (when the `brotli`
+  package is installed and the client accepts it) or gzip.
+'''
+import datetime
+import gzip
+import os
+
+from flask import current_app, json, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6)) # gzip 1-9
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4)) # 0-11, higher levels cost far more cpu than they save
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/html', 'text/csv')
+
+
+def firestore_default(o):
+    '''JSON value of types the json modules don't know (Firestore timestamps, references, GeoPoints)'''
+    if isinstance(o, (datetime.datetime, datetime.date)):
+        return o.isoformat()
+    to_dict = getattr(o, 'to_dict', None)
+    if to_dict is not None: # records.Record
+        return to_dict()
+    type_name = type(o).__name__
+    if type_name in ('DocumentReference', 'AsyncDocumentReference'):
+        return o.path
+    if type_name == 'GeoPoint':
+        return {'latitude': o.latitude, 'longitude': o.longitude}
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    raise TypeError(f'Object of type {type_name} is not JSON serializable')
+
+
+class FirestoreJSONEncoder(json.JSONEncoder):
+    def default(self, o):
+        try:
+            return firestore_default(o)
+        except TypeError:
+            return super().default(o)
+
+
+def jsonify(*args, **kwargs):
+    '''flask.jsonify, through orjson when available'''
+    if orjson is None:
+        return json.jsonify(*args, **kwargs)
+
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    data = args[0] if len(args) == 1 else (args or kwargs)
+
+    options = orjson.OPT_NON_STR_KEYS
+    if current_app.config.get('JSON_SORT_KEYS', True):
+        options |= orjson.OPT_SORT_KEYS
+    return current_app.response_class(
+        orjson.dumps(data, default=firestore_default, option=options) + b'\n',
+        mimetype=current_app.config.get('JSONIFY_MIMETYPE', 'application/json')
+    )
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(response):
+    '''Compress a finished response in place if the client accepts it and it is large enough'''
+    if (response.status_code < 200 or response.status_code in (204, 304) or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=COMPRESS_LEVEL, mtime=0)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+
+    # the encoded body differs byte for byte, so a strong validator has to become a weak one
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        response.headers['ETag'] = f'W/{etag}'
+    return response
+
+
+def init_app(app):
+    '''Firestore-aware JSON for flask.jsonify as well, and compression of large responses'''
+    app.json_encoder = FirestoreJSONEncoder
+    app.after_request(compress)
@@ -0,0 +1,72 @@
+# feeds.py
+'''
+Feed assembly: the newest posts of a set of authors, for any number of authors.
+
+Firestore caps the values of an `in` filter (FIRESTORE_IN_LIMIT, 30), so the authors are split
+into chunks, each chunk's newest `limit` posts are queried concurrently, and the sorted chunk
+results are k-way merged with a heap into the overall newest `limit`. Paging uses the id of the
+last post returned: its snapshot is the cursor for every chunk query, so the next page carries
+on across all chunks at once.
+'''
+import heapq
+import itertools
+import os
+from functools import partial
+
+from firebase_admin import firestore
+
+import records
+from concurrency import fan_out
+
+IN_LIMIT = int(os.environ.get('FIRESTORE_IN_LIMIT', 30))
+
+
+def chunked(values, size=IN_LIMIT):
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def _newest_first(post):
+    # Firestore breaks createdAt ties by document id in the direction of the last order_by
+    return (post['createdAt'], post['id'])
+
+
+def merge_newest(post_lists, limit):
+    '''k-way merge of lists sorted newest first into the overall newest `limit` posts'''
+    if len(post_lists) == 1:
+        return post_lists[0][:limit]
+    return list(itertools.islice(heapq.merge(*post_lists, key=_newest_first, reverse=True), limit))
+
+
+def _chunk_posts(db, author_ids, limit, cursor, schema):
+    query = (
+        db.collection('posts')
+        .where('userId', 'in', author_ids)
+        .order_by('createdAt', direction=firestore.Query.DESCENDING)
+        .limit(limit)
+    )
+    if cursor is not None:
+        query = query.start_after(cursor)
+    return [schema.from_snapshot(doc) for doc in query.stream()]
+
+
+def author_feed(db, author_ids, limit=20, last_post=None, schema=records.POST):
+    '''Newest `limit` posts by any of author_ids, after post `last_post`; returns {posts, last_post}'''
+    author_ids = list(dict.fromkeys(author_ids)) # dedupe, keeps the caller's list untouched
+    if not author_ids or limit <= 0:
+        return {'posts': [], 'last_post': None}
+
+    cursor = None
+    if last_post:
+        cursor_doc = db.collection('posts').document(last_post).get()
+        if cursor_doc.exists:
+            cursor = cursor_doc
+
+    chunk_results = fan_out(*[
+        partial(_chunk_posts, db, chunk, limit, cursor, schema) for chunk in chunked(author_ids)
+    ])
+    posts = merge_newest(chunk_results, limit)
+
+    return {
+        'posts': posts,
+        'last_post': posts[-1]['id'] if posts else None
+    }
@@ -0,0 +1,134 @@
+# filters.py
+'''
+Server-side filters for the admin post and user lists.
+
+    ?userId=<uid>&editedByAdmin=true&createdAfter=2024-01-01&createdBefore=2024-02-01&minLikes=10&minComments=1
+    ?suspended=true&createdAfter=2024-01-01
+
+Filters become where() clauses of the list query, which stays ordered by createdAt (newest
+first), so Firestore returns only the matching page. Every combination that needs a composite
+index has one in firestore.indexes.json (deploy with `firebase deploy --only firestore:indexes`).
+A combination that isn't in the manifest is rejected with QueryNotIndexed before it reaches
+Firestore, listing the combinations that are supported.
+
+minLikes/minComments use the likeCount/commentCount counters, which posts written before the
+counters existed only have after FirebaseService.backfill_engagement_edges() has run.
+'''
+import datetime
+import json
+import os
+
+MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'firestore.indexes.json')
+ORDER_FIELD = 'createdAt'
+
+
+class FilterError(ValueError):
+    '''A filter parameter has an invalid value'''
+
+
+class QueryNotIndexed(Exception):
+    '''No composite index covers the requested filter combination'''
+
+
+def _boolean(value):
+    lowered = value.lower()
+    if lowered in ('true', '1', 'yes'):
+        return True
+    if lowered in ('false', '0', 'no'):
+        return False
+    raise ValueError('expected true or false')
+
+
+def _timestamp(value):
+    # ISO 8601 date or datetime, UTC unless it says otherwise
+    parsed = datetime.datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def _count(value):
+    count = int(value)
+    if count < 0:
+        raise ValueError('expected a positive number')
+    return count
+
+
+# query parameter -> (document field, operator, parser)
+FILTERS = {
+    'posts': {
+        'userId': ('userId', '==', str),
+        'editedByAdmin': ('editedByAdmin', '==', _boolean),
+        'createdAfter': (ORDER_FIELD, '>=', _timestamp),
+        'createdBefore': (ORDER_FIELD, '<', _timestamp),
+        'minLikes': ('likeCount', '>=', _count),
+        'minComments': ('commentCount', '>=', _count)
+    },
+    'users': {
+        'suspended': ('suspended', '==', _boolean),
+        'createdAfter': (ORDER_FIELD, '>=', _timestamp),
+        'createdBefore': (ORDER_FIELD, '<', _timestamp)
+    }
+}
+
+
+def _load_manifest(path=MANIFEST):
+    '''{collection: [frozenset of indexed fields]} for the composite indexes ordered by createdAt'''
+    with open(path) as f:
+        manifest = json.load(f)
+    indexes = dict()
+    for index in manifest.get('indexes', []):
+        fields = [field['fieldPath'] for field in index['fields']]
+        if ORDER_FIELD in fields:
+            indexes.setdefault(index['collectionGroup'], []).append(frozenset(fields))
+    return indexes
+
+
+INDEXES = _load_manifest()
+
+
+def parse(collection, args):
+    '''(field, operator, value) filters from request args, ignoring parameters that aren't filters'''
+    filters = []
+    for name, (field, op, parser) in FILTERS[collection].items():
+        value = args.get(name)
+        if value is None or value == '':
+            continue
+        try:
+            filters.append((field, op, parser(value)))
+        except ValueError as e:
+            raise FilterError(f'Invalid value for {name}: {value!r} ({e})') from None
+    return filters
+
+
+def _parameters(collection, fields):
+    return sorted(name for name, (field, _, _) in FILTERS[collection].items() if field in fields)
+
+
+def check_indexed(collection, filters):
+    '''Raise QueryNotIndexed if the filters ordered by createdAt need a composite index the manifest doesn't have'''
+    fields = {field for field, _, _ in filters} - {ORDER_FIELD}
+    if not fields:
+        return # createdAt alone is served by Firestore's single-field index
+    required = frozenset(fields | {ORDER_FIELD})
+    if required in INDEXES.get(collection, ()):
+        return
+
+    supported = [
+        ' + '.join(_parameters(collection, index - {ORDER_FIELD}))
+        for index in INDEXES.get(collection, ())
+    ]
+    raise QueryNotIndexed(
+        f'Filtering {collection} by {", ".join(_parameters(collection, fields))} together is not supported '
+        f'(no index in firestore.indexes.json). Supported combinations, each optionally with '
+        f'createdAfter/createdBefore: {"; ".join(sorted(supported)) or "none"}'
+    )
+
+
+def apply(query, filters):
+    for field, op, value in filters:
+        query = query.where(field, op, value)
+    return query
+
+
+def is_missing_index(error):
+    '''Whether a Firestore error means the query needs an index that isn't deployed'''
+    return type(error).__name__ == 'FailedPrecondition' and 'index' in str(error)
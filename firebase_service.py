@@ -1,26 +1,129 @@
 # firebase_service.py
 import firebase_admin
-from firebase_admin import credentials, firestore, auth, storage
-import hashlib
+from firebase_admin import credentials, firestore, auth
 import uuid
 import datetime
 import tempfile
 import os
+import logging
+import threading
+import time
 
-class FirebaseService:
-    def __init__(self):
-        # Use the application default credentials or specify path to service account
-        # You'll need to generate a service account key from Firebase console
-        cred_path = os.environ.get('FIREBASE_CREDENTIALS', 'firebase-credentials.json')
-        
+import feeds
+import logging_setup
+import filters as query_filters
+import moderation
+import passwords
+import records
+import replicas
+import timelines
+
+logger = logging.getLogger(__name__)
+
+# ! Added for admin-api: the firebase app is created on first use, once per process
+_app_lock = threading.Lock()
+_app_pid = None
+
+def firebase_app(renew=False):
+    '''This process's firebase_admin app, initialized on first use and again after fork'''
+    global _app_pid
+    with _app_lock:
+        inherited = _app_pid is not None and _app_pid != os.getpid()
+        if firebase_admin._apps and (inherited or renew):
+            # gRPC channels must not be shared across fork, so drop the app (and its cached clients) entirely
+            firebase_admin.delete_app(firebase_admin.get_app())
         if not firebase_admin._apps:
+            # Use the application default credentials or specify path to service account
+            # You'll need to generate a service account key from Firebase console
+            cred_path = os.environ.get('FIREBASE_CREDENTIALS', 'firebase-credentials.json')
             cred = credentials.Certificate(cred_path)
             firebase_admin.initialize_app(cred, {
                 'storageBucket': 'optima-88380.firebasestorage.app'
             })
-            
-        self.db = firestore.client()
-        self.bucket = storage.bucket()
+        _app_pid = os.getpid()
+        return firebase_admin.get_app()
+
+class FirebaseService:
+    def __init__(self, db=None, bucket=None):
+        # db/bucket can be passed in to run against a different backend (e.g. the local benchmark dataset);
+        # otherwise they are created on first use, in the process that uses them (see connect())
+        self._injected = db is not None
+        self._db = db
+        self._bucket = bucket
+        self._pid = os.getpid()
+        self._renew = False
+        self._lock = threading.Lock()
+        self._client_wrappers = []
+        self.warmed_up = None # (pid, seconds) of the last successful warm_up()
+
+    @property
+    def db(self):
+        if not self._injected and (self._db is None or self._pid != os.getpid()):
+            self.connect()
+        return self._db
+
+    @db.setter
+    def db(self, client):
+        self._db = client
+
+    @property
+    def bucket(self):
+        if self._injected:
+            return self._bucket
+        if self._pid != os.getpid():
+            self.connect()
+        if self._bucket is None:
+            # google-cloud-storage is only imported once something is uploaded
+            from firebase_admin import storage
+            self._bucket = storage.bucket(app=firebase_app())
+        return self._bucket
+
+    def connect(self):
+        '''Create this process's Firestore client now instead of on first use'''
+        if self._injected:
+            return
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                return
+            client = firestore.client(app=firebase_app(renew=self._renew))
+            for wrapper in self._client_wrappers:
+                client = wrapper(client)
+            self._db = client
+            self._bucket = None
+            self._pid = os.getpid()
+            self._renew = False
+
+    def wrap_client(self, wrapper):
+        '''Pass the Firestore client through wrapper(client), now and whenever it is recreated'''
+        with self._lock:
+            if wrapper in self._client_wrappers:
+                return
+            self._client_wrappers.append(wrapper)
+            if self._db is not None:
+                self._db = wrapper(self._db)
+
+    def reconnect(self):
+        '''Replace the Firestore/Storage clients with new ones on next use, e.g. in a worker process after fork'''
+        if self._injected:
+            return
+        with self._lock:
+            self._db = None
+            self._bucket = None
+            self._renew = self._pid == os.getpid() # after fork firebase_app() starts over anyway
+
+    def warm_up(self):
+        '''Connect and make one small read, so the first request doesn't pay for channel setup and auth'''
+        try:
+            started = time.perf_counter()
+            list(self.db.collection('admins').limit(1).stream())
+            self.warmed_up = (os.getpid(), time.perf_counter() - started)
+            return self.warmed_up[1]
+        except Exception as e:
+            logging_setup.log_failure(logger, 'warm_up', e)
+            raise e
+
+    def is_warm(self):
+        return self.warmed_up is not None and self.warmed_up[0] == os.getpid()
         
     # Authentication Methods
     def register_user(self, email, password, username):
@@ -37,6 +140,7 @@ class FirebaseService:
                 'email': email,
                 'username': username,
                 'friends': [],
+                'suspended': False, # ! Added for admin-api: filterable in get_all_users
                 'createdAt': firestore.SERVER_TIMESTAMP
             })
             
@@ -46,7 +150,7 @@ class FirebaseService:
                 'displayName': user.display_name
             }
         except Exception as e:
-            print(f"Error in register_user: {e}")
+            logging_setup.log_failure(logger, 'register_user', e)
             raise e
     
     def login_user(self, email, password):
@@ -87,7 +191,7 @@ class FirebaseService:
                 'displayName': user_data.get('username')
             }
         except Exception as e:
-            print(f"Error in login_user: {e}")
+            logging_setup.log_failure(logger, 'login_user', e)
             raise e
     
     # User Methods
@@ -97,37 +201,41 @@ class FirebaseService:
             
             if not user_doc.exists:
                 raise Exception("User not found")
-                
-            user_data = user_doc.to_dict()
-            user_data['id'] = user_doc.id
             
-            return user_data
+            return records.USER.from_snapshot(user_doc)
         except Exception as e:
-            print(f"Error in get_user_profile: {e}")
+            logging_setup.log_failure(logger, 'get_user_profile', e)
             raise e
     
-    def get_user_posts(self, user_id): # ! Added for admin-api
-        '''Get all posts created by a specific user'''
+    def get_user_posts(self, user_id, limit=None, start_after=None): # ! Added for admin-api
+        '''Get posts created by a specific user, all of them or the newest `limit` (after post `start_after`)'''
         try:
             # query posts by the user
-            posts_query = self.db.collection('posts').where('userId', '==', user_id).stream()
-            posts = []
-            
-            for doc in posts_query:
-                post_data = doc.to_dict()
-                post_data['id'] = doc.id
-                
-                if 'createdAt' in post_data and post_data['createdAt']:
-                    post_data['createdAt'] = post_data['createdAt'].isoformat()
-                
-                post_data['commentCount'] = len(post_data.get('comments', []))
-                post_data['likeCount'] = len(post_data.get('likes', []))
-                
-                posts.append(post_data)
-            
-            return posts
+            query = self.db.collection('posts').where('userId', '==', user_id)
+
+            if limit: # newest first, paginated (uses the userId + createdAt index)
+                query = query.order_by('createdAt', direction=firestore.Query.DESCENDING).limit(limit)
+                if start_after:
+                    last_doc = self.db.collection('posts').document(start_after).get()
+                    if last_doc.exists:
+                        query = query.start_after(last_doc)
+
+            return [records.POST_WITH_COUNTS.from_snapshot(doc) for doc in query.stream()]
+        except Exception as e:
+            logging_setup.log_failure(logger, 'get_user_posts', e)
+            raise e
+
+    def count_user_posts(self, user_id):
+        '''Number of posts by a user, without reading the posts themselves'''
+        try:
+            query = self.db.collection('posts').where('userId', '==', user_id)
+            try:
+                result = query.count().get() # aggregation query, billed per 1000 index entries
+                return int(result[0][0].value)
+            except AttributeError: # client without aggregation support
+                return sum(1 for _ in query.select([]).stream())
         except Exception as e:
-            print(f'Error in get_user_posts: {e}')
+            logging_setup.log_failure(logger, 'count_user_posts', e)
             raise e
     
     def search_users(self, search_term):
@@ -147,8 +255,7 @@ class FirebaseService:
                 if current_user and doc.id == current_user.uid:
                     continue
                     
-                user_data = doc.to_dict()
-                user_data['id'] = doc.id
+                user_data = records.USER.from_snapshot(doc)
                 
                 # Check if user is a friend of current user
                 if current_user:
@@ -158,7 +265,7 @@ class FirebaseService:
                 
             return users
         except Exception as e:
-            print(f"Error in search_users: {e}")
+            logging_setup.log_failure(logger, 'search_users', e)
             raise e
     
     # Friend Methods
@@ -174,9 +281,11 @@ class FirebaseService:
                 'friends': firestore.ArrayUnion([user_id])
             })
             
+            timelines.schedule_rebuild(self.db, user_id, friend_id) # ! Added for admin-api
+            
             return True
         except Exception as e:
-            print(f"Error in add_friend: {e}")
+            logging_setup.log_failure(logger, 'add_friend', e)
             raise e
     
     def remove_friend(self, user_id, friend_id):
@@ -191,9 +300,11 @@ class FirebaseService:
                 'friends': firestore.ArrayRemove([user_id])
             })
             
+            timelines.schedule_rebuild(self.db, user_id, friend_id) # ! Added for admin-api
+            
             return True
         except Exception as e:
-            print(f"Error in remove_friend: {e}")
+            logging_setup.log_failure(logger, 'remove_friend', e)
             raise e
     
     # Post Methods
@@ -208,77 +319,118 @@ class FirebaseService:
                 'content': content,
                 'likes': [],
                 'comments': [],
+                # ! Added for admin-api: counters and flag filterable in get_all_posts
+                'likeCount': 0,
+                'commentCount': 0,
+                'editedByAdmin': False,
                 'createdAt': firestore.SERVER_TIMESTAMP
             })
             
+            timelines.fan_out_post(self.db, post_ref.id, user_id) # ! Added for admin-api
+            
             return post_ref.id
         except Exception as e:
-            print(f"Error in create_post: {e}")
+            logging_setup.log_failure(logger, 'create_post', e)
             raise e
     
-    def get_friends_posts(self, user_id):
+    def get_friends_posts(self, user_id, limit=20, last_post=None):
+        '''Newest posts of a user and their friends (any number of friends, see feeds.py)'''
+        return self.get_friends_feed(user_id, limit=limit, last_post=last_post)['posts']
+    
+    def get_friends_feed(self, user_id, limit=20, last_post=None): # ! Added for admin-api
+        '''Page of the friends feed as {posts, last_post}, continue with last_post'''
         try:
+            # precomputed timeline when there is one (see timelines.py)
+            if timelines.ENABLED:
+                page = timelines.read(self.db, user_id, limit=limit, last_post=last_post)
+                if page is not None:
+                    return page
+            
             # Get user's friends
             user_doc = self.db.collection('users').document(user_id).get()
             user_data = user_doc.to_dict()
             friends = user_data.get('friends', []) if user_data else []
             
             # Include user's own posts
-            friends.append(user_id)
-            
-            # Get posts from user and friends
-            posts = []
-            
-            # Handle case with no friends
-            if not friends:
-                return []
-                
-            query = (
-                self.db.collection('posts')
-                .where('userId', 'in', friends)
-                .order_by('createdAt', direction=firestore.Query.DESCENDING)
-                .limit(20)
-            )
-            
-            for doc in query.stream():
-                post_data = doc.to_dict()
-                # Convert timestamps to strings for JSON serialization
-                if 'createdAt' in post_data and post_data['createdAt']:
-                    post_data['createdAt'] = post_data['createdAt'].isoformat()
-                    
-                post_data['id'] = doc.id
-                posts.append(post_data)
-                
-            return posts
+            return feeds.author_feed(self.db, friends + [user_id], limit=limit, last_post=last_post)
         except Exception as e:
-            print(f"Error in get_friends_posts: {e}")
+            logging_setup.log_failure(logger, 'get_friends_feed', e)
             raise e
     
+    def _exists(self, refs, transaction=None): # ! Added for admin-api
+        '''Whether each document exists, in one round trip and without reading any fields'''
+        found = {doc.reference.path for doc in self.db.get_all(refs, field_paths=[], transaction=transaction) if doc.exists}
+        return [ref.path in found for ref in refs]
+    
     # Like Methods
     def toggle_like(self, post_id, user_id):
+        '''Like or unlike a post, returns whether it is now liked'''
         try:
             post_ref = self.db.collection('posts').document(post_id)
-            post_doc = post_ref.get()
+            like_ref = self.db.collection('likes').document(f"{post_id}_{user_id}")
             
-            if not post_doc.exists:
-                raise Exception("Post not found")
+            # the like is an edge document, so the post (and its comments) is never read
+            @firestore.transactional
+            def toggle(transaction):
+                has_liked, post_exists = self._exists([like_ref, post_ref], transaction=transaction)
                 
-            post_data = post_doc.to_dict()
-            likes = post_data.get('likes', [])
-            has_liked = user_id in likes
+                if not post_exists:
+                    raise Exception("Post not found")
+                
+                if has_liked:
+                    transaction.delete(like_ref)
+                    transaction.update(post_ref, {
+                        'likes': firestore.ArrayRemove([user_id]),
+                        'likeCount': firestore.Increment(-1)
+                    })
+                else:
+                    transaction.set(like_ref, {
+                        'postId': post_id,
+                        'userId': user_id,
+                        'createdAt': firestore.SERVER_TIMESTAMP
+                    })
+                    transaction.update(post_ref, {
+                        'likes': firestore.ArrayUnion([user_id]),
+                        'likeCount': firestore.Increment(1)
+                    })
+                
+                return not has_liked
+            
+            return toggle(self.db.transaction())
+        except Exception as e:
+            logging_setup.log_failure(logger, 'toggle_like', e)
+            raise e
+    
+    def report_post(self, post_id, user_id, reason=None): # ! Added for admin-api
+        '''Report a post for moderation (once per user), returns whether this was a new report'''
+        try:
+            post_ref = self.db.collection('posts').document(post_id)
+            report_ref = self.db.collection('reports').document(f"{post_id}_{user_id}")
             
-            if has_liked:
-                post_ref.update({
-                    'likes': firestore.ArrayRemove([user_id])
+            # edge document and counter in one commit, like likes, so reportCount can't drift
+            @firestore.transactional
+            def report(transaction):
+                has_reported, post_exists = self._exists([report_ref, post_ref], transaction=transaction)
+                
+                if not post_exists:
+                    raise Exception("Post not found")
+                if has_reported:
+                    return False
+                
+                transaction.set(report_ref, {
+                    'postId': post_id,
+                    'userId': user_id,
+                    'reason': reason,
+                    'createdAt': firestore.SERVER_TIMESTAMP
                 })
-            else:
-                post_ref.update({
-                    'likes': firestore.ArrayUnion([user_id])
+                transaction.update(post_ref, {
+                    'reportCount': firestore.Increment(1)
                 })
-                
-            return not has_liked
+                return True
+            
+            return report(self.db.transaction())
         except Exception as e:
-            print(f"Error in toggle_like: {e}")
+            logging_setup.log_failure(logger, 'report_post', e)
             raise e
     
     def add_comment(self, post_id, user_id, content):
@@ -295,12 +447,13 @@ class FirebaseService:
             }
             
             post_ref.update({
-                'comments': firestore.ArrayUnion([comment])
+                'comments': firestore.ArrayUnion([comment]),
+                'commentCount': firestore.Increment(1) # ! Added for admin-api
             })
             
             return comment
         except Exception as e:
-            print(f"Error in add_comment: {e}")
+            logging_setup.log_failure(logger, 'add_comment', e)
             raise e
             
     def get_like_details(self, post_id):
@@ -325,27 +478,25 @@ class FirebaseService:
                     
             return likes
         except Exception as e:
-            print(f"Error in get_like_details: {e}")
+            logging_setup.log_failure(logger, 'get_like_details', e)
             raise e
     
     # Additional methods from star.jsx
-    def get_post(self, post_id):
+    def get_post(self, post_id, versioned=False): # ! versioned added for admin-api
+        '''Get a post, with versioned=True returns (post, update_time)'''
         try:
             post_doc = self.db.collection('posts').document(post_id).get()
             
             if not post_doc.exists:
                 raise Exception("Post not found")
                 
-            post_data = post_doc.to_dict()
-            post_data['id'] = post_doc.id
+            post_data = records.POST.from_snapshot(post_doc)
             
-            # Convert timestamp to string
-            if 'createdAt' in post_data and post_data['createdAt']:
-                post_data['createdAt'] = post_data['createdAt'].isoformat()
-                
+            if versioned:
+                return post_data, post_doc.update_time
             return post_data
         except Exception as e:
-            print(f"Error in get_post: {e}")
+            logging_setup.log_failure(logger, 'get_post', e)
             raise e
     
     def get_feed(self, user_id, last_post=None):
@@ -364,23 +515,14 @@ class FirebaseService:
                     query = query.start_after(last_post_doc)
                     
             # Execute query
-            posts = []
-            for doc in query.stream():
-                post_data = doc.to_dict()
-                post_data['id'] = doc.id
-                
-                # Convert timestamp to string
-                if 'createdAt' in post_data and post_data['createdAt']:
-                    post_data['createdAt'] = post_data['createdAt'].isoformat()
-                    
-                posts.append(post_data)
+            posts = [records.POST.from_snapshot(doc) for doc in query.stream()]
                 
             return {
                 'posts': posts,
                 'last_post': posts[-1]['id'] if posts else None
             }
         except Exception as e:
-            print(f"Error in get_feed: {e}")
+            logging_setup.log_failure(logger, 'get_feed', e)
             raise e
     
     def get_comments(self, post_id, last_comment=None):
@@ -416,7 +558,7 @@ class FirebaseService:
                 'last_comment': comments[-1]['id'] if comments else None
             }
         except Exception as e:
-            print(f"Error in get_comments: {e}")
+            logging_setup.log_failure(logger, 'get_comments', e)
             raise e
     
     def check_like_status(self, post_id, user_id):
@@ -424,40 +566,133 @@ class FirebaseService:
             like_ref = self.db.collection('likes').document(f"{post_id}_{user_id}").get()
             return like_ref.exists
         except Exception as e:
-            print(f"Error in check_like_status: {e}")
+            logging_setup.log_failure(logger, 'check_like_status', e)
             raise e
     
     def toggle_follow(self, follower_id, target_user_id):
+        '''Follow or unfollow a user, returns whether the follower now follows them'''
         try:
             follower_ref = self.db.collection('users').document(follower_id)
             target_ref = self.db.collection('users').document(target_user_id)
+            follow_ref = self.db.collection('follows').document(f"{follower_id}_{target_user_id}")
             
-            follower_doc = follower_ref.get()
-            if not follower_doc.exists:
-                raise Exception("Follower user not found")
+            if follower_id == target_user_id:
+                raise Exception("Users can't follow themselves")
+            
+            # edge document plus both counters in one commit, so counts can't drift
+            @firestore.transactional
+            def toggle(transaction):
+                is_following, follower_exists, target_exists = self._exists(
+                    [follow_ref, follower_ref, target_ref], transaction=transaction
+                )
+                
+                if not follower_exists:
+                    raise Exception("Follower user not found")
+                if not target_exists:
+                    raise Exception("User not found")
+                
+                if is_following:
+                    # Unfollow
+                    transaction.delete(follow_ref)
+                    transaction.update(follower_ref, {
+                        'following': firestore.ArrayRemove([target_user_id]),
+                        'following_count': firestore.Increment(-1)
+                    })
+                    transaction.update(target_ref, {
+                        'followers_count': firestore.Increment(-1)
+                    })
+                else:
+                    # Follow
+                    transaction.set(follow_ref, {
+                        'followerId': follower_id,
+                        'targetId': target_user_id,
+                        'createdAt': firestore.SERVER_TIMESTAMP
+                    })
+                    transaction.update(follower_ref, {
+                        'following': firestore.ArrayUnion([target_user_id]),
+                        'following_count': firestore.Increment(1)
+                    })
+                    transaction.update(target_ref, {
+                        'followers_count': firestore.Increment(1)
+                    })
                 
-            following = follower_doc.to_dict().get('following', [])
+                return not is_following
             
-            if target_user_id in following:
-                # Unfollow
-                follower_ref.update({
-                    'following': firestore.ArrayRemove([target_user_id])
-                })
-                target_ref.update({
-                    'followers_count': firestore.Increment(-1)
-                })
-                return False
-            else:
-                # Follow
-                follower_ref.update({
-                    'following': firestore.ArrayUnion([target_user_id])
-                })
-                target_ref.update({
-                    'followers_count': firestore.Increment(1)
-                })
-                return True
+            return toggle(self.db.transaction())
         except Exception as e:
-            print(f"Error in toggle_follow: {e}")
+            logging_setup.log_failure(logger, 'toggle_follow', e)
+            raise e
+    
+    def backfill_engagement_edges(self, batch_size=400): # ! Added for admin-api
+        '''
+        One-off migration to the like/follow edge documents: creates likes/{post}_{user} and
+        follows/{follower}_{target} from the posts' likes and users' following arrays, and sets
+        likeCount, followers_count and following_count from them. Also sets commentCount and
+        the editedByAdmin/suspended defaults the list filters rely on. Safe to run again.
+        '''
+        try:
+            batch = self.db.batch()
+            pending = 0
+            
+            def stage(write):
+                nonlocal batch, pending
+                write(batch)
+                pending += 1
+                if pending >= batch_size:
+                    batch.commit()
+                    batch = self.db.batch()
+                    pending = 0
+            
+            likes = 0
+            for post_doc in self.db.collection('posts').select(['likes', 'comments', 'editedByAdmin']).stream():
+                post_data = post_doc.to_dict() or dict()
+                likers = post_data.get('likes') or []
+                for user_id in likers:
+                    like_ref = self.db.collection('likes').document(f"{post_doc.id}_{user_id}")
+                    like = {'postId': post_doc.id, 'userId': user_id}
+                    stage(lambda b: b.set(like_ref, like, merge=True))
+                counts = {
+                    'likeCount': len(likers),
+                    'commentCount': len(post_data.get('comments') or []),
+                    'editedByAdmin': bool(post_data.get('editedByAdmin'))
+                }
+                stage(lambda b: b.update(post_doc.reference, counts))
+                likes += len(likers)
+            
+            follows = 0
+            following = dict()
+            followers = dict()
+            suspended = dict()
+            for user_doc in self.db.collection('users').select(['following', 'suspended']).stream():
+                user_data = user_doc.to_dict() or dict()
+                targets = user_data.get('following') or []
+                following[user_doc.id] = len(targets)
+                suspended[user_doc.id] = bool(user_data.get('suspended'))
+                for target_id in targets:
+                    follow_ref = self.db.collection('follows').document(f"{user_doc.id}_{target_id}")
+                    follow = {'followerId': user_doc.id, 'targetId': target_id}
+                    stage(lambda b: b.set(follow_ref, follow, merge=True))
+                    followers[target_id] = followers.get(target_id, 0) + 1
+                follows += len(targets)
+            
+            for user_id, count in following.items():
+                user_ref = self.db.collection('users').document(user_id)
+                counts = {
+                    'following_count': count,
+                    'followers_count': followers.get(user_id, 0),
+                    'suspended': suspended[user_id]
+                }
+                stage(lambda b: b.update(user_ref, counts))
+            
+            if pending:
+                batch.commit()
+            
+            return {
+                'likes': likes,
+                'follows': follows
+            }
+        except Exception as e:
+            logging_setup.log_failure(logger, 'backfill_engagement_edges', e)
             raise e
     
     def update_user_profile(self, user_id, updates):
@@ -466,7 +701,7 @@ class FirebaseService:
             self.db.collection('users').document(user_id).update(updates)
             return True
         except Exception as e:
-            print(f"Error in update_user_profile: {e}")
+            logging_setup.log_failure(logger, 'update_user_profile', e)
             raise e
     
     def upload_profile_picture(self, user_id, file):
@@ -491,7 +726,7 @@ class FirebaseService:
             
             return {'url': url}
         except Exception as e:
-            print(f"Error in upload_profile_picture: {e}")
+            logging_setup.log_failure(logger, 'upload_profile_picture', e)
             raise e
     
     # ! everything below this point has been added to support admin-api
@@ -509,12 +744,12 @@ class FirebaseService:
             admins_ref = self.db.collection('admins').document()
             admin_id = admins_ref.id
             
-            hashed_password = hashlib.sha256(password.encode()).hexdigest() # hashes the password, to change in prod for more secure hashing
+            hashed_password = passwords.hash_password(password) # salted scrypt, see passwords.py
             
             admin_data = {
                 'id': admin_id,
                 'email': email,
-                'password': hashed_password, # to change in prod
+                'password': hashed_password,
                 'name': name,
                 'created_at': firestore.SERVER_TIMESTAMP
             }
@@ -530,53 +765,86 @@ class FirebaseService:
             'name': name
             }
         except Exception as e:
-            print(f'Error in register_admin: {e}')
+            logging_setup.log_failure(logger, 'register_admin', e)
             raise e
     
     def login_admin(self, email, password):
         '''Authenticate an admin user'''
         try: 
-            hashed_password = hashlib.sha256(password.encode()).hexdigest()
-            
             admins_query = self.db.collection('admins').where('email', '==', email).limit(1).stream()
             admins = list(admins_query)
             
             if not admins:
+                passwords.dummy_verify(password) # don't reveal whether the email exists through response time
                 return None
             
             admin_doc = admins[0]
             admin_data = admin_doc.to_dict()
             
-            if admin_data.get('password') != hashed_password: # check password
+            matches, needs_rehash = passwords.verify_password(password, admin_data.get('password')) # check password
+            if not matches:
                 return None
             
-            admin_return = admin_data.copy()
-            admin_return.pop('password')
-            admin_return['id'] = admin_doc.id
+            if needs_rehash:
+                # legacy sha256 or outdated scrypt cost, upgrade now that we have the plain password
+                self.db.collection('admins').document(admin_doc.id).update({'password': passwords.hash_password(password)})
             
-            return admin_return
+            return records.ADMIN.from_dict(admin_data, admin_doc.id) # drops the password
+        except passwords.HashingBusy:
+            raise
         except Exception as e:
-            print(f'Error in login_admin: {e}')
+            logging_setup.log_failure(logger, 'login_admin', e)
             raise e
 
     def get_admin(self, admin_id):
         '''Get admin by id'''
         try:
+            if replicas.ADMINS.ensure(self.db):
+                return replicas.ADMINS.get(admin_id)
+            replicas.ADMINS.fallback()
+            
             admin_doc = self.db.collection('admins').document(admin_id).get()
             
             if not admin_doc.exists:
                 return None
             
-            admin_data = admin_doc.to_dict()
-            
-            # remove passw from return obj
-            admin_return = admin_data.copy()
-            admin_return.pop('password', None)
-            admin_return['id'] = admin_doc.id
+            return records.ADMIN.from_snapshot(admin_doc) # drops the password
+        except Exception as e:
+            logging_setup.log_failure(logger, 'get_admin', e)
+            raise e
+
+    def revoke_token(self, jti, expires_at):
+        '''Record a revoked token id until the token would have expired anyway (expires_at is unix time)'''
+        try:
+            self.db.collection('revoked_tokens').document(jti).set({
+                'expires_at': datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc), # can be used as a Firestore TTL field
+                'revoked_at': firestore.SERVER_TIMESTAMP
+            })
+        except Exception as e:
+            logging_setup.log_failure(logger, 'revoke_token', e)
+            raise e
+
+    def get_revoked_tokens(self, since=None):
+        '''(jti, expiry unix time) of tokens revoked after `since`, or of all still unexpired ones'''
+        try:
+            revoked_ref = self.db.collection('revoked_tokens')
+            if since:
+                query = revoked_ref.where('revoked_at', '>=', since)
+            else:
+                query = revoked_ref.where('expires_at', '>', datetime.datetime.now(datetime.timezone.utc))
             
-            return admin_return
+            return [(doc.id, doc.to_dict()['expires_at'].timestamp()) for doc in query.stream()]
         except Exception as e:
-            print(f'Error in get_admin: {e}')
+            logging_setup.log_failure(logger, 'get_revoked_tokens', e)
+            raise e
+
+    def get_update_time(self, collection, doc_id):
+        '''Last update time of a document (None if it doesn't exist), reads no fields'''
+        try:
+            doc = self.db.collection(collection).document(doc_id).get(field_paths=[])
+            return doc.update_time if doc.exists else None
+        except Exception as e:
+            logging_setup.log_failure(logger, 'get_update_time', e)
             raise e
 
     # Task management methods, commented out as tasks are not implemented in db yet
@@ -649,11 +917,13 @@ class FirebaseService:
     
     # User management methods
     
-    def get_all_users(self, limit=50, start_after=None):
-        '''Get all users with basic info'''
+    def get_all_users(self, limit=50, start_after=None, filters=None):
+        '''Get all users with basic info, optionally narrowed by filters.parse('users', ...)'''
         try:
+            filters = filters or []
+            query_filters.check_indexed('users', filters)
             query = (
-                self.db.collection('users')
+                query_filters.apply(self.db.collection('users'), filters)
                 .order_by('createdAt', direction=firestore.Query.DESCENDING)
                 .limit(limit)
             ) # base query
@@ -663,30 +933,19 @@ class FirebaseService:
                 if last_doc.exists:
                     query = query.start_after(last_doc)
             
-            users = []
-            for doc in query.stream():
-                user_data = doc.to_dict()
-                
-                # filtered user object wo we don't see password and other details
-                filtered_user = {
-                    'id': doc.id,
-                    'username': user_data.get('username', ''),
-                    'email': user_data.get('email', ''),
-                    'friends': len(user_data.get('friends', [])),
-                    'suspended': user_data.get('suspended', False)
-                }
-                
-                if 'createdAt' in user_data and user_data['createdAt']:
-                    filtered_user['createdAt'] = user_data['createdAt'].isoformat()
-                
-                users.append(filtered_user)
+            # summary fields only (friends as a count), Firestore sends nothing else
+            users = [records.USER_SUMMARY.from_snapshot(doc) for doc in records.USER_SUMMARY.select(query).stream()]
             
             return {
                 'users': users,
                 'last_user': users[-1]['id'] if users else None
             }
+        except query_filters.QueryNotIndexed:
+            raise
         except Exception as e:
-            print(f'Error in get_all_users: {e}')
+            if query_filters.is_missing_index(e):
+                raise query_filters.QueryNotIndexed(f'The users index for these filters is not deployed: {e}') from e
+            logging_setup.log_failure(logger, 'get_all_users', e)
             raise e
     
     ## NOT USABLE
@@ -757,6 +1016,7 @@ class FirebaseService:
             for post_id in post_ids:
                 post_ref = self.db.collection('posts').document(post_id)
                 batch.delete(post_ref)
+            batch.delete(self.db.collection(timelines.COLLECTION).document(user_id)) # feed timeline, if any
             
             batch.commit() # commit batch
             
@@ -774,7 +1034,23 @@ class FirebaseService:
                 'posts_deleted': len(post_ids)
             }
         except Exception as e:
-            print(f'Error in delete_user: {e}')
+            logging_setup.log_failure(logger, 'delete_user', e)
+            raise e
+    
+    def rebuild_timeline(self, user_id, admin_id=None):
+        '''Rebuild a user's precomputed feed timeline from their and their friends' posts'''
+        try:
+            entries = timelines.rebuild(self.db, user_id)
+            
+            if admin_id:
+                self.log_admin_action(admin_id, 'TIMELINE_REBUILT', {
+                    'user_id': user_id,
+                    'entries': entries
+                })
+            
+            return entries
+        except Exception as e:
+            logging_setup.log_failure(logger, 'rebuild_timeline', e)
             raise e
     
     def suspend_user(self, user_id, suspended=True, admin_id=None):
@@ -801,16 +1077,18 @@ class FirebaseService:
             
             return True
         except Exception as e:
-            print(f'Error in suspend_user: {e}')
+            logging_setup.log_failure(logger, 'suspend_user', e)
             raise e
     
     # Post Management methods
     
-    def get_all_posts(self, limit=50, start_after=None):
-        '''Get all posts with a specific limit'''
+    def get_all_posts(self, limit=50, start_after=None, filters=None):
+        '''Get all posts with a specific limit, optionally narrowed by filters.parse('posts', ...)'''
         try:
+            filters = filters or []
+            query_filters.check_indexed('posts', filters)
             query = (
-                self.db.collection('posts')
+                query_filters.apply(self.db.collection('posts'), filters)
                 .order_by('createdAt', direction=firestore.Query.DESCENDING)
                 .limit(limit)
             )
@@ -820,26 +1098,19 @@ class FirebaseService:
                 if last_doc.exists:
                     query = query.start_after(last_doc)
             
-            posts = []
-            for doc in query.stream():
-                post_data = doc.to_dict()
-                post_data['id'] = doc.id
-                
-                # convert timestamp to str
-                if 'createdAt' in post_data and post_data['createdAt']:
-                    post_data['createdAt'] = post_data['createdAt'].isoformat()
-                
-                # count comments and likes
-                post_data['commentCount'] = len(post_data.get('comments', []))
-                post_data['likeCount'] = len(post_data.get('likes', []))
-                posts.append(post_data)
+            # posts with their comment and like counts
+            posts = [records.POST_WITH_COUNTS.from_snapshot(doc) for doc in query.stream()]
             
             return {
                 'posts': posts,
                 'last_post': posts[-1]['id'] if posts else None
             }
+        except query_filters.QueryNotIndexed:
+            raise
         except Exception as e:
-            print(f'Error in suspend_user: {e}')
+            if query_filters.is_missing_index(e):
+                raise query_filters.QueryNotIndexed(f'The posts index for these filters is not deployed: {e}') from e
+            logging_setup.log_failure(logger, 'get_all_posts', e)
             raise e
     
     def delete_post(self, post_id, admin_id=None):
@@ -853,7 +1124,11 @@ class FirebaseService:
             
             post_data = post_doc.to_dict()
             
-            post_ref.delete() # delete post
+            # delete post, and its moderation queue item so it can't be listed or claimed any more
+            batch = self.db.batch()
+            batch.delete(post_ref)
+            batch.delete(self.db.collection(moderation.COLLECTION).document(post_id)) # ! Added for admin-api
+            batch.commit()
             
             if admin_id:
                 self.log_admin_action(admin_id, 'POST_DELETED', {
@@ -864,7 +1139,37 @@ class FirebaseService:
             
             return True
         except Exception as e:
-            print(f'Error in delete_post: {e}')
+            logging_setup.log_failure(logger, 'delete_post', e)
+            raise e
+    
+    def delete_posts(self, post_ids, admin_id=None): # ! Added for admin-api
+        '''Delete several posts in batched writes (e.g. a cluster of near-duplicates), returns {deleted, missing}'''
+        try:
+            post_ids = list(dict.fromkeys(post_ids))
+            refs = [self.db.collection('posts').document(post_id) for post_id in post_ids]
+            found = {doc.id: doc for doc in self.db.get_all(refs, field_paths=['userId']) if doc.exists}
+            deleted = [post_id for post_id in post_ids if post_id in found]
+            
+            # each post goes with its moderation queue item, Firestore caps a batch at 500 writes
+            for start in range(0, len(deleted), 250):
+                batch = self.db.batch()
+                for post_id in deleted[start:start + 250]:
+                    batch.delete(found[post_id].reference)
+                    batch.delete(self.db.collection(moderation.COLLECTION).document(post_id))
+                batch.commit()
+            
+            if admin_id and deleted:
+                self.log_admin_action(admin_id, 'POSTS_DELETED', {
+                    'post_ids': deleted,
+                    'user_ids': sorted({found[post_id].to_dict().get('userId') for post_id in deleted} - {None})
+                })
+            
+            return {
+                'deleted': deleted,
+                'missing': [post_id for post_id in post_ids if post_id not in found]
+            }
+        except Exception as e:
+            logging_setup.log_failure(logger, 'delete_posts', e)
             raise e
     
     def update_post_content(self, post_id, new_content, admin_id=None):
@@ -895,7 +1200,7 @@ class FirebaseService:
             
             return True
         except Exception as e:
-            print(f'Error in update_post_content: {e}')
+            logging_setup.log_failure(logger, 'update_post_content', e)
             raise e
     
     def delete_comment(self, post_id, comment_id, admin_id=None):
@@ -924,7 +1229,8 @@ class FirebaseService:
                 raise Exception('Comment not found')
             
             post_ref.update({
-                'comments': new_comments
+                'comments': new_comments,
+                'commentCount': len(new_comments)
             })
             
             if admin_id:
@@ -937,9 +1243,85 @@ class FirebaseService:
             
             return True
         except Exception as e:
-            print(f'Error in delete_comment: {e}')
+            logging_setup.log_failure(logger, 'delete_comment', e)
             raise e
 
+    # Moderation queue methods (see moderation.py)
+    
+    def _duplicate_counts(self):
+        '''Near-duplicate counts for scoring, None until the duplicates index of this process is ready (starts it)'''
+        index = getattr(self, 'duplicate_index', None)
+        if index is None or not index.ensure_started(self.db):
+            return None
+        return lambda post_id: len(index.similar(post_id, limit=100)) # scored as log(1 + n), more changes little
+    
+    def get_moderation_queue(self, limit=20):
+        '''The best open moderation items with their posts, without claiming them'''
+        try:
+            moderation.ensure_scoring(self.db, duplicates=self._duplicate_counts)
+            return moderation.hydrate(self.db, moderation.top(self.db, limit=limit))
+        except Exception as e:
+            logging_setup.log_failure(logger, 'get_moderation_queue', e)
+            raise e
+    
+    def claim_moderation_items(self, admin_id, count=1, lease_seconds=moderation.LEASE_SECONDS):
+        '''Lease the best open moderation items to an admin'''
+        try:
+            moderation.ensure_scoring(self.db, duplicates=self._duplicate_counts)
+            return moderation.hydrate(self.db, moderation.claim(self.db, admin_id, count=count, lease_seconds=lease_seconds))
+        except Exception as e:
+            logging_setup.log_failure(logger, 'claim_moderation_items', e)
+            raise e
+    
+    def release_moderation_item(self, post_id, admin_id):
+        '''Give a claimed moderation item back to the queue'''
+        try:
+            moderation.release(self.db, post_id, admin_id)
+            return True
+        except Exception as e:
+            logging_setup.log_failure(logger, 'release_moderation_item', e)
+            raise e
+    
+    def resolve_moderation_item(self, post_id, admin_id, resolution, note=None):
+        '''Close a claimed moderation item, deleting the post when the resolution is delete'''
+        try:
+            if resolution not in moderation.RESOLUTIONS:
+                raise Exception(f"Unknown resolution {resolution}, expected {' or '.join(moderation.RESOLUTIONS)}")
+            
+            item = moderation.resolve(self.db, post_id, admin_id, resolution, note=note)
+            
+            if resolution == 'delete':
+                try:
+                    self.delete_post(post_id, admin_id=admin_id)
+                except Exception as e:
+                    if str(e) != 'Post not found': # already gone is what was asked for
+                        raise
+            
+            self.log_admin_action(admin_id, 'MODERATION_RESOLVED', {
+                'post_id': post_id,
+                'resolution': resolution,
+                'score': item.get('score'),
+                'note': note
+            })
+            
+            return True
+        except Exception as e:
+            logging_setup.log_failure(logger, 'resolve_moderation_item', e)
+            raise e
+    
+    def rescore_moderation_queue(self, admin_id=None):
+        '''Score the recent posts for the moderation queue now'''
+        try:
+            result = moderation.score_recent(self.db, duplicates=self._duplicate_counts)
+            
+            if admin_id:
+                self.log_admin_action(admin_id, 'MODERATION_RESCORED', result)
+            
+            return result
+        except Exception as e:
+            logging_setup.log_failure(logger, 'rescore_moderation_queue', e)
+            raise e
+    
     # Analytics methods
 
     def get_analytics_summary(self, days=30): # Can be refactored
@@ -1009,14 +1391,18 @@ class FirebaseService:
                 'period_days': days
             }
         except Exception as e:
-            print(f'Error in get_analytics_summary: {e}')
+            logging_setup.log_failure(logger, 'get_analytics_summary', e)
             raise e
     
     def get_community_task_stats(self):
         '''Get stats about community tasks'''
         try:
-            tasks_query = self.db.collection('community_tasks').stream()
-            tasks = [doc.to_dict() for doc in tasks_query]
+            # per-task summaries, kept current by the replica's listener or read now (see replicas.py)
+            if replicas.TASKS.ensure(self.db):
+                tasks = replicas.TASKS.values()
+            else:
+                replicas.TASKS.fallback()
+                tasks = [replicas.task_summary(doc) for doc in self.db.collection('community_tasks').stream()]
             
             now = datetime.datetime.now(datetime.timezone.utc)
             
@@ -1063,10 +1449,8 @@ class FirebaseService:
                 else:
                     expired_tasks += 1
                 
-                participants = task.get('participants', [])
-                completed_by = task.get('completed_by', [])
-                total_participants += len(participants)
-                total_completions += len(completed_by)
+                total_participants += task['participants']
+                total_completions += task['completed_by']
                 
                 category = task.get('category', 'Uncategorized')
                 if category not in tasks_by_category:
@@ -1085,7 +1469,7 @@ class FirebaseService:
                 'tasks_by_category': category_stats
             }
         except Exception as e:
-            print(f'Error in get_community_tasks: {e}')
+            logging_setup.log_failure(logger, 'get_community_task_stats', e)
             raise e
 
     # NOT USABLE
@@ -1202,13 +1586,12 @@ class FirebaseService:
             log_ref.set(log_data)
             return log_ref.id
         except Exception as e:
-            print(f'Error in log_admin_actions: {e}')
+            logging_setup.log_failure(logger, 'log_admin_action', e)
             raise e
     
     def get_admin_logs(self, limit=100):
         '''Get admin activity logs'''
         try:
-            logs = []
             logs_query = (
                 self.db.collection('admin_logs')
                 .order_by('timestamp', direction=firestore.Query.DESCENDING)
@@ -1216,17 +1599,9 @@ class FirebaseService:
                 .stream()
             )
             
-            for doc in logs_query:
-                log_data = doc.to_dict()
-                log_data['id'] = doc.id
-                
-                if 'timestamp' in log_data and log_data['timestamp']: # convert time stamp to string if it exists
-                    log_data['timestamp'] = log_data['timestamp'].isoformat()
-                logs.append(log_data)
-            
-            return logs
+            return [records.ADMIN_LOG.from_snapshot(doc) for doc in logs_query]
         except Exception as e:
-            print(f'Error in get_admins_logs: {e}')
+            logging_setup.log_failure(logger, 'get_admin_logs', e)
             raise e
     
     # Community features
@@ -1281,7 +1656,7 @@ class FirebaseService:
             
             return response_data
         except Exception as e:
-            print(f'Error in create_community_task: {e}')
+            logging_setup.log_failure(logger, 'create_community_task', e)
             raise e
     
     def delete_community_task(self, task_id, admin_id=None):
@@ -1320,7 +1695,7 @@ class FirebaseService:
             
             return True
         except Exception as e:
-            print(f'Error in delete_community_task: {e}')
+            logging_setup.log_failure(logger, 'delete_community_task', e)
             raise e
     
     def get_community_tasks(self, limit=50, start_after=None):
@@ -1337,46 +1712,25 @@ class FirebaseService:
                 if last_doc.exists:
                     query = query.start_after(last_doc)
             
-            tasks = []
-            for doc in query.stream():
-                task_data = doc.to_dict()
-                task_data['id'] = doc.id
-                
-                if 'created_at' in task_data and task_data['created_at']:
-                    task_data['created_at'] = task_data['created_at'].isoformat()
-                if 'deadline' in task_data and task_data['deadline']:
-                    if isinstance(task_data['deadline'], datetime.datetime):
-                        task_data['deadline'] = task_data['deadline'].isoformat()
-                
-                task_data['participants_count'] = len(task_data.get('participants', []))
-                task_data['completed_count'] = len(task_data.get('completed_by', []))
-                
-                tasks.append(task_data)
+            tasks = [records.TASK_WITH_COUNTS.from_snapshot(doc) for doc in query.stream()]
 
             return {
                 'tasks': tasks,
                 'last_task': tasks[-1]['id'] if tasks else None
             }
         except Exception as e:
-            print(f'Error in get_community_tasks: {e}')
+            logging_setup.log_failure(logger, 'get_community_tasks', e)
             raise e
     
-    def get_community_task(self, task_id):
-        '''Get details of a specific community task'''
+    def get_community_task(self, task_id, versioned=False):
+        '''Get details of a specific community task, with versioned=True returns (task, update_time)'''
         try:
             task_doc = self.db.collection('community_tasks').document(task_id).get()
             
             if not task_doc.exists:
                 raise Exception('Community task not found')
             
-            task_data = task_doc.to_dict()
-            task_data['id'] = task_doc.id
-            
-            if 'created_at' in task_data and task_data['created_at']:
-                    task_data['created_at'] = task_data['created_at'].isoformat()
-            if 'deadline' in task_data and task_data['deadline']:
-                if isinstance(task_data['deadline'], datetime.datetime):
-                    task_data['deadline'] = task_data['deadline'].isoformat()
+            task_data = records.TASK.from_snapshot(task_doc)
             
             participants = []
             if task_data.get('participants'):
@@ -1405,9 +1759,11 @@ class FirebaseService:
             task_data['participants'] = participants
             task_data['completed_by'] = completed_by
             
+            if versioned:
+                return task_data, task_doc.update_time
             return task_data
         except Exception as e:
-            print(f'Error in get_community_task: {e}')
+            logging_setup.log_failure(logger, 'get_community_task', e)
             raise e
     
     def update_community_task(self, task_id, updates, admin_id=None):
@@ -1437,58 +1793,43 @@ class FirebaseService:
                     'changes': list(updates.keys())
                 })
             
-            updated_task = task_ref.get().to_dict()
-            updated_task['id'] = task_id
-            
-            if 'created_at' in updated_task and updated_task['created_at']:
-                updated_task['created_at'] = updated_task['created_at'].isoformat()
-            if 'updated_at' in updated_task and updated_task['updated_at']:
-                updated_task['updated_at'] = updated_task['updated_at'].isoformat()
-            if 'deadline' in updated_task and updated_task['deadline']:
-                if isinstance(updated_task['deadline'], datetime.datetime):
-                    updated_task['deadline'] = updated_task['deadline'].isoformat()
-            
-            return updated_task
+            return records.TASK.from_snapshot(task_ref.get())
         except Exception as e:
-            print(f'Error in update_community_task: {e}')
+            logging_setup.log_failure(logger, 'update_community_task', e)
             raise e
     
     def get_task_categories(self):
         '''Get all community task categories'''
         try:
-            categories = []
+            if replicas.CATEGORIES.ensure(self.db):
+                return [category.copy() for category in replicas.CATEGORIES.values()]
+            replicas.CATEGORIES.fallback()
+            
             categories_query = self.db.collection('categories').stream()
             
-            for doc in categories_query:
-                category_data = doc.to_dict()
-                category_data['id'] = doc.id
-                
-                if 'created_at' in category_data and category_data['created_at']:
-                    category_data['created_at'] = category_data['created_at'].isoformat()
-                
-                categories.append(category_data)
-            return categories
+            return [records.CATEGORY.from_snapshot(doc) for doc in categories_query]
         except Exception as e:
-            print(f'Error in get_task_categories: {e}')
+            logging_setup.log_failure(logger, 'get_task_categories', e)
             raise e
     
     def get_task_category(self, category_id):
         '''Get details of a specific category'''
         try:
+            if replicas.CATEGORIES.ensure(self.db):
+                category = replicas.CATEGORIES.get(category_id)
+                if category is None:
+                    raise Exception('Category not found')
+                return category
+            replicas.CATEGORIES.fallback()
+            
             category_doc = self.db.collection('categories').document(category_id).get()
             
             if not category_doc.exists:
                 raise Exception('Category not found')
             
-            category_data = category_doc.to_dict()
-            category_data['id'] = category_doc.id
-            
-            if 'created_at' in category_data and category_data['created_at']:
-                category_data['created_at'] = category_data['created_at'].isoformat()
-            
-            return category_data
+            return records.CATEGORY.from_snapshot(category_doc)
         except Exception as e:
-            print(f'Error in get_task_category: {e}')
+            logging_setup.log_failure(logger, 'get_task_category', e)
             raise e
     
     def update_task_category(self, category_id, updates, admin_id):
@@ -1513,17 +1854,9 @@ class FirebaseService:
                     'changes': list(updates.keys())
                 })
             
-            updated_category = category_ref.get().to_dict()
-            updated_category['id'] = category_id
-            
-            if 'created_at' in updated_category and updated_category['created_at']:
-                updated_category['created_at'] = updated_category['created_at'].isoformat()
-            if 'updated_at' in updated_category and updated_category['updated_at']:
-                updated_category['updated_at'] = updated_category['updated_at'].isoformat()
-            
-            return updated_category
+            return records.CATEGORY.from_snapshot(category_ref.get())
         except Exception as e:
-            print(f'Error in update_task_category: {e}')
+            logging_setup.log_failure(logger, 'update_task_category', e)
             raise e
     
     def create_community_task_category(self, category_name, category_type, description, admin_id=None):
@@ -1563,7 +1896,7 @@ class FirebaseService:
                 'description': description
             }
         except Exception as e:
-            print(f'Error in create_community_task_category: {e}')
+            logging_setup.log_failure(logger, 'create_community_task_category', e)
             raise e
     
     def delete_community_task_category(self, category_id, admin_id=None):
@@ -1593,5 +1926,5 @@ class FirebaseService:
             
             return True
         except Exception as  e:
-            print(f'Error in delete_community_task_category: {e}')
+            logging_setup.log_failure(logger, 'delete_community_task_category', e)
             raise e
\ No newline at end of file
@@ -0,0 +1,80 @@
+# gunicorn.conf.py
+'''
+Production server settings for the admin API (used by `python -m serve` or `gunicorn -c gunicorn.conf.py wsgi:app`).
+Every setting can be overridden through the environment.
+'''
+import multiprocessing
+import os
+import shutil
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', 5001)}")
+
+# request handlers mostly wait on Firestore, so each worker runs a pool of threads (gthread)
+# or greenlets (gevent); processes are for using more than one core
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8)) # gthread only
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200)) # gevent only
+
+# a worker is killed after `timeout` seconds without reporting in; on SIGTERM/HUP workers stop
+# accepting connections and get `graceful_timeout` seconds to drain in-flight requests
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# recycle workers now and then so slow leaks can't build up (jitter avoids restarting all at once)
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 500))
+
+# preloading shares the imported app between workers (faster boot, less memory); Firestore clients
+# are created on first use, so each worker makes its own (post_fork below drops any from the master)
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
+
+# workers connect to Firestore before taking requests (see admin_api.warm_up); 0 connects on first use
+WARM_UP = os.environ.get('WARM_UP', '1') == '1'
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') # request metrics are on /metrics already
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+
+
+def on_starting(server):
+    # counters from a previous deployment must not leak into this one's /metrics
+    multiproc_dir = os.environ.get('METRICS_MULTIPROC_DIR')
+    if multiproc_dir and os.path.isdir(multiproc_dir):
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+
+
+def post_fork(server, worker):
+    if server.cfg.worker_class_str == 'gevent':
+        # gRPC has to cooperate with gevent's event loop before any channel is created
+        import grpc.experimental.gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+
+    if server.cfg.preload_app:
+        # the app (and its Firestore client) was created in the master, give this worker its own
+        import admin_api
+        admin_api.init_worker()
+
+
+def post_worker_init(worker):
+    if WARM_UP:
+        import admin_api
+        try:
+            admin_api.warm_up()
+        except Exception as e:
+            # the worker still starts, /ready reports 503 until Firestore is reachable
+            worker.log.warning('Warm-up failed, connecting on first use: %s', e)
+
+
+def worker_exit(server, worker):
+    # make sure this worker's last samples are included in /metrics
+    import metrics
+    metrics.flush(force=True)
+
+
+def child_exit(server, worker):
+    # runs in the master, one exited worker at a time (also for killed workers, which skip
+    # worker_exit): keep its counters in the archive and delete its samples file
+    import metrics
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,367 @@
+# instrumentation.py
+'''
+Per-request Firestore accounting.
+
+InstrumentedClient wraps the Firestore client that FirebaseService uses and counts documents
+read and written, round trips and time spent waiting on Firestore. Counts are attributed to the
+current request (exposed as a Server-Timing header) and aggregated per route.
+'''
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# requests over either budget are logged as slow
+READ_BUDGET = int(os.environ.get('FIRESTORE_READ_BUDGET', 500))
+LATENCY_BUDGET_MS = float(os.environ.get('SLOW_REQUEST_MS', 1000))
+
+
+class RequestStats:
+    '''Firestore usage of a single request'''
+
+    def __init__(self):
+        self.lock = threading.Lock() # fan-out helpers can record from several threads
+        self.started = time.perf_counter()
+        self.reads = 0
+        self.writes = 0
+        self.round_trips = 0
+        self.firestore_seconds = 0.0
+
+    def add(self, reads=0, writes=0, round_trips=0, seconds=0.0):
+        with self.lock:
+            self.reads += reads
+            self.writes += writes
+            self.round_trips += round_trips
+            self.firestore_seconds += seconds
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+class RouteTotals:
+    '''Firestore usage aggregated per route since process start'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = dict()
+
+    def add(self, route, stats, elapsed_ms, slow):
+        with self.lock:
+            totals = self.routes.setdefault(route, {
+                'requests': 0,
+                'reads': 0,
+                'writes': 0,
+                'round_trips': 0,
+                'firestore_ms': 0.0,
+                'total_ms': 0.0,
+                'max_reads': 0,
+                'slow_requests': 0,
+            })
+            totals['requests'] += 1
+            totals['reads'] += stats.reads
+            totals['writes'] += stats.writes
+            totals['round_trips'] += stats.round_trips
+            totals['firestore_ms'] += stats.firestore_seconds * 1000
+            totals['total_ms'] += elapsed_ms
+            totals['max_reads'] = max(totals['max_reads'], stats.reads)
+            if slow:
+                totals['slow_requests'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            result = dict()
+            for route, totals in self.routes.items():
+                count = totals['requests'] or 1
+                result[route] = dict(totals)
+                result[route]['avg_reads'] = totals['reads'] / count
+                result[route]['avg_firestore_ms'] = totals['firestore_ms'] / count
+                result[route]['avg_total_ms'] = totals['total_ms'] / count
+            return result
+
+
+_current = contextvars.ContextVar('firestore_request_stats', default=None)
+_background = RequestStats() # usage outside of a request (startup, background threads)
+route_totals = RouteTotals()
+
+
+def current_stats():
+    return _current.get()
+
+
+def attach(stats):
+    '''Make `stats` the current request's accounting in this context (e.g. another thread or event loop)'''
+    return _current.set(stats)
+
+
+def detach(token):
+    _current.reset(token)
+
+
+def record(reads=0, writes=0, round_trips=0, seconds=0.0):
+    '''Attribute Firestore usage to the current request'''
+    stats = _current.get() or _background
+    stats.add(reads=reads, writes=writes, round_trips=round_trips, seconds=seconds)
+
+
+def route_name():
+    '''Stable route label like "GET /api/admin/posts/<post_id>"'''
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    return f'{request.method} {rule}'
+
+
+# Firestore client wrappers
+
+def _unwrap(obj):
+    return getattr(obj, '_wrapped', obj)
+
+
+class _Wrapper:
+    def __init__(self, wrapped):
+        self._wrapped = wrapped
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+
+class InstrumentedDocument(_Wrapper):
+    def get(self, *args, **kwargs):
+        if kwargs.get('transaction') is not None:
+            kwargs['transaction'] = _unwrap(kwargs['transaction'])
+        started = time.perf_counter()
+        snapshot = self._wrapped.get(*args, **kwargs)
+        record(reads=1, round_trips=1, seconds=time.perf_counter() - started)
+        return snapshot
+
+    def _write(self, method, *args, **kwargs):
+        started = time.perf_counter()
+        result = getattr(self._wrapped, method)(*args, **kwargs)
+        record(writes=1, round_trips=1, seconds=time.perf_counter() - started)
+        return result
+
+    def set(self, *args, **kwargs):
+        return self._write('set', *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._write('update', *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._write('create', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write('delete', *args, **kwargs)
+
+    def collection(self, *args, **kwargs):
+        return InstrumentedQuery(self._wrapped.collection(*args, **kwargs))
+
+
+class InstrumentedQuery(_Wrapper):
+    '''Wraps collection references and queries; chained calls stay instrumented'''
+
+    def _chain(self, method, *args, **kwargs):
+        args = [_unwrap(arg) for arg in args]
+        return InstrumentedQuery(getattr(self._wrapped, method)(*args, **kwargs))
+
+    def where(self, *args, **kwargs):
+        return self._chain('where', *args, **kwargs)
+
+    def order_by(self, *args, **kwargs):
+        return self._chain('order_by', *args, **kwargs)
+
+    def limit(self, *args, **kwargs):
+        return self._chain('limit', *args, **kwargs)
+
+    def limit_to_last(self, *args, **kwargs):
+        return self._chain('limit_to_last', *args, **kwargs)
+
+    def offset(self, *args, **kwargs):
+        return self._chain('offset', *args, **kwargs)
+
+    def select(self, *args, **kwargs):
+        return self._chain('select', *args, **kwargs)
+
+    def start_at(self, *args, **kwargs):
+        return self._chain('start_at', *args, **kwargs)
+
+    def start_after(self, *args, **kwargs):
+        return self._chain('start_after', *args, **kwargs)
+
+    def end_at(self, *args, **kwargs):
+        return self._chain('end_at', *args, **kwargs)
+
+    def end_before(self, *args, **kwargs):
+        return self._chain('end_before', *args, **kwargs)
+
+    def document(self, *args, **kwargs):
+        return InstrumentedDocument(self._wrapped.document(*args, **kwargs))
+
+    def add(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = self._wrapped.add(*args, **kwargs)
+        record(writes=1, round_trips=1, seconds=time.perf_counter() - started)
+        return result
+
+    def stream(self, *args, **kwargs):
+        # time is only counted while blocked on Firestore, not while the caller processes documents
+        record(round_trips=1)
+        iterator = iter(self._wrapped.stream(*args, **kwargs))
+        while True:
+            started = time.perf_counter()
+            try:
+                doc = next(iterator)
+            except StopIteration:
+                record(seconds=time.perf_counter() - started)
+                return
+            record(reads=1, seconds=time.perf_counter() - started)
+            yield doc
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+    def count(self, *args, **kwargs):
+        return InstrumentedAggregation(self._wrapped.count(*args, **kwargs))
+
+
+class InstrumentedAggregation(_Wrapper):
+    def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = self._wrapped.get(*args, **kwargs)
+        # billed as one read per batch of up to 1000 index entries, count the minimum
+        record(reads=1, round_trips=1, seconds=time.perf_counter() - started)
+        return result
+
+
+class InstrumentedBatch(_Wrapper):
+    def __init__(self, wrapped):
+        super().__init__(wrapped)
+        self._operations = 0
+
+    def set(self, reference, *args, **kwargs):
+        self._operations += 1
+        return self._wrapped.set(_unwrap(reference), *args, **kwargs)
+
+    def update(self, reference, *args, **kwargs):
+        self._operations += 1
+        return self._wrapped.update(_unwrap(reference), *args, **kwargs)
+
+    def create(self, reference, *args, **kwargs):
+        self._operations += 1
+        return self._wrapped.create(_unwrap(reference), *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        self._operations += 1
+        return self._wrapped.delete(_unwrap(reference), *args, **kwargs)
+
+    def commit(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = self._wrapped.commit(*args, **kwargs)
+        record(writes=self._operations, round_trips=1, seconds=time.perf_counter() - started)
+        self._operations = 0
+        return result
+
+
+class InstrumentedTransaction(InstrumentedBatch):
+    # firestore.transactional commits through _commit(), a retried attempt starts over from _clean_up()
+    def _commit(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = self._wrapped._commit(*args, **kwargs)
+        record(writes=self._operations, round_trips=1, seconds=time.perf_counter() - started)
+        self._operations = 0
+        return result
+
+    def _clean_up(self, *args, **kwargs):
+        self._operations = 0
+        return self._wrapped._clean_up(*args, **kwargs)
+
+
+class InstrumentedClient(_Wrapper):
+    def collection(self, *args, **kwargs):
+        return InstrumentedQuery(self._wrapped.collection(*args, **kwargs))
+
+    def document(self, *args, **kwargs):
+        return InstrumentedDocument(self._wrapped.document(*args, **kwargs))
+
+    def batch(self, *args, **kwargs):
+        return InstrumentedBatch(self._wrapped.batch(*args, **kwargs))
+
+    def transaction(self, *args, **kwargs):
+        return InstrumentedTransaction(self._wrapped.transaction(*args, **kwargs))
+
+    def get_all(self, references, *args, **kwargs):
+        record(round_trips=1)
+        references = [_unwrap(reference) for reference in references]
+        if kwargs.get('transaction') is not None:
+            kwargs['transaction'] = _unwrap(kwargs['transaction'])
+        iterator = iter(self._wrapped.get_all(references, *args, **kwargs))
+        while True:
+            started = time.perf_counter()
+            try:
+                snapshot = next(iterator)
+            except StopIteration:
+                record(seconds=time.perf_counter() - started)
+                return
+            record(reads=1, seconds=time.perf_counter() - started)
+            yield snapshot
+
+
+def instrument_service(service):
+    '''Route all of a FirebaseService's Firestore calls through the accounting wrappers'''
+    wrap_client = getattr(service, 'wrap_client', None)
+    if wrap_client is not None:
+        wrap_client(InstrumentedClient) # without connecting, the client may not exist yet
+    elif not isinstance(service.db, InstrumentedClient):
+        service.db = InstrumentedClient(service.db)
+    return service
+
+
+# Flask integration
+
+def _server_timing(stats, elapsed_ms):
+    return ', '.join([
+        f'firestore;dur={stats.firestore_seconds * 1000:.2f};desc="Firestore"',
+        f'fs-reads;desc="{stats.reads}"',
+        f'fs-writes;desc="{stats.writes}"',
+        f'fs-rpcs;desc="{stats.round_trips}"',
+        f'app;dur={elapsed_ms:.2f}',
+    ])
+
+
+def init_app(app):
+    '''Track Firestore usage for every request handled by app'''
+
+    @app.before_request
+    def start_firestore_accounting():
+        g.firestore_stats_token = _current.set(RequestStats())
+
+    @app.after_request
+    def finish_firestore_accounting(response):
+        stats = _current.get()
+        if stats is None:
+            return response
+
+        elapsed_ms = stats.elapsed_ms()
+        route = route_name()
+        slow = stats.reads > READ_BUDGET or elapsed_ms > LATENCY_BUDGET_MS
+        route_totals.add(route, stats, elapsed_ms, slow)
+
+        response.headers['Server-Timing'] = _server_timing(stats, elapsed_ms)
+        if slow:
+            logger.warning(
+                'Slow request %s: %.1f ms total, %.1f ms in Firestore, %d reads, %d writes, %d round trips',
+                route, elapsed_ms, stats.firestore_seconds * 1000, stats.reads, stats.writes, stats.round_trips
+            )
+        return response
+
+    @app.teardown_request
+    def reset_firestore_accounting(exc):
+        token = g.pop('firestore_stats_token', None)
+        if token is None:
+            return
+        try:
+            _current.reset(token)
+        except ValueError: # teardown ran in a different context than before_request
+            _current.set(None)
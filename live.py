@@ -0,0 +1,294 @@
+# live.py
+'''
+Live dashboard updates over Server-Sent Events (GET /api/admin/live).
+
+Instead of polling /api/admin/logs and /api/admin/analytics/summary, a dashboard keeps one
+stream open and receives:
+
+    event: ready      connected; fetch the logs and the summary once, then apply what follows
+    event: log        a new admin_logs entry
+    event: counters   deltas to add to the summary, e.g. {"total_posts": 2, "new_posts": 2, "total_comments": 1}
+    event: resync     events may have been missed, fetch the logs and the summary again
+    : heartbeat       a comment every LIVE_HEARTBEAT_SECONDS, keeps proxies from closing the stream
+
+All streams of a worker process share one Hub, which attaches a single set of Firestore
+snapshot listeners (new admin_logs, users and posts) while at least one dashboard is connected
+and detaches them when the last one leaves, so N dashboards cost one listener per process
+instead of N pollers. The listeners only watch documents created since they attached; they
+start over every LIVE_WINDOW_SECONDS so their state stays small, and every stream gets a
+resync then (the summary's totals don't see deletions of older documents, the refetch
+corrects them). Comment deltas cover posts created in the window.
+
+Listener callbacks never block on a dashboard: each connection has its own queue of at most
+LIVE_QUEUE_SIZE log events, counter deltas are summed in place, and a connection whose queue
+overflows drops it and gets a resync instead. Each stream holds a server thread (or greenlet),
+so a process serves at most LIVE_MAX_CONNECTIONS streams and ends each after LIVE_MAX_SECONDS;
+EventSource clients reconnect by themselves. Use the gevent worker class for many dashboards.
+'''
+import collections
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import Response
+
+import encoding
+import metrics
+import records
+
+QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE', 100))
+HEARTBEAT_SECONDS = float(os.environ.get('LIVE_HEARTBEAT_SECONDS', 15))
+MAX_CONNECTIONS = int(os.environ.get('LIVE_MAX_CONNECTIONS', 4))
+MAX_SECONDS = float(os.environ.get('LIVE_MAX_SECONDS', 3600))
+WINDOW_SECONDS = float(os.environ.get('LIVE_WINDOW_SECONDS', 3600))
+RETRY_SECONDS = float(os.environ.get('LIVE_RETRY_SECONDS', 30))
+RECONNECT_MS = 5000 # how long EventSource clients wait before reconnecting
+
+CONNECTIONS = metrics.registry.gauge('admin_api_live_connections', 'Open live dashboard streams')
+LISTENERS = metrics.registry.gauge('admin_api_live_listeners', 'Snapshot listeners attached for live dashboards')
+EVENTS = metrics.registry.counter('admin_api_live_events_total', 'Events sent on live dashboard streams', ('event',))
+OVERFLOWS = metrics.registry.counter('admin_api_live_overflows_total', 'Live dashboard queues that overflowed and were resynced')
+
+logger = logging.getLogger(__name__)
+
+
+class TooManyConnections(Exception):
+    '''This process already serves LIVE_MAX_CONNECTIONS streams'''
+
+
+class Connection:
+    '''One dashboard's pending events, filled by the listeners and drained by its stream'''
+
+    def __init__(self, admin_id):
+        self.admin_id = admin_id
+        self.opened_at = time.time()
+        self.condition = threading.Condition()
+        self.logs = collections.deque()
+        self.counters = dict() # summary field -> delta not sent yet
+        self.resync = None # reason, replaces the queued logs
+
+    def push_log(self, log):
+        with self.condition:
+            if self.resync is None:
+                if len(self.logs) >= QUEUE_SIZE:
+                    self.logs.clear()
+                    self.resync = 'overflow'
+                    OVERFLOWS.inc()
+                else:
+                    self.logs.append(log)
+            self.condition.notify()
+
+    def push_counters(self, deltas):
+        with self.condition:
+            for name, delta in deltas.items():
+                self.counters[name] = self.counters.get(name, 0) + delta
+            self.condition.notify()
+
+    def push_resync(self, reason):
+        with self.condition:
+            self.logs.clear()
+            self.counters.clear() # the refetched summary includes them
+            self.resync = reason
+            self.condition.notify()
+
+    def take(self, timeout):
+        '''[(event, data)] pending, waiting up to timeout seconds for one'''
+        with self.condition:
+            if not (self.logs or self.counters or self.resync):
+                self.condition.wait(timeout)
+            if self.resync is not None:
+                events = [('resync', {'reason': self.resync})]
+            else:
+                events = [('log', log) for log in self.logs]
+            counters = {name: delta for name, delta in self.counters.items() if delta}
+            if counters:
+                events.append(('counters', counters))
+            self.logs.clear()
+            self.counters.clear()
+            self.resync = None
+            return events
+
+
+class Hub:
+    '''The snapshot listeners of this process and the connections they fan out to'''
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.connections = set()
+        self.client = None
+        self.watches = []
+        self.state = 'detached' # attached or failed
+        self.window_start = None
+        self.failed_at = None
+        self.posts = dict() # post id -> comment count, for posts created in the window
+
+    # connections
+
+    def subscribe(self, db, admin_id):
+        with self.lock:
+            if self.pid != os.getpid():
+                self._reset() # inherited through fork, the listeners belong to the parent
+            if len(self.connections) >= MAX_CONNECTIONS:
+                raise TooManyConnections(f'At most {MAX_CONNECTIONS} live dashboards per server process, try again later')
+            connection = Connection(admin_id)
+            self.connections.add(connection)
+            CONNECTIONS.set(len(self.connections))
+        self.ensure(db)
+        return connection
+
+    def unsubscribe(self, connection):
+        with self.lock:
+            self.connections.discard(connection)
+            CONNECTIONS.set(len(self.connections))
+            if not self.connections and self.state != 'detached':
+                self._detach() # nobody is watching, stop paying for the listeners
+
+    def _broadcast(self, push, *args):
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            push(connection, *args)
+
+    # listeners
+
+    def ensure(self, db):
+        '''Attach, re-attach after a failure or start a new window, as needed'''
+        client = getattr(db, '_wrapped', db) # listener reads aren't request reads
+        with self.lock:
+            if not self.connections:
+                return
+            if any(getattr(watch, '_closed', False) for watch in self.watches):
+                self._fail('listener closed')
+            now = time.time()
+            if self.state == 'attached' and (client is not self.client or now - self.window_start > WINDOW_SECONDS):
+                self._detach()
+                self._attach(client)
+                self._broadcast(Connection.push_resync, 'window')
+            elif self.state == 'detached' or (self.state == 'failed' and now - self.failed_at > RETRY_SECONDS):
+                resync = self.state == 'failed'
+                self._attach(client)
+                if resync:
+                    self._broadcast(Connection.push_resync, 'reconnected')
+
+    def _attach(self, client):
+        self.client = client
+        self.window_start = time.time()
+        self.posts = dict()
+        self.state = 'attached'
+        since = datetime.datetime.fromtimestamp(self.window_start, datetime.timezone.utc)
+        listeners = (
+            (client.collection('admin_logs').where('timestamp', '>=', since).order_by('timestamp'), self._on_logs),
+            (client.collection('users').where('createdAt', '>=', since), self._on_users),
+            (client.collection('posts').where('createdAt', '>=', since), self._on_posts)
+        )
+        try:
+            for query, callback in listeners:
+                self.watches.append(query.on_snapshot(self._guarded(callback)))
+        except Exception as e:
+            self._fail(e)
+        LISTENERS.set(len(self.watches))
+
+    def _detach(self):
+        watches, self.watches = self.watches, []
+        self.state = 'detached'
+        self.client = None
+        for watch in watches:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                logger.warning('Closing a live dashboard listener failed: %s', e)
+        LISTENERS.set(0)
+
+    def _fail(self, reason):
+        logger.warning('Live dashboard listeners stopped, retrying in %ss: %s', RETRY_SECONDS, reason)
+        self._detach()
+        self.state = 'failed'
+        self.failed_at = time.time()
+
+    def _guarded(self, callback):
+        def on_snapshot(docs, changes, read_time):
+            try:
+                with self.lock:
+                    if self.state != 'attached':
+                        return # detached while this snapshot was in flight
+                callback(changes)
+            except Exception as e:
+                logger.exception('Applying a live dashboard snapshot failed: %s', e)
+                with self.lock:
+                    self._fail(e)
+                self._broadcast(Connection.push_resync, 'error')
+        return on_snapshot
+
+    def _on_logs(self, changes):
+        added = [records.ADMIN_LOG.from_snapshot(change.document) for change in changes if change.type.name == 'ADDED']
+        added.sort(key=lambda log: log.get('timestamp') or datetime.datetime.max.replace(tzinfo=datetime.timezone.utc))
+        for log in added:
+            self._broadcast(Connection.push_log, log)
+
+    def _on_users(self, changes):
+        delta = 0
+        for change in changes:
+            if change.type.name == 'ADDED':
+                delta += 1
+            elif change.type.name == 'REMOVED':
+                delta -= 1
+        if delta:
+            self._broadcast(Connection.push_counters, {'total_users': delta, 'new_users': delta})
+
+    def _on_posts(self, changes):
+        posts = comments = 0
+        with self.lock:
+            for change in changes:
+                post_id = change.document.id
+                if change.type.name == 'REMOVED':
+                    posts -= 1
+                    comments -= self.posts.pop(post_id, 0)
+                    continue
+                count = (change.document.to_dict() or dict()).get('commentCount', 0) or 0
+                if change.type.name == 'ADDED':
+                    posts += 1
+                comments += count - self.posts.get(post_id, 0)
+                self.posts[post_id] = count
+        deltas = {'total_posts': posts, 'new_posts': posts, 'total_comments': comments, 'new_comments': comments}
+        if posts or comments:
+            self._broadcast(Connection.push_counters, deltas)
+
+
+hub = Hub()
+
+
+def _event(name, data):
+    EVENTS.inc(event=name)
+    return f'event: {name}\ndata: {json.dumps(data, default=encoding.firestore_default)}\n\n'
+
+
+def stream(db, connection):
+    '''The SSE body of a connection; unsubscribes when the client goes away or the stream ends'''
+    try:
+        yield f'retry: {RECONNECT_MS}\n\n'
+        yield _event('ready', {'heartbeatSeconds': HEARTBEAT_SECONDS})
+        while time.time() - connection.opened_at < MAX_SECONDS:
+            events = connection.take(HEARTBEAT_SECONDS)
+            if not events:
+                yield ': heartbeat\n\n'
+            for name, data in events:
+                yield _event(name, data)
+            hub.ensure(db)
+    finally:
+        hub.unsubscribe(connection)
+
+
+def response(db, connection):
+    sse = Response(stream(db, connection), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no' # nginx would otherwise buffer the stream
+    })
+    sse.call_on_close(lambda: hub.unsubscribe(connection)) # also when the body was never iterated
+    return sse
@@ -0,0 +1,222 @@
+# logging_setup.py
+'''
+Structured logging for the admin API.
+
+Records are formatted as one JSON object per line and carry the id of the request that produced
+them. Request threads only put records on a bounded in-memory queue (dropping them if it is
+full); a background listener thread does the formatting and the actual writes. Repeated
+warnings/errors are rate limited per message so an error storm can't flood the output.
+'''
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+
+from flask import g, request
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_SAMPLE_WINDOW = float(os.environ.get('LOG_SAMPLE_WINDOW', 60)) # seconds
+LOG_SAMPLE_BURST = int(os.environ.get('LOG_SAMPLE_BURST', 10)) # identical warnings/errors let through per window
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+# attributes every LogRecord has, anything else was passed through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id', 'suppressed'}
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def log_failure(logger, where, error):
+    '''
+    Log the traceback of an error that is re-raised to the caller, once: service methods call
+    each other, and only the innermost one that saw the error logs it.
+    '''
+    if getattr(error, '_failure_logged', False):
+        return
+    logger.exception('Error in %s: %s', where, error)
+    try:
+        error._failure_logged = True
+    except AttributeError: # exceptions with __slots__
+        pass
+
+
+class RequestContextFilter(logging.Filter):
+    '''Stamp records with the current request id while still on the request thread'''
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    '''
+    Let through at most `burst` WARNING+ records with the same logger, message template and
+    exception type per window; the first record after a suppressed stretch reports how many
+    were dropped.
+    '''
+
+    def __init__(self, window=LOG_SAMPLE_WINDOW, burst=LOG_SAMPLE_BURST):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.buckets = dict() # key -> [window_start, emitted, suppressed]
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        key = (record.name, str(record.msg), exc_type)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None or now - bucket[0] >= self.window:
+                suppressed = bucket[2] if bucket else 0
+                self.buckets[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                if len(self.buckets) > 10000: # don't let unique messages grow this forever
+                    self.buckets = {k: v for k, v in self.buckets.items() if now - v[0] < self.window}
+                return True
+            if bucket[1] < self.burst:
+                bucket[1] += 1
+                return True
+            bucket[2] += 1
+            return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    '''QueueHandler that never waits: records are dropped (and counted) when the queue is full'''
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # resolve the message and traceback text here (args may not be safe to format later),
+        # but leave the JSON formatting to the listener thread
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        suppressed = getattr(record, 'suppressed', None)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+_listener = None
+_queue_handler = None
+
+
+def _start_listener(stream_handler):
+    global _listener
+    _queue_handler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # the listener thread doesn't survive fork (e.g. gunicorn with preload), start a fresh one
+    if _listener is not None:
+        _start_listener(_listener.handlers[0])
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop() # flushes what's still queued
+
+
+def setup_logging(app=None):
+    '''Install the JSON/queue pipeline on the root logger (once per process) and hook app'''
+    global _queue_handler
+
+    if _queue_handler is None:
+        stream_handler = logging.StreamHandler(sys.stderr) # stdout is left to programs' own output (benchmark results)
+        stream_handler.setFormatter(JsonFormatter())
+
+        _queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(RequestContextFilter())
+        _queue_handler.addFilter(RateLimitFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(LOG_LEVEL)
+
+        _start_listener(stream_handler)
+        atexit.register(_stop_listener)
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+    if app is not None:
+        init_app(app)
+
+
+def init_app(app):
+    '''Assign every request an id (taken from X-Request-ID when the caller sends one)'''
+
+    @app.before_request
+    def assign_request_id():
+        request_id = (request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex)[:128]
+        g.request_id = request_id
+        g.request_id_token = _request_id.set(request_id)
+
+    @app.after_request
+    def echo_request_id(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    @app.teardown_request
+    def clear_request_id(exc):
+        token = g.pop('request_id_token', None)
+        if token is None:
+            return
+        try:
+            _request_id.reset(token)
+        except ValueError:
+            _request_id.set(None)
@@ -0,0 +1,407 @@
+# metrics.py
+'''
+Minimal Prometheus-style metrics (counters, gauges, histograms) served on /metrics in the text
+exposition format.
+
+Under a pre-fork server every worker has its own registry, so when METRICS_MULTIPROC_DIR is set
+each process periodically writes its samples to a file in that directory and /metrics merges
+the files of all workers: counters and histograms are summed across every worker that ever ran,
+gauges only across workers that are still alive. When a worker has exited, mark_process_dead()
+folds its counters and histograms into one archive file and deletes its own.
+'''
+import atexit
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from flask import Response, g, request
+
+import instrumentation
+
+MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') # optional bearer token required to scrape /metrics
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.samples = dict()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def dump(self):
+        with self.lock:
+            return [[list(key), value] for key, value in self.samples.items()]
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.samples.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = value
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample['buckets'][i] += 1
+                    break
+            sample['sum'] += value
+            sample['count'] += 1
+
+    def dump(self):
+        with self.lock:
+            return [[list(key), {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}]
+                    for key, value in self.samples.items()]
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = dict()
+        self.collectors = [] # callables run right before exposition (e.g. to refresh derived gauges)
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                return self.metrics[metric.name]
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def dump(self):
+        for collect in self.collectors:
+            collect()
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {
+            metric.name: {
+                'type': metric.type_name,
+                'help': metric.documentation,
+                'labelnames': list(metric.labelnames),
+                'buckets': [b if b != math.inf else 'inf' for b in getattr(metric, 'buckets', ())],
+                'samples': metric.dump(),
+            }
+            for metric in metrics
+        }
+
+
+registry = Registry()
+
+# HTTP metrics
+REQUESTS = registry.counter('admin_api_requests_total', 'Requests handled, by route and status', ('route', 'method', 'status'))
+ERRORS = registry.counter('admin_api_request_errors_total', 'Requests that ended with a 4xx/5xx status', ('route', 'method', 'status'))
+LATENCY = registry.histogram('admin_api_request_duration_seconds', 'Request latency', ('route', 'method'))
+IN_FLIGHT = registry.gauge('admin_api_requests_in_flight', 'Requests currently being handled', ('route',))
+
+# Firestore usage, fed from the per-request accounting in instrumentation.py
+FIRESTORE_READS = registry.counter('admin_api_firestore_reads_total', 'Firestore documents read', ('route',))
+FIRESTORE_WRITES = registry.counter('admin_api_firestore_writes_total', 'Firestore documents written', ('route',))
+FIRESTORE_SECONDS = registry.counter('admin_api_firestore_seconds_total', 'Time spent waiting on Firestore', ('route',))
+
+# cache effectiveness, caches report through record_cache()
+CACHE_REQUESTS = registry.counter('admin_api_cache_requests_total', 'Cache lookups by result', ('cache', 'result'))
+
+
+# login attempts turned away by the rate limiters (reason ip/email) or a full hashing queue (busy)
+LOGIN_THROTTLED = registry.counter('admin_api_login_throttled_total', 'Login attempts rejected before authentication', ('reason',))
+
+# authenticated requests rejected by the per-admin or global rate limit
+RATE_LIMITED = registry.counter('admin_api_rate_limited_total', 'Requests rejected by the rate limiter', ('route', 'scope'))
+
+
+def record_cache(cache, hit):
+    '''Count a cache lookup; hit ratios are derived at exposition time'''
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+# multi-process support
+
+def _process_file(pid=None):
+    return os.path.join(MULTIPROC_DIR, f'metrics-{pid or os.getpid()}.json')
+
+
+ARCHIVE_FILE = 'metrics-archive.json' # counters and histograms of workers that exited
+
+_last_flush = [0.0]
+_flush_lock = threading.Lock()
+
+
+def _write(path, data):
+    # a unique temp file and an atomic rename, so a scrape never reads a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=MULTIPROC_DIR, prefix='.metrics-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def flush(force=False):
+    '''Write this process' samples to the shared directory (rate limited unless forced)'''
+    if not MULTIPROC_DIR:
+        return
+    with _flush_lock: # request threads tear down concurrently
+        now = time.monotonic()
+        if not force and now - _last_flush[0] < FLUSH_INTERVAL:
+            return
+        _last_flush[0] = now
+        os.makedirs(MULTIPROC_DIR, exist_ok=True)
+        _write(_process_file(), registry.dump())
+
+
+def mark_process_dead(pid):
+    '''Fold an exited worker's counters and histograms into the archive and delete its file (one caller at a time, e.g. the server master)'''
+    if not MULTIPROC_DIR:
+        return
+    path = _process_file(pid)
+    try:
+        with open(path) as f:
+            dead = json.load(f)
+    except (OSError, ValueError):
+        return
+    archive_path = os.path.join(MULTIPROC_DIR, ARCHIVE_FILE)
+    try:
+        with open(archive_path) as f:
+            archive = json.load(f)
+    except (OSError, ValueError):
+        archive = dict()
+    merged = _merge([(archive, False), (dead, False)]) # gauges of dead workers are dropped
+    _write(archive_path, {
+        name: dict(metric, samples=[[list(key), value] for key, value in metric['samples'].items()])
+        for name, metric in merged.items()
+    })
+    os.unlink(path)
+
+
+if MULTIPROC_DIR:
+    atexit.register(flush, True)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _collect_processes():
+    '''Samples from every worker that wrote to the shared directory, this process live'''
+    collected = [(registry.dump(), True)]
+    if not MULTIPROC_DIR or not os.path.isdir(MULTIPROC_DIR):
+        return collected
+
+    for filename in os.listdir(MULTIPROC_DIR):
+        if not (filename.startswith('metrics-') and filename.endswith('.json')):
+            continue
+        if filename == ARCHIVE_FILE:
+            pid = None
+        else:
+            try:
+                pid = int(filename[len('metrics-'):-len('.json')])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+        try:
+            with open(os.path.join(MULTIPROC_DIR, filename)) as f:
+                collected.append((json.load(f), pid is not None and _pid_alive(pid)))
+        except (OSError, ValueError):
+            continue # file vanished or is being replaced
+    return collected
+
+
+def _merge(processes):
+    merged = dict()
+    for dump, alive in processes:
+        for name, metric in dump.items():
+            if metric['type'] == 'gauge' and not alive:
+                continue
+            target = merged.setdefault(name, {
+                'type': metric['type'],
+                'help': metric['help'],
+                'labelnames': metric['labelnames'],
+                'buckets': metric['buckets'],
+                'samples': dict(),
+            })
+            for labels, value in metric['samples']:
+                key = tuple(labels)
+                if metric['type'] == 'histogram':
+                    current = target['samples'].setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0.0, 'count': 0})
+                    current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+                    current['sum'] += value['sum']
+                    current['count'] += value['count']
+                else:
+                    target['samples'][key] = target['samples'].get(key, 0) + value
+    return merged
+
+
+def _cache_ratios(merged):
+    cache = merged.get(CACHE_REQUESTS.name)
+    if not cache:
+        return []
+    totals = dict()
+    for (name, result), value in cache['samples'].items():
+        hits, lookups = totals.get(name, (0, 0))
+        totals[name] = (hits + (value if result == 'hit' else 0), lookups + value)
+    lines = [
+        '# HELP admin_api_cache_hit_ratio Share of cache lookups served from the cache',
+        '# TYPE admin_api_cache_hit_ratio gauge',
+    ]
+    for name, (hits, lookups) in sorted(totals.items()):
+        lines.append(f'admin_api_cache_hit_ratio{_format_labels(("cache",), (name,))} {_format_value(hits / lookups if lookups else 0)}')
+    return lines
+
+
+def exposition():
+    '''Render all metrics (merged across workers) in the Prometheus text format'''
+    merged = _merge(_collect_processes())
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f'# HELP {name} {metric["help"]}')
+        lines.append(f'# TYPE {name} {metric["type"]}')
+        labelnames = metric['labelnames']
+        for key, value in sorted(metric['samples'].items()):
+            if metric['type'] == 'histogram':
+                cumulative = 0
+                for bound, count in zip(metric['buckets'], value['buckets']):
+                    cumulative += count
+                    le = '+Inf' if bound == 'inf' else _format_value(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labelnames, key, ("le", le))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labelnames, key)} {_format_value(value["sum"])}')
+                lines.append(f'{name}_count{_format_labels(labelnames, key)} {value["count"]}')
+            else:
+                lines.append(f'{name}{_format_labels(labelnames, key)} {_format_value(value)}')
+    lines.extend(_cache_ratios(merged))
+    return '\n'.join(lines) + '\n'
+
+
+# Flask integration
+
+def init_app(app):
+    '''Record per-route request metrics and serve them on /metrics'''
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_route = instrumentation.route_name()
+        IN_FLIGHT.inc(route=g.metrics_route)
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        route = g.metrics_route
+        status = str(response.status_code)
+        REQUESTS.inc(route=route, method=request.method, status=status)
+        LATENCY.observe(time.perf_counter() - started, route=route, method=request.method)
+        if response.status_code >= 400:
+            ERRORS.inc(route=route, method=request.method, status=status)
+
+        stats = instrumentation.current_stats()
+        if stats is not None:
+            FIRESTORE_READS.inc(stats.reads, route=route)
+            FIRESTORE_WRITES.inc(stats.writes, route=route)
+            FIRESTORE_SECONDS.inc(stats.firestore_seconds, route=route)
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        route = g.pop('metrics_route', None)
+        if route is not None:
+            IN_FLIGHT.dec(route=route)
+        flush()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(exposition(), mimetype='text/plain; version=0.0.4; charset=utf-8')
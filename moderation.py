@@ -0,0 +1,406 @@
+# moderation.py
+'''
+Prioritized moderation queue: posts ranked by how urgently they need a look, claimed with leases.
+
+Every post of the last MODERATION_WINDOW_HOURS is scored in batches of MODERATION_BATCH_SIZE
+from four signals, each computed column-wise over the batch:
+
+    reports     reportCount (users reporting the post, see FirebaseService.report_post)
+    velocity    (likeCount + commentCount) per hour since the post was created
+    content     share of spam heuristics hit: links, shouting, repeated characters, !!!/???
+    duplicates  near-duplicates of the post (duplicates.py), when that index is available
+
+    score = sum(WEIGHTS[signal] * value), with velocity and duplicates as log(1 + value)
+
+Posts scoring at least MODERATION_MIN_SCORE get a moderation_queue/{post id} document holding
+the score, its signals and a status: open, claimed or resolved. The top of the queue is one
+query on (status, score desc), served by an index in firestore.indexes.json.
+
+Claiming moves the best open items to claimed in a transaction per item, with the admin and a
+lease (MODERATION_LEASE_SECONDS). Two admins claiming at once therefore never get the same
+item; the loser's transaction sees it claimed and moves on to the next. Items whose lease ran
+out are claimable again (and put back to open when the queue is claimed or scored), so work
+abandoned by a closed tab isn't lost. Resolving requires the caller's live lease.
+
+Scoring runs every MODERATION_SCORE_SECONDS in one worker at a time (a lease on
+moderation_meta/scorer), started by the first moderation request, and on demand through
+POST /api/admin/moderation/rescore. A rescore updates open and claimed items; resolved items
+reopen only when new reports arrived since they were resolved.
+'''
+import datetime
+import logging
+import math
+import os
+import re
+import socket
+import threading
+import time
+
+from firebase_admin import firestore
+
+import metrics
+import rate_limit
+import records
+
+WINDOW_HOURS = float(os.environ.get('MODERATION_WINDOW_HOURS', 72))
+BATCH_SIZE = min(int(os.environ.get('MODERATION_BATCH_SIZE', 400)), 500) # Firestore caps a batch at 500 writes
+MIN_SCORE = float(os.environ.get('MODERATION_MIN_SCORE', 1.0))
+LEASE_SECONDS = int(os.environ.get('MODERATION_LEASE_SECONDS', 300))
+MAX_LEASE_SECONDS = 3600
+SCORE_SECONDS = float(os.environ.get('MODERATION_SCORE_SECONDS', 300)) # 0 scores on demand only
+MAX_CLAIM = 50
+
+# signal weights, override with MODERATION_WEIGHTS="reports=5,duplicates=3,..."
+WEIGHTS = {
+    'reports': 5.0,
+    'velocity': 1.0,
+    'content': 2.0,
+    'duplicates': 3.0
+}
+WEIGHTS.update(rate_limit.parse_costs(os.environ.get('MODERATION_WEIGHTS', '')))
+
+COLLECTION = 'moderation_queue'
+OPEN = 'open'
+CLAIMED = 'claimed'
+RESOLVED = 'resolved'
+RESOLUTIONS = ('dismiss', 'delete')
+
+_FIELDS = ['userId', 'content', 'likeCount', 'commentCount', 'reportCount', 'createdAt']
+
+SCORED = metrics.registry.counter('admin_api_moderation_scored_total', 'Posts scored for the moderation queue')
+QUEUED = metrics.registry.gauge('admin_api_moderation_queued', 'Posts queued by the last scoring pass')
+CLAIMS = metrics.registry.counter(
+    'admin_api_moderation_claims_total',
+    'Moderation queue claim attempts by result',
+    ('result',)
+)
+
+logger = logging.getLogger(__name__)
+
+_LINK = re.compile(r'https?://|www\.', re.IGNORECASE)
+_REPEATED = re.compile(r'(.)\1{4,}')
+_PUNCTUATION = re.compile(r'[!?]{3,}')
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _item_ref(db, post_id):
+    return db.collection(COLLECTION).document(post_id)
+
+
+# scoring
+
+def content_signal(text):
+    '''Share of the spam heuristics a text hits, 0 to 1'''
+    if not isinstance(text, str) or not text:
+        return 0.0
+    letters = [c for c in text if c.isalpha()]
+    hits = (
+        min(len(_LINK.findall(text)), 3) / 3,
+        1.0 if len(letters) >= 20 and sum(c.isupper() for c in letters) > 0.6 * len(letters) else 0.0,
+        1.0 if _REPEATED.search(text) else 0.0,
+        1.0 if _PUNCTUATION.search(text) else 0.0
+    )
+    return sum(hits) / len(hits)
+
+
+def score_batch(posts, now=None, duplicates=None):
+    '''[(score, signals)] for a batch of post dicts, one signal column at a time'''
+    now = now or _now()
+    reports = [int(post.get('reportCount') or 0) for post in posts]
+    ages = [
+        max((now - post['createdAt']).total_seconds() / 3600, 0.0) if isinstance(post.get('createdAt'), datetime.datetime) else WINDOW_HOURS
+        for post in posts
+    ]
+    engagement = [int(post.get('likeCount') or 0) + int(post.get('commentCount') or 0) for post in posts]
+    velocity = [count / (age + 1) for count, age in zip(engagement, ages)] # +1h so new posts don't spike
+    content = [content_signal(post.get('content')) for post in posts]
+    dupes = [duplicates(post['id']) if duplicates else 0 for post in posts]
+
+    scores = [
+        WEIGHTS['reports'] * r + WEIGHTS['velocity'] * math.log1p(v) + WEIGHTS['content'] * c + WEIGHTS['duplicates'] * math.log1p(d)
+        for r, v, c, d in zip(reports, velocity, content, dupes)
+    ]
+    return [
+        (round(score, 4), {'reports': r, 'velocity': round(v, 3), 'content': round(c, 3), 'duplicates': d})
+        for score, r, v, c, d in zip(scores, reports, velocity, content, dupes)
+    ]
+
+
+def score_recent(db, duplicates=None):
+    '''
+    Score the posts of the window and queue those above MIN_SCORE, returns {scored, queued, dropped}.
+    duplicates() returns a post id -> near-duplicate count function, or None while there is no
+    index; it is asked again for every batch, so the signal turns on once the index is ready.
+
+    Open items that no longer belong in the queue are deleted: their post scored below
+    MIN_SCORE, left the window or is gone (delete_post removes the item as well, this catches
+    posts deleted any other way).
+    '''
+    now = _now()
+    # ids only: an open item this pass doesn't see a post for is dropped at the end
+    stale = {snapshot.id for snapshot in db.collection(COLLECTION).where('status', '==', OPEN).select([]).stream()}
+    query = (
+        db.collection('posts')
+        .where('createdAt', '>=', now - datetime.timedelta(hours=WINDOW_HOURS))
+        .select(_FIELDS)
+    )
+    scored = queued = 0
+    batch = []
+    for snapshot in query.stream():
+        post = snapshot.to_dict() or dict()
+        post['id'] = snapshot.id
+        batch.append(post)
+        if len(batch) >= BATCH_SIZE:
+            queued += _queue_batch(db, batch, now, duplicates, stale)
+            scored += len(batch)
+            batch = []
+    if batch:
+        queued += _queue_batch(db, batch, now, duplicates, stale)
+        scored += len(batch)
+
+    dropped = _drop_open(db, stale)
+    requeue_expired(db)
+    SCORED.inc(scored)
+    QUEUED.set(queued)
+    return {
+        'scored': scored,
+        'queued': queued,
+        'dropped': dropped
+    }
+
+
+def _drop_open(db, post_ids):
+    '''Delete these items if they are still open (not claimed meanwhile), returns how many'''
+    dropped = 0
+    for post_id in post_ids:
+        @firestore.transactional
+        def drop(transaction, ref=_item_ref(db, post_id)):
+            snapshot = ref.get(transaction=transaction)
+            if snapshot.exists and (snapshot.to_dict() or dict()).get('status') == OPEN:
+                transaction.delete(ref)
+                return True
+            return False
+
+        dropped += drop(db.transaction())
+    return dropped
+
+
+def _queue_batch(db, posts, now, duplicates, stale):
+    counts = duplicates() if duplicates else None
+    ranked = []
+    for post, (score, signals) in zip(posts, score_batch(posts, now, counts)):
+        if score >= MIN_SCORE:
+            stale.discard(post['id'])
+            ranked.append((post, score, signals))
+        # below MIN_SCORE, an open item of the post stays in `stale` and is dropped
+    if not ranked:
+        return 0
+    refs = [_item_ref(db, post['id']) for post, _, _ in ranked]
+    existing = {snapshot.id: snapshot.to_dict() for snapshot in db.get_all(refs, field_paths=['status', 'resolvedReports']) if snapshot.exists}
+
+    writes = db.batch()
+    queued = 0
+    for ref, (post, score, signals) in zip(refs, ranked):
+        update = {
+            'postId': post['id'],
+            'userId': post.get('userId'),
+            'postCreatedAt': post.get('createdAt'),
+            'score': score,
+            'signals': signals,
+            'scoredAt': firestore.SERVER_TIMESTAMP
+        }
+        current = existing.get(post['id'])
+        if current is None:
+            update['status'] = OPEN
+        elif current.get('status') == RESOLVED:
+            if signals['reports'] <= (current.get('resolvedReports') or 0):
+                continue # handled, nothing new since
+            update['status'] = OPEN # reported again after it was resolved
+        writes.set(ref, update, merge=True)
+        queued += 1
+    writes.commit()
+    return queued
+
+
+def requeue_expired(db, limit=100):
+    '''Put claimed items whose lease ran out back to open, returns how many'''
+    now = _now()
+    query = (
+        db.collection(COLLECTION)
+        .where('status', '==', CLAIMED)
+        .where('leaseUntil', '<', now)
+        .limit(limit)
+    )
+    requeued = 0
+    for snapshot in query.stream():
+        @firestore.transactional
+        def reopen(transaction, ref=snapshot.reference):
+            current = ref.get(transaction=transaction).to_dict() or dict()
+            if current.get('status') == CLAIMED and current.get('leaseUntil') and current['leaseUntil'] < now:
+                transaction.update(ref, {'status': OPEN, 'claimedBy': None, 'leaseUntil': None})
+                return True
+            return False
+
+        requeued += reopen(db.transaction())
+    return requeued
+
+
+# the queue
+
+def top(db, limit=20):
+    '''The best open items, as one indexed query'''
+    query = (
+        db.collection(COLLECTION)
+        .where('status', '==', OPEN)
+        .order_by('score', direction=firestore.Query.DESCENDING)
+        .limit(limit)
+    )
+    return [dict(snapshot.to_dict(), id=snapshot.id) for snapshot in query.stream()]
+
+
+def _claimable(item, now):
+    if item.get('status') == OPEN:
+        return True
+    return item.get('status') == CLAIMED and item.get('leaseUntil') is not None and item['leaseUntil'] < now
+
+
+def claim(db, admin_id, count=1, lease_seconds=LEASE_SECONDS):
+    '''Claim up to count of the best open items for an admin, returns them with their lease'''
+    requeue_expired(db)
+    claimed = []
+    tried = set()
+    for _ in range(3): # another admin may take every candidate of a round
+        candidates = [item for item in top(db, limit=count * 3) if item['id'] not in tried]
+        if not candidates:
+            break
+        for item in candidates:
+            tried.add(item['id'])
+
+            @firestore.transactional
+            def take(transaction, ref=_item_ref(db, item['id'])):
+                now = _now()
+                snapshot = ref.get(transaction=transaction)
+                current = snapshot.to_dict() if snapshot.exists else None
+                if current is None or not _claimable(current, now):
+                    return None
+                lease = {
+                    'status': CLAIMED,
+                    'claimedBy': admin_id,
+                    'claimedAt': now,
+                    'leaseUntil': now + datetime.timedelta(seconds=lease_seconds)
+                }
+                transaction.update(ref, lease)
+                return dict(current, id=snapshot.id, **lease)
+
+            taken = take(db.transaction())
+            CLAIMS.inc(result='claimed' if taken else 'conflict')
+            if taken:
+                claimed.append(taken)
+                if len(claimed) >= count:
+                    return claimed
+    return claimed
+
+
+def _leased(transaction, ref, admin_id):
+    '''The item if the admin holds its lease, raises otherwise'''
+    snapshot = ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise Exception('Moderation item not found')
+    current = snapshot.to_dict()
+    if current.get('status') != CLAIMED or current.get('claimedBy') != admin_id:
+        raise Exception('Moderation item is not claimed by this admin')
+    if current.get('leaseUntil') is None or current['leaseUntil'] < _now():
+        raise Exception('Lease expired, claim the item again')
+    return current
+
+
+def release(db, post_id, admin_id):
+    '''Give a claimed item back to the queue'''
+    @firestore.transactional
+    def give_back(transaction, ref=_item_ref(db, post_id)):
+        _leased(transaction, ref, admin_id)
+        transaction.update(ref, {'status': OPEN, 'claimedBy': None, 'leaseUntil': None})
+
+    give_back(db.transaction())
+
+
+def resolve(db, post_id, admin_id, resolution, note=None):
+    '''Close a claimed item, returns the item as it was before'''
+    @firestore.transactional
+    def close(transaction, ref=_item_ref(db, post_id)):
+        current = _leased(transaction, ref, admin_id)
+        transaction.update(ref, {
+            'status': RESOLVED,
+            'resolution': resolution,
+            'resolvedBy': admin_id,
+            'resolvedAt': firestore.SERVER_TIMESTAMP,
+            'resolvedReports': (current.get('signals') or dict()).get('reports', 0),
+            'note': note,
+            'leaseUntil': None
+        })
+        return current
+
+    return close(db.transaction())
+
+
+def hydrate(db, items):
+    '''Attach each item's post (None when the post no longer exists)'''
+    refs = [db.collection('posts').document(item['id']) for item in items]
+    posts = dict()
+    if refs:
+        for snapshot in db.get_all(refs, field_paths=records.POST_SUMMARY.projection):
+            if snapshot.exists:
+                posts[snapshot.id] = records.POST_SUMMARY.from_snapshot(snapshot)
+    for item in items:
+        item['post'] = posts.get(item['id'])
+    return items
+
+
+# background scoring
+
+_lock = threading.Lock()
+_scorer_pid = None
+
+
+def ensure_scoring(db, duplicates=None):
+    '''Start the periodic scorer of this process (once per process), duplicates as for score_recent()'''
+    global _scorer_pid
+    if SCORE_SECONDS <= 0:
+        return
+    with _lock:
+        if _scorer_pid == os.getpid():
+            return
+        _scorer_pid = os.getpid()
+    threading.Thread(target=_score_periodically, args=(db, duplicates), name='moderation-scorer', daemon=True).start()
+
+
+def _score_periodically(db, duplicates):
+    holder = f'{socket.gethostname()}:{os.getpid()}'
+    while True:
+        try:
+            if _take_scorer_lease(db, holder):
+                started = time.perf_counter()
+                result = score_recent(db, duplicates=duplicates)
+                logger.info('Moderation queue scored: %d posts, %d queued in %.1fs', result['scored'], result['queued'], time.perf_counter() - started)
+        except Exception as e:
+            logger.warning('Scoring the moderation queue failed: %s', e)
+        time.sleep(SCORE_SECONDS)
+
+
+def _take_scorer_lease(db, holder):
+    '''Whether this process should run this round's scoring (one worker per round)'''
+    @firestore.transactional
+    def take(transaction, ref=db.collection('moderation_meta').document('scorer')):
+        now = _now()
+        snapshot = ref.get(transaction=transaction)
+        current = snapshot.to_dict() if snapshot.exists else dict()
+        if current.get('holder') != holder and current.get('leaseUntil') and current['leaseUntil'] > now:
+            return False
+        # held a little less than a round, so the next round can go to any worker
+        transaction.set(ref, {'holder': holder, 'leaseUntil': now + datetime.timedelta(seconds=SCORE_SECONDS * 0.9)})
+        return True
+
+    return take(db.transaction())
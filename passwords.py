@@ -0,0 +1,123 @@
+# passwords.py
+'''
+Admin password hashing with scrypt, run on a small dedicated thread pool.
+
+Hashes are stored as `scrypt$<n>$<r>$<p>$<salt>$<hash>` (base64), so cost parameters can be
+raised later without invalidating existing passwords: verify_password() reports when a stored
+hash is weaker than the current settings (or is a legacy unsalted SHA-256 hex digest) and the
+caller rehashes it after a successful login.
+
+scrypt is CPU and memory heavy on purpose. hashlib releases the GIL while it runs, so hashing
+on PASSWORD_HASH_WORKERS threads caps how many cores a login burst can take, and once
+PASSWORD_HASH_QUEUE hashes are waiting new ones fail fast with HashingBusy instead of tying up
+every server thread.
+'''
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14)) # cpu/memory cost, power of 2
+SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', 8)) # block size
+SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', 1)) # parallelization
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32)) # hashes running or waiting, per process
+HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_slots = threading.BoundedSemaphore(HASH_QUEUE)
+
+
+class HashingBusy(Exception):
+    '''Raised when too many password hashes are already queued'''
+
+
+def _get_executor():
+    global _executor, _executor_pid, _slots
+    with _lock:
+        # pool threads don't survive fork, workers build their own
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='password-hash')
+            _executor_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(HASH_QUEUE)
+        return _executor
+
+
+def _scrypt(password, salt, n, r, p):
+    # OpenSSL needs about 128 * r * (n + p) bytes, leave some headroom above that
+    maxmem = 128 * r * (n + p + 2) + 1024 * 1024
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=HASH_BYTES)
+
+
+def _run(fn, *args):
+    executor = _get_executor()
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise HashingBusy('Too many login attempts in progress, try again shortly')
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    # the slot is held until the hash is done, not just until we stop waiting for it,
+    # so hashes that timed out still count against HASH_QUEUE while they run
+    future.add_done_callback(lambda _: slots.release())
+    return future.result(timeout=HASH_TIMEOUT)
+
+
+def _encode(n, r, p, salt, digest):
+    b64 = lambda raw: base64.b64encode(raw).decode()
+    return f'scrypt${n}${r}${p}${b64(salt)}${b64(digest)}'
+
+
+def hash_password(password):
+    '''Hash a password with the current scrypt settings'''
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = _run(_scrypt, password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return _encode(SCRYPT_N, SCRYPT_R, SCRYPT_P, salt, digest)
+
+
+def _is_legacy(stored):
+    # unsalted sha256 hex digests written before scrypt was introduced
+    return len(stored) == 64 and all(c in '0123456789abcdef' for c in stored)
+
+
+def verify_password(password, stored):
+    '''Check a password against a stored hash, returns (matches, needs_rehash)'''
+    if not stored:
+        return False, False
+
+    if _is_legacy(stored):
+        matches = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+        return matches, matches
+
+    try:
+        scheme, n, r, p, salt, digest = stored.split('$')
+        n, r, p = int(n), int(r), int(p)
+        salt, digest = base64.b64decode(salt), base64.b64decode(digest)
+    except ValueError:
+        return False, False
+    if scheme != 'scrypt':
+        return False, False
+
+    matches = hmac.compare_digest(_run(_scrypt, password, salt, n, r, p), digest)
+    return matches, matches and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+_dummy_hash = None
+
+
+def dummy_verify(password):
+    '''Spend the same time as a real verification, so unknown emails can't be told apart by timing'''
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = _encode(SCRYPT_N, SCRYPT_R, SCRYPT_P, b'\0' * SALT_BYTES, b'\0' * HASH_BYTES)
+    verify_password(password, _dummy_hash)
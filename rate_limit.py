@@ -0,0 +1,177 @@
+# rate_limit.py
+'''
+Token-bucket rate limiting.
+
+A bucket holds up to `burst` tokens and refills at `rate` tokens per second; a request takes
+one token (or `cost` tokens) and is rejected while the bucket is empty, together with how many
+seconds until enough tokens are back. Rejections cost a dict lookup, so floods are turned away
+before any password hashing or Firestore query happens.
+
+Buckets live in a store. MemoryBucketStore keeps them per process; RedisBucketStore shares them
+between processes and nodes (RATE_LIMIT_REDIS_URL, needs `pip install redis`).
+'''
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBucketStore:
+    '''Buckets of this process, kept in a dict (full buckets are dropped once max_keys is reached)'''
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.buckets = dict() # key -> (tokens, updated_at, full_at)
+
+    def take(self, key, rate, burst, cost=1, now=None):
+        '''Take `cost` tokens from the bucket at key (a negative cost gives them back), returns 0 if allowed or the seconds to wait'''
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            tokens, updated_at, _ = self.buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= cost:
+                tokens = min(burst, tokens - cost)
+                retry_after = 0.0
+            else:
+                retry_after = (cost - tokens) / rate if rate > 0 else float('inf')
+            full_at = now + (burst - tokens) / rate if rate > 0 else float('inf')
+            self.buckets[key] = (tokens, now, full_at)
+
+            if len(self.buckets) > self.max_keys:
+                self._prune(now)
+            return retry_after
+
+    def _prune(self, now):
+        # buckets that have refilled completely behave exactly like missing ones
+        for key, (_, _, full_at) in list(self.buckets.items()):
+            if full_at <= now:
+                del self.buckets[key]
+
+    def reset(self, key):
+        with self.lock:
+            self.buckets.pop(key, None)
+
+
+class RateLimiter:
+    '''`per_minute` requests per key on average with bursts of up to `burst`; per_minute=0 disables it'''
+
+    def __init__(self, per_minute, burst, store=None, prefix=''):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.store = store or MemoryBucketStore()
+        self.prefix = prefix
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def hit(self, key, cost=1):
+        '''Count a request for key, returns 0 if allowed or the seconds until it would be'''
+        if not self.enabled:
+            return 0.0
+        return self.store.take(self.prefix + key, self.rate, self.burst, cost)
+
+    def refund(self, key, cost=1):
+        '''Give back the tokens of a request that was counted but didn't happen'''
+        if self.enabled:
+            self.store.take(self.prefix + key, self.rate, self.burst, -cost)
+
+    def reset(self, key):
+        self.store.reset(self.prefix + key)
+
+
+class RedisBucketStore:
+    '''Buckets shared through Redis, updated atomically by a Lua script using the Redis server clock'''
+
+    SCRIPT = '''
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local retry_after = 0
+if tokens >= cost then tokens = math.min(burst, tokens - cost) else retry_after = (cost - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(retry_after)
+'''
+
+    def __init__(self, url, key_prefix='rate-limit:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATE_LIMIT_REDIS_URL is set but the redis package is not installed (pip install redis)')
+        self.client = redis.Redis.from_url(url, socket_timeout=0.25)
+        self.key_prefix = key_prefix
+        self.script = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst, cost=1, now=None):
+        try:
+            return float(self.script(keys=[self.key_prefix + key], args=[rate, burst, cost]))
+        except Exception as e:
+            # fail open, an unreachable limiter must not take the API down with it
+            logger.warning('Rate limit store unavailable: %s', e)
+            return 0.0
+
+    def reset(self, key):
+        try:
+            self.client.delete(self.key_prefix + key)
+        except Exception as e:
+            logger.warning('Rate limit store unavailable: %s', e)
+
+
+def store_from_env():
+    '''Shared Redis store when RATE_LIMIT_REDIS_URL is set, otherwise a per-process one'''
+    url = os.environ.get('RATE_LIMIT_REDIS_URL')
+    return RedisBucketStore(url) if url else MemoryBucketStore()
+
+
+def parse_costs(spec):
+    '''"endpoint=cost,endpoint=cost" -> {endpoint: cost}'''
+    costs = dict()
+    for pair in spec.split(','):
+        endpoint, _, cost = pair.strip().partition('=')
+        if endpoint and cost:
+            costs[endpoint] = float(cost)
+    return costs
+
+
+class RequestLimiter:
+    '''
+    Limits authenticated requests per admin and across all admins. Every request costs the weight
+    of its endpoint (default 1), so expensive endpoints use up a budget faster than cheap ones.
+    '''
+
+    def __init__(self, per_admin, global_limit, costs=None):
+        self.per_admin = per_admin
+        self.global_limit = global_limit
+        self.costs = costs or dict()
+
+    def cost(self, endpoint):
+        return self.costs.get(endpoint, 1)
+
+    def check(self, admin_id, endpoint):
+        '''Returns (scope, seconds to wait) for a rejected request, or None if it may proceed'''
+        cost = self.cost(endpoint)
+        charged = []
+        for scope, limiter, key in (('admin', self.per_admin, admin_id), ('global', self.global_limit, '')):
+            # a single request costing more than the burst could never pass, let it drain the bucket instead
+            charge = min(cost, limiter.burst)
+            retry_after = limiter.hit(key, charge)
+            if retry_after:
+                # the admin's bucket only pays for requests that go through
+                for paid_limiter, paid_key, paid in charged:
+                    paid_limiter.refund(paid_key, paid)
+                return scope, retry_after
+            charged.append((limiter, key, charge))
+        return None
+
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
@@ -0,0 +1,197 @@
+# records.py
+'''
+Document-to-record conversion for everything FirebaseService returns.
+
+Each Schema builds a record type with __slots__ for the fields its documents are known to have,
+so a page of 50 posts holds 50 small fixed-layout objects instead of 50 dicts. The work done
+per document is precomputed once per schema: which fields are copied (through their slot
+descriptors), which list fields are reported as counts, the defaults, and the fields that must
+never leave the service (admin passwords).
+
+Records behave like dicts (route handlers add keys to them, e.g. `user['posts']`); keys outside
+the schema, and unknown document fields for open schemas, go to a small overflow dict that
+stays None for documents matching the schema. Values are left as read: timestamps, references
+and GeoPoints are converted once, when the response is encoded (encoding.py).
+'''
+from collections.abc import MutableMapping
+
+_MISSING = object()
+
+
+class Record(MutableMapping):
+    __slots__ = ('id', '_extra')
+    schema = None # set on the generated subclasses
+
+    def __init__(self):
+        self._extra = None
+
+    def __getitem__(self, key):
+        if key in self.schema.slot_names:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.schema.slot_names:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = dict()
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.schema.slot_names:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for name in self.schema.slot_order:
+            if hasattr(self, name):
+                yield name
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        result = dict()
+        for name in self.schema.slot_order:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                result[name] = value
+        if self._extra:
+            result.update(self._extra)
+        return result
+
+    def copy(self):
+        return self.schema.from_dict(self.to_dict())
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+
+class Schema:
+    '''
+    name: record type name
+    fields: document fields kept in slots
+    counts: {output field: list field} reported as the list's length (may replace the list itself),
+        unless the document stores the output field itself (a maintained counter wins)
+    defaults: values for fields the document doesn't have
+    hidden: fields never copied
+    open: keep document fields outside `fields` (in the overflow dict); closed schemas drop them
+    '''
+
+    def __init__(self, name, fields, counts=None, defaults=None, hidden=(), open=True):
+        self.name = name
+        self.counts = tuple((counts or dict()).items())
+        self.defaults = tuple((defaults or dict()).items())
+        self.open = open
+
+        count_names = [name for name, _ in self.counts if name not in fields]
+        slots = tuple(fields) + tuple(count_names)
+        self.record_type = type(name, (Record,), {'__slots__': slots, '__module__': __name__})
+        self.record_type.schema = self
+        self.slot_order = ('id',) + slots
+        self.slot_names = frozenset(self.slot_order)
+
+        # slot descriptors, so filling a record needs no attribute lookups by name
+        self._setters = {field: getattr(self.record_type, field).__set__ for field in slots}
+        self._count_setters = tuple(
+            (name, getattr(self.record_type, name).__set__, source) for name, source in self.counts
+        )
+        self._default_setters = tuple(
+            (name, getattr(self.record_type, name).__set__, default) for name, default in self.defaults
+        )
+        self._skipped = frozenset(hidden) | {'id'}
+
+        # what a query has to read for a closed schema (see select())
+        self.projection = None if open else sorted(set(slots) | {source for _, source in self.counts})
+
+    def from_dict(self, data, doc_id=None):
+        '''Record from document data (doc_id defaults to data['id'])'''
+        record = self.record_type()
+        record.id = doc_id if doc_id is not None else data.get('id')
+
+        # one pass over the document: known fields into slots, the rest into the overflow dict
+        setters = self._setters
+        extra = None
+        for key, value in data.items():
+            set_value = setters.get(key)
+            if set_value is not None:
+                set_value(record, value)
+            elif self.open and key not in self._skipped:
+                if extra is None:
+                    extra = record._extra = dict()
+                extra[key] = value
+        for name, set_value, source in self._count_setters:
+            if name == source or name not in data:
+                set_value(record, len(data.get(source) or ()))
+        for field, set_value, default in self._default_setters:
+            if field not in data:
+                set_value(record, default)
+        return record
+
+    def from_snapshot(self, snapshot):
+        return self.from_dict(snapshot.to_dict() or dict(), snapshot.id)
+
+    def select(self, query):
+        '''Limit a query to the fields a closed schema uses, so Firestore doesn't send the rest'''
+        return query.select(self.projection) if self.projection is not None else query
+
+
+POST = Schema('Post', (
+    'userId', 'username', 'content', 'likes', 'comments', 'createdAt', 'editedAt', 'editedByAdmin'
+))
+
+# admin lists and user details also report how many comments and likes a post has
+POST_WITH_COUNTS = Schema('PostWithCounts', POST.record_type.__slots__, counts={
+    'commentCount': 'comments',
+    'likeCount': 'likes'
+})
+
+# search results: a post without its likes and comments
+POST_SUMMARY = Schema('PostSummary', (
+    'userId', 'username', 'content', 'createdAt', 'editedAt', 'editedByAdmin'
+), open=False)
+
+USER = Schema('User', (
+    'uid', 'email', 'username', 'displayName', 'friends', 'followers_count', 'suspended', 'createdAt', 'updated_at'
+))
+
+# admin user list: a fixed set of fields, friends as a count
+USER_SUMMARY = Schema('UserSummary', ('username', 'email', 'suspended', 'createdAt'), counts={
+    'friends': 'friends'
+}, defaults={
+    'username': '',
+    'email': '',
+    'suspended': False
+}, open=False)
+
+ADMIN = Schema('Admin', ('email', 'name', 'created_at'), hidden=('password',))
+
+TASK = Schema('CommunityTask', (
+    'title', 'category', 'reward_minutes', 'deadline', 'participants', 'completed_by',
+    'created_at', 'created_by', 'updated_at', 'updated_by'
+))
+
+TASK_WITH_COUNTS = Schema('CommunityTaskWithCounts', TASK.record_type.__slots__, counts={
+    'participants_count': 'participants',
+    'completed_count': 'completed_by'
+})
+
+CATEGORY = Schema('TaskCategory', (
+    'category_name', 'category_type', 'description', 'created_at', 'created_by', 'updated_at', 'updated_by'
+))
+
+ADMIN_LOG = Schema('AdminLog', ('admin_id', 'action_type', 'details', 'timestamp', 'ip_address'))
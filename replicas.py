@@ -0,0 +1,213 @@
+# replicas.py
+'''
+Warm in-memory replicas of small collections that are read on almost every request.
+
+A Replica attaches a Firestore snapshot listener to its collection and keeps a projected copy of
+every document by id (records or summaries, never admin passwords).
+The first snapshot loads the collection, later ones apply only the changed documents, so once
+a replica is live its reads cost no Firestore reads at all and see writes from any process
+within the listener's latency (usually well under a second).
+
+Reads go through the replica only while its listener is streaming. Before the first snapshot,
+while the listener reconnects, after it closed on an error (it is re-attached after
+REPLICA_RETRY_SECONDS) or when the collection grew past REPLICA_MAX_DOCUMENTS, callers read
+Firestore directly as before. Listeners are gRPC streams, so each process attaches its own
+(on first use, or from admin_api.init_worker after fork) and a replica inherited through fork
+starts over.
+
+Which source answered is reported per request in the X-Replica response header, e.g.
+`categories;age=42.1` (seconds since the replica last changed) or `admins;fallback`.
+REPLICAS_ENABLED=0 turns replicas off.
+'''
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from flask import g
+
+import metrics
+import records
+
+ENABLED = os.environ.get('REPLICAS_ENABLED', '1') == '1'
+MAX_DOCUMENTS = int(os.environ.get('REPLICA_MAX_DOCUMENTS', 50000))
+RETRY_SECONDS = float(os.environ.get('REPLICA_RETRY_SECONDS', 30))
+
+LIVE = metrics.registry.gauge('admin_api_replica_live', 'Whether the replica of a collection is serving reads', ('collection',))
+DOCUMENTS = metrics.registry.gauge('admin_api_replica_documents', 'Documents held by the replica of a collection', ('collection',))
+READS = metrics.registry.counter('admin_api_replica_reads_total', 'Reads of replicated collections by source', ('collection', 'source'))
+
+logger = logging.getLogger(__name__)
+
+_served = contextvars.ContextVar('replicas_served', default=None) # this request's {replica name: source}
+
+
+class Replica:
+    '''
+    collection: collection to replicate
+    project: snapshot -> the value kept for the document
+    '''
+
+    def __init__(self, collection, project):
+        self.collection = collection
+        self.project = project
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.client = None
+        self.watch = None
+        self.state = 'detached' # syncing, live or failed
+        self.documents = dict() # document id -> projected value
+        self.synced_at = None
+        self.failed_at = None
+
+    # listener
+
+    def ensure(self, db):
+        '''Attach the listener for this process if needed, returns whether reads can be served locally'''
+        if not ENABLED:
+            return False
+        client = getattr(db, '_wrapped', db) # listen on the client itself, instrumentation counts request reads only
+        with self.lock:
+            if self.pid != os.getpid():
+                self._reset() # inherited through fork, the listener's stream belongs to the parent
+            if self.client is not None and self.client is not client:
+                self._detach() # the service reconnected
+            if self.watch is not None and getattr(self.watch, '_closed', False):
+                self._fail('listener closed')
+            if self.state == 'detached' or (self.state == 'failed' and time.time() - self.failed_at > RETRY_SECONDS):
+                self._attach(client)
+            live = self.state == 'live' and getattr(self.watch, 'is_active', True)
+        LIVE.set(1 if live else 0, collection=self.collection)
+        return live
+
+    def _attach(self, client):
+        self.state = 'syncing'
+        self.client = client
+        self.documents = dict()
+        try:
+            self.watch = client.collection(self.collection).on_snapshot(self._on_snapshot)
+        except Exception as e:
+            self._fail(e)
+
+    def _detach(self):
+        watch, self.watch = self.watch, None
+        self.state = 'detached'
+        self.client = None
+        if watch is not None:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                logger.warning('Closing the %s listener failed: %s', self.collection, e)
+
+    def _fail(self, reason):
+        logger.warning('Replica of %s stopped, reading Firestore directly: %s', self.collection, reason)
+        self._detach()
+        self.state = 'failed'
+        self.failed_at = time.time()
+
+    def _on_snapshot(self, docs, changes, read_time):
+        try:
+            with self.lock:
+                if self.state not in ('syncing', 'live'):
+                    return # detached while this snapshot was in flight
+                if len(docs) > MAX_DOCUMENTS:
+                    self._fail(f'{len(docs)} documents, more than REPLICA_MAX_DOCUMENTS')
+                    return
+                if self.state == 'syncing':
+                    self.documents = {doc.id: self.project(doc) for doc in docs}
+                else:
+                    for change in changes:
+                        if change.type.name == 'REMOVED':
+                            self.documents.pop(change.document.id, None)
+                        else:
+                            self.documents[change.document.id] = self.project(change.document)
+                self.state = 'live'
+                self.synced_at = time.time()
+            DOCUMENTS.set(len(self.documents), collection=self.collection)
+        except Exception as e:
+            logger.exception('Applying a %s snapshot failed: %s', self.collection, e)
+            with self.lock:
+                self._fail(e)
+
+    # reads, only valid after ensure() returned True
+
+    def get(self, doc_id):
+        '''Copy of the kept value of a document, None if there is no such document'''
+        self._note('replica')
+        value = self.documents.get(doc_id)
+        return value.copy() if value is not None else None
+
+    def values(self):
+        '''The kept values, shared: callers must copy before changing them'''
+        self._note('replica')
+        with self.lock:
+            return list(self.documents.values())
+
+    def fallback(self):
+        '''Record that this request read the collection from Firestore'''
+        self._note('fallback')
+
+    def age(self):
+        return time.time() - self.synced_at if self.synced_at else None
+
+    def _note(self, source):
+        READS.inc(collection=self.collection, source=source)
+        served = _served.get()
+        if served is not None:
+            served[self.collection] = source
+
+
+def task_summary(snapshot):
+    # what the task stats need, without the participant lists
+    data = snapshot.to_dict() or dict()
+    return {
+        'deadline': data.get('deadline'),
+        'category': data.get('category', 'Uncategorized'),
+        'participants': len(data.get('participants') or ()),
+        'completed_by': len(data.get('completed_by') or ())
+    }
+
+
+ADMINS = Replica('admins', records.ADMIN.from_snapshot)
+CATEGORIES = Replica('categories', records.CATEGORY.from_snapshot)
+TASKS = Replica('community_tasks', task_summary)
+ALL = (ADMINS, CATEGORIES, TASKS)
+
+
+def start(db):
+    '''Attach every replica's listener now instead of on first use (e.g. in a new worker)'''
+    for replica in ALL:
+        replica.ensure(db)
+
+
+def init_app(app):
+    '''Report in X-Replica which replicated collections a request read, and from where'''
+
+    @app.before_request
+    def start_replica_accounting():
+        g.replicas_token = _served.set(dict())
+
+    @app.after_request
+    def report_replica_reads(response):
+        served = _served.get()
+        if served:
+            replicas = {replica.collection: replica for replica in ALL}
+            response.headers['X-Replica'] = ', '.join(
+                f'{name};age={replicas[name].age() or 0:.1f}' if source == 'replica' else f'{name};fallback'
+                for name, source in served.items()
+            )
+        return response
+
+    @app.teardown_request
+    def reset_replica_accounting(exc):
+        token = g.pop('replicas_token', None)
+        if token is None:
+            return
+        try:
+            _served.reset(token)
+        except ValueError: # teardown ran in a different context than before_request
+            _served.set(None)
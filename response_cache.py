@@ -0,0 +1,134 @@
+# response_cache.py
+'''
+In-memory response cache with stale-while-revalidate, for endpoints whose data may be a little
+old (analytics).
+
+    @app.route('/api/admin/analytics/summary')
+    @token_required
+    @analytics_cache.cached(args={'days': 30})
+    def get_analytics_summary(current_admin): ...
+
+Responses are keyed by endpoint and the listed query args (normalized to the type of their
+default, so `?days=30`, `?days=030` and no `days` share an entry; other args are ignored).
+For `ttl` seconds a cached response is served as is (X-Cache: HIT). For `stale_ttl` seconds after
+that it is still served right away (X-Cache: STALE) while one background thread recomputes it.
+Older entries are computed in the request (X-Cache: MISS). Only 200 responses are cached, and
+the least recently used entries are evicted beyond `max_entries`.
+'''
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, copy_current_request_context, request
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ('body', 'mimetype', 'created_at', 'refreshing')
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.created_at = time.monotonic()
+        self.refreshing = False
+
+
+class ResponseCache:
+    def __init__(self, name, ttl, stale_ttl, max_entries=256):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # key -> _Entry, most recently used last
+
+    def _key(self, args):
+        values = []
+        for name, default in sorted(args.items()):
+            value = request.args.get(name, default, type=type(default)) if default is not None else request.args.get(name)
+            values.append((name, value))
+        return (request.endpoint, tuple(values))
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, response):
+        entry = _Entry(response.get_data(), response.mimetype)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _store(self, key, result):
+        # views return a response or (response, status)
+        response, status = result if isinstance(result, tuple) else (result, None)
+        if (status or response.status_code) == 200 and self.ttl + self.stale_ttl > 0:
+            self.put(key, response)
+        return result
+
+    def _refresh_in_background(self, key, entry, compute):
+        with self.lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+
+        @copy_current_request_context
+        def refresh():
+            try:
+                self._store(key, compute())
+            except Exception as e:
+                logger.warning('Background refresh of %s failed: %s', key[0], e)
+            finally:
+                entry.refreshing = False # a failed refresh is retried by the next stale hit
+
+        threading.Thread(target=refresh, name=f'{self.name}-refresh', daemon=True).start()
+
+    def _serve(self, entry, status):
+        response = Response(entry.body, status=200, mimetype=entry.mimetype)
+        response.headers['X-Cache'] = status
+        response.headers['Age'] = str(int(time.monotonic() - entry.created_at))
+        return response
+
+    def cached(self, args=None):
+        '''Decorator caching a view's 200 responses by endpoint and the given {query arg: default}'''
+        args = args or dict()
+
+        def decorator(f):
+            @wraps(f)
+            def decorated(*view_args, **view_kwargs):
+                key = self._key(args)
+                compute = lambda: f(*view_args, **view_kwargs)
+                entry = self.get(key)
+
+                if entry is not None:
+                    age = time.monotonic() - entry.created_at
+                    if age < self.ttl:
+                        metrics.record_cache(self.name, True)
+                        return self._serve(entry, 'HIT')
+                    if age < self.ttl + self.stale_ttl:
+                        metrics.record_cache(self.name, True)
+                        self._refresh_in_background(key, entry, compute)
+                        return self._serve(entry, 'STALE')
+
+                metrics.record_cache(self.name, False)
+                result = self._store(key, compute())
+                response = result[0] if isinstance(result, tuple) else result
+                response.headers['X-Cache'] = 'MISS'
+                return result
+            return decorated
+        return decorator
@@ -0,0 +1,389 @@
+# search.py
+'''
+In-process search over usernames, emails and post content, for /api/admin/search.
+
+For users and for posts, the index maps case-folded word tokens to postings: an array('I') of
+document numbers appended in increasing order, so a million documents of ~15 distinct words
+take about 60 MB of postings. Removed and re-indexed documents leave tombstones that are
+compacted away once they reach COMPACT_RATIO of the index. The last word of a query also
+matches as a prefix (search as you type): the terms starting with it come from one bisect of
+the sorted vocabulary, instead of postings kept for every edge n-gram of every term.
+
+A query matches documents containing all of its words. Candidates are read newest first from
+the postings of the rarest word and checked against the other words by bisection. A word
+scores the idf of its term, or half the idf of all its completions when it only matches as a
+prefix; ties go to the newer document. Reading newest first means the scan can stop as soon as
+a page of best-possible matches is found, and at most SEARCH_MAX_CANDIDATES matches are ranked
+otherwise, so a query takes a few milliseconds however many documents match.
+
+Each process builds its index in a background thread on its first search, keeps it current with
+the writes made through its FirebaseService (index_service) and every SEARCH_REFRESH_SECONDS
+picks up users and posts created or edited elsewhere (by the app). Documents deleted elsewhere
+are dropped when a search finds them missing.
+'''
+import bisect
+import datetime
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from functools import wraps
+
+import metrics
+import records
+
+REFRESH_SECONDS = float(os.environ.get('SEARCH_REFRESH_SECONDS', 60))
+MAX_CANDIDATES = int(os.environ.get('SEARCH_MAX_CANDIDATES', 5000))
+MAX_SCANNED = int(os.environ.get('SEARCH_MAX_SCANNED', 50000)) # postings read per query before giving up on more matches
+PREFIX_EXPANSIONS = int(os.environ.get('SEARCH_PREFIX_EXPANSIONS', 20)) # terms a prefix may stand for
+MIN_PREFIX = 2
+MAX_TERMS_PER_DOCUMENT = 256
+COMPACT_RATIO = 0.2
+PREFIX_WEIGHT = 0.5
+
+USERS = 'users'
+POSTS = 'posts'
+KINDS = (USERS, POSTS)
+
+# document fields indexed, and what a search result shows of each kind
+INDEXED_FIELDS = {
+    USERS: ('username', 'email'),
+    POSTS: ('content',)
+}
+RESULT_SCHEMAS = {
+    USERS: records.USER_SUMMARY,
+    POSTS: records.POST_SUMMARY
+}
+# fields whose newer values mean a document was created or changed since the last refresh
+CHANGE_FIELDS = {
+    USERS: ('createdAt', 'updated_at'),
+    POSTS: ('createdAt', 'editedAt')
+}
+CLOCK_SKEW = datetime.timedelta(minutes=5) # refresh overlap, re-indexing a document is harmless
+
+DOCUMENTS = metrics.registry.gauge('admin_api_search_documents', 'Documents in the search index')
+BUILD_SECONDS = metrics.registry.gauge('admin_api_search_build_seconds', 'Duration of the last search index build')
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return _WORD.findall(text.casefold()) if isinstance(text, str) else []
+
+
+def _contains(postings, docno):
+    i = bisect.bisect_left(postings, docno)
+    return i < len(postings) and postings[i] == docno
+
+
+class SearchIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.state = 'empty' # building, ready or failed
+        self.postings = {kind: dict() for kind in KINDS} # term -> array of docnos, ascending
+        self.vocabularies = {kind: [] for kind in KINDS} # sorted terms
+        self.bulk = False # while building, terms are sorted once at the end
+        self.kinds = bytearray() # docno -> index into KINDS
+        self.ids = [] # docno -> document id, None once removed
+        self.docnos = dict() # (kind, document id) -> docno
+        self.tombstones = 0
+        self.watermarks = dict() # (kind, change field) -> newest value indexed
+        self.versions = dict() # (kind, document id) -> its change fields in the snapshot indexed
+
+    def __len__(self):
+        return len(self.docnos)
+
+    # writes
+
+    def add(self, kind, doc_id, *texts):
+        '''Index (or re-index) a document from its text fields'''
+        terms = dict()
+        for text in texts:
+            terms.update(dict.fromkeys(tokenize(text)))
+
+        with self.lock:
+            self._remove(kind, doc_id)
+            self._maybe_compact()
+            docno = len(self.ids)
+            self.ids.append(doc_id)
+            self.kinds.append(KINDS.index(kind))
+            self.docnos[(kind, doc_id)] = docno
+            kind_postings = self.postings[kind]
+            for term in list(terms)[:MAX_TERMS_PER_DOCUMENT]:
+                postings = kind_postings.get(term)
+                if postings is None:
+                    postings = kind_postings[term] = array('I')
+                    if not self.bulk:
+                        bisect.insort(self.vocabularies[kind], term)
+                postings.append(docno)
+
+    def add_snapshot(self, kind, snapshot):
+        '''Index a document unless this version of it (its change fields) already is'''
+        data = snapshot.to_dict() or dict()
+        version = tuple(data.get(field) for field in CHANGE_FIELDS[kind])
+        with self.lock:
+            unchanged = any(version) and self.versions.get((kind, snapshot.id)) == version
+        if not unchanged: # refreshes overlap by CLOCK_SKEW and see most documents twice
+            self.add(kind, snapshot.id, *(data.get(field) for field in INDEXED_FIELDS[kind]))
+        with self.lock:
+            if any(version):
+                self.versions[(kind, snapshot.id)] = version
+            for field in CHANGE_FIELDS[kind]:
+                value = data.get(field)
+                key = (kind, field)
+                if isinstance(value, datetime.datetime) and (key not in self.watermarks or value > self.watermarks[key]):
+                    self.watermarks[key] = value
+
+    def remove(self, kind, doc_id):
+        with self.lock:
+            self._remove(kind, doc_id)
+            self._maybe_compact()
+
+    def _remove(self, kind, doc_id):
+        self.versions.pop((kind, doc_id), None)
+        docno = self.docnos.pop((kind, doc_id), None)
+        if docno is not None:
+            self.ids[docno] = None
+            self.tombstones += 1
+
+    def _maybe_compact(self):
+        if self.tombstones > 1000 and self.tombstones > COMPACT_RATIO * len(self.ids):
+            self._compact()
+
+    def _compact(self):
+        ids = self.ids
+        for kind_postings in self.postings.values():
+            for term, postings in list(kind_postings.items()):
+                live = array('I', (docno for docno in postings if ids[docno] is not None))
+                if live:
+                    kind_postings[term] = live
+                else:
+                    del kind_postings[term]
+        self._sort_vocabularies()
+        self.tombstones = 0
+
+    def _sort_vocabularies(self):
+        self.vocabularies = {kind: sorted(self.postings[kind]) for kind in KINDS}
+
+    # building
+
+    def ensure_started(self, db):
+        '''Start building the index in the background (once per process), returns whether it is ready'''
+        with self.lock:
+            if self.pid != os.getpid():
+                self._reset() # a copy inherited through fork, without the thread keeping it current
+            if self.state in ('empty', 'failed'):
+                self.state = 'building'
+                threading.Thread(target=self._run, args=(db,), name='search-index', daemon=True).start()
+            return self.state == 'ready'
+
+    def _run(self, db):
+        try:
+            self.build(db)
+        except Exception as e:
+            logger.exception('Building the search index failed: %s', e)
+            self.state = 'failed'
+            return
+        while True:
+            time.sleep(REFRESH_SECONDS)
+            try:
+                self.refresh(db)
+            except Exception as e:
+                logger.warning('Refreshing the search index failed: %s', e)
+
+    def build(self, db):
+        '''Index every user and post'''
+        started = time.perf_counter()
+        build_start = datetime.datetime.now(datetime.timezone.utc)
+        with self.lock:
+            self.bulk = True # inserting each new term into the sorted vocabulary would be quadratic
+        for kind in KINDS:
+            fields = list(INDEXED_FIELDS[kind] + CHANGE_FIELDS[kind])
+            for snapshot in db.collection(kind).select(fields).stream():
+                self.add_snapshot(kind, snapshot)
+        with self.lock:
+            self.bulk = False
+            self._sort_vocabularies()
+            for kind in KINDS:
+                for field in CHANGE_FIELDS[kind]:
+                    self.watermarks.setdefault((kind, field), build_start)
+            self.state = 'ready'
+        BUILD_SECONDS.set(time.perf_counter() - started)
+        DOCUMENTS.set(len(self))
+        logger.info('Search index built: %d documents, %d terms in %.1fs', len(self), sum(map(len, self.vocabularies.values())), time.perf_counter() - started)
+
+    def refresh(self, db):
+        '''Index the users and posts created or changed since the last build or refresh'''
+        for kind in KINDS:
+            fields = list(INDEXED_FIELDS[kind] + CHANGE_FIELDS[kind])
+            for field in CHANGE_FIELDS[kind]:
+                since = self.watermarks[(kind, field)] - CLOCK_SKEW
+                query = db.collection(kind).where(field, '>', since).order_by(field).select(fields)
+                for snapshot in query.stream():
+                    self.add_snapshot(kind, snapshot)
+        DOCUMENTS.set(len(self))
+
+    # queries
+
+    def _expand(self, kind, prefix):
+        vocabulary = self.vocabularies[kind]
+        start = bisect.bisect_left(vocabulary, prefix)
+        end = bisect.bisect_left(vocabulary, prefix + '\U0010ffff', start)
+        # the shortest completions are the likeliest
+        return heapq.nsmallest(PREFIX_EXPANSIONS, vocabulary[start:end], key=len)
+
+    def _groups(self, kind, words, prefix):
+        '''Per query word, the (postings, score) of the terms matching it; None if a word matches nothing'''
+        kind_postings = self.postings[kind]
+        documents = max(len(self.docnos), 1)
+        groups = []
+        for word in words:
+            exact = kind_postings.get(word)
+            group = [(exact, math.log(1 + documents / len(exact)))] if exact is not None else []
+            if word == prefix:
+                completions = [kind_postings[term] for term in self._expand(kind, word) if term != word]
+                if completions:
+                    matches = sum(map(len, completions))
+                    score = PREFIX_WEIGHT * math.log(1 + documents / matches)
+                    group.extend((postings, score) for postings in completions)
+            if not group:
+                return None
+            groups.append(group)
+        return groups
+
+    def _search_kind(self, kind, words, prefix, wanted):
+        '''Up to MAX_CANDIDATES (score, docno) matches of one kind, and whether matching stopped early'''
+        groups = self._groups(kind, words, prefix)
+        if groups is None:
+            return [], False
+
+        # walk the rarest word's documents, newest first
+        groups.sort(key=lambda group: sum(len(postings) for postings, _ in group))
+        driver = groups[0]
+        candidates = heapq.merge(*(reversed(postings) for postings, _ in driver), reverse=True)
+        # a single term's documents need no check, a word with completions needs its best match
+        checked = groups if len(driver) > 1 else groups[1:]
+        base = driver[0][1] if len(driver) == 1 else 0.0
+        best_possible = sum(max(score for _, score in group) for group in groups) - 1e-9
+
+        ids = self.ids
+        matches = []
+        perfect = 0
+        previous = None
+        for scanned, docno in enumerate(candidates):
+            if scanned >= MAX_SCANNED:
+                return matches, True
+            if docno == previous or ids[docno] is None:
+                continue # in the postings of several completions, or removed
+            previous = docno
+
+            total = base
+            for group in checked:
+                best = 0.0
+                for postings, score in group:
+                    if score > best and _contains(postings, docno):
+                        best = score
+                if not best:
+                    break
+                total += best
+            else:
+                matches.append((total, docno))
+                if total >= best_possible:
+                    perfect += 1
+                    if perfect >= wanted:
+                        # every later document is older, so it can at best tie and rank below
+                        return matches, True
+                if len(matches) >= MAX_CANDIDATES:
+                    return matches, True
+        return matches, False
+
+    def search(self, query, kind=None, offset=0, limit=20):
+        '''Ranked matches as ([(kind, document id, score)], matches found, whether matching stopped early)'''
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words:
+            return [], 0, False
+        prefix = words[-1] if not query[-1:].isspace() and len(words[-1]) >= MIN_PREFIX else None
+
+        with self.lock:
+            matches = []
+            truncated = False
+            for searched in ((kind,) if kind else KINDS):
+                kind_matches, kind_truncated = self._search_kind(searched, words, prefix, offset + limit)
+                matches.extend(kind_matches)
+                truncated = truncated or kind_truncated
+
+            matches.sort(key=lambda match: (-match[0], -match[1])) # best first, newer first on ties
+            page = [
+                (KINDS[self.kinds[docno]], self.ids[docno], round(score, 4))
+                for score, docno in matches[offset:offset + limit]
+            ]
+            return page, len(matches), truncated
+
+    def hydrate(self, db, hits):
+        '''Search results for a page of hits; documents deleted since they were indexed are dropped'''
+        documents = dict()
+        for kind in KINDS:
+            refs = [db.collection(kind).document(doc_id) for hit_kind, doc_id, _ in hits if hit_kind == kind]
+            if not refs:
+                continue
+            schema = RESULT_SCHEMAS[kind]
+            for snapshot in db.get_all(refs, field_paths=schema.projection):
+                if snapshot.exists:
+                    documents[(kind, snapshot.id)] = schema.from_snapshot(snapshot)
+
+        results = []
+        for kind, doc_id, score in hits:
+            document = documents.get((kind, doc_id))
+            if document is None:
+                self.remove(kind, doc_id)
+                continue
+            results.append({
+                'type': kind[:-1], # user / post
+                'id': doc_id,
+                'score': score,
+                'document': document
+            })
+        return results
+
+
+def index_service(service, index):
+    '''Keep the index current with the user and post writes made through a FirebaseService instance'''
+
+    def after(name, update):
+        method = getattr(service, name)
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            result = method(*args, **kwargs)
+            try:
+                update(result, *args, **kwargs)
+            except Exception as e:
+                logger.warning('Updating the search index after %s failed: %s', name, e)
+            return result
+        setattr(service, name, wrapper)
+
+    def reindex_user(user_id):
+        fields = list(INDEXED_FIELDS[USERS] + CHANGE_FIELDS[USERS])
+        snapshot = service.db.collection(USERS).document(user_id).get(field_paths=fields)
+        if snapshot.exists:
+            index.add_snapshot(USERS, snapshot)
+
+    after('register_user', lambda user, email, password, username: index.add(USERS, user['uid'], username, email))
+    after('update_user_profile', lambda result, user_id, updates: reindex_user(user_id) if {'username', 'email'} & set(updates) else None)
+    after('delete_user', lambda result, user_id, admin_id=None: index.remove(USERS, user_id))
+    after('create_post', lambda post_id, user_id, content: index.add(POSTS, post_id, content))
+    after('update_post_content', lambda result, post_id, new_content, admin_id=None: index.add(POSTS, post_id, new_content))
+    after('delete_post', lambda result, post_id, admin_id=None: index.remove(POSTS, post_id))
+    after('delete_posts', lambda result, post_ids, admin_id=None: [index.remove(POSTS, post_id) for post_id in result['deleted']])
+    service.search_index = index
+    return index
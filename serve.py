@@ -0,0 +1,59 @@
+# serve.py
+'''
+Production launcher for the admin API.
+
+    python -m serve                                  # settings from gunicorn.conf.py / environment
+    python -m serve --workers 4 --threads 16
+    python -m serve --worker-class gevent --worker-connections 500
+
+Runs gunicorn with the multi-worker settings in gunicorn.conf.py. Workers drain in-flight
+requests for up to --graceful-timeout seconds on SIGTERM before exiting.
+'''
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(ROOT, 'gunicorn.conf.py')
+
+
+def build_argv(args):
+    argv = ['gunicorn', '--config', CONFIG_FILE, '--chdir', ROOT]
+    if args.bind:
+        argv += ['--bind', args.bind]
+    if args.workers is not None:
+        argv += ['--workers', str(args.workers)]
+    if args.worker_class:
+        argv += ['--worker-class', args.worker_class]
+    if args.threads is not None:
+        argv += ['--threads', str(args.threads)]
+    if args.worker_connections is not None:
+        argv += ['--worker-connections', str(args.worker_connections)]
+    if args.graceful_timeout is not None:
+        argv += ['--graceful-timeout', str(args.graceful_timeout)]
+    if args.preload:
+        argv += ['--preload']
+    argv.append(args.app)
+    return argv
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bind', help='host:port to listen on (default 0.0.0.0:$PORT)')
+    parser.add_argument('--workers', type=int, help='worker processes (default $WEB_CONCURRENCY or 2 x cores + 1)')
+    parser.add_argument('--worker-class', choices=['gthread', 'gevent', 'sync'], help='default gthread')
+    parser.add_argument('--threads', type=int, help='threads per gthread worker')
+    parser.add_argument('--worker-connections', type=int, help='concurrent connections per gevent worker')
+    parser.add_argument('--graceful-timeout', type=int, help='seconds to drain in-flight requests on shutdown')
+    parser.add_argument('--preload', action='store_true', help='import the app once in the master before forking')
+    parser.add_argument('--app', default='wsgi:app', help='WSGI application to serve')
+    args = parser.parse_args(argv)
+
+    from gunicorn.app.wsgiapp import WSGIApplication
+
+    sys.argv = build_argv(args)
+    WSGIApplication('%(prog)s [OPTIONS] [APP_MODULE]').run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# singleflight.py
+'''
+Request coalescing for expensive FirebaseService reads.
+
+When several dashboards load at once they all ask for the same analytics summary or task stats.
+With coalesce_service() applied, the first call runs against Firestore and identical calls
+arriving while it is in flight wait for it and share its result instead of starting their own
+scan. A finished result is also handed out for SINGLEFLIGHT_REUSE_SECONDS afterwards (0 turns
+reuse off, coalescing of in-flight calls still applies); any write through the service drops
+reusable results so admins see their own changes.
+
+Every caller gets its own deep copy of the result, since route handlers modify what they get.
+'''
+import copy
+import os
+import threading
+import time
+from functools import wraps
+
+import metrics
+
+REUSE_SECONDS = float(os.environ.get('SINGLEFLIGHT_REUSE_SECONDS', 1.0))
+WAIT_TIMEOUT = float(os.environ.get('SINGLEFLIGHT_WAIT_TIMEOUT', 30))
+MAX_KEYS = 1000 # finished results kept for reuse are pruned beyond this
+
+# reads that are expensive and safe to share between admins
+COALESCED_METHODS = (
+    'get_analytics_summary',
+    'get_community_task_stats',
+    'get_community_tasks',
+    'get_task_categories',
+    'get_admin_logs'
+)
+
+# methods after which reusable results may be outdated
+WRITE_METHOD_PREFIXES = (
+    'create_', 'update_', 'delete_', 'suspend_', 'toggle_', 'add_', 'remove_', 'register_', 'upload_',
+    'claim_', 'release_', 'resolve_', 'rescore_', 'report_', 'backfill_', 'rebuild_', 'revoke_', 'log_'
+)
+
+CALLS = metrics.registry.counter(
+    'admin_api_singleflight_calls_total',
+    'Coalescable reads by outcome: executed against Firestore, coalesced with an in-flight call, or reused',
+    ('method', 'result')
+)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+        self.reusable = True
+
+
+class SingleFlight:
+    def __init__(self, reuse_seconds=REUSE_SECONDS, wait_timeout=WAIT_TIMEOUT):
+        self.reuse_seconds = reuse_seconds
+        self.wait_timeout = wait_timeout
+        self.lock = threading.Lock()
+        self.calls = dict() # key -> _Call, in flight or finished within the reuse window
+
+    def do(self, key, fn, label=''):
+        '''Run fn once for all concurrent callers with the same key and return a copy of its result'''
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None and call.done.is_set():
+                if call.error is None and time.monotonic() - call.finished_at < self.reuse_seconds:
+                    CALLS.inc(method=label, result='reused')
+                    return copy.deepcopy(call.result)
+                del self.calls[key]
+                call = None
+            leader = call is None
+            if leader:
+                if len(self.calls) >= MAX_KEYS:
+                    self._prune()
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(self.wait_timeout):
+                CALLS.inc(method=label, result='coalesced')
+                if call.error is not None:
+                    raise call.error
+                return copy.deepcopy(call.result)
+            # the leader is stuck, don't pile up behind it
+            CALLS.inc(method=label, result='executed')
+            return fn()
+
+        CALLS.inc(method=label, result='executed')
+        try:
+            call.result = fn()
+            return copy.deepcopy(call.result)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            call.finished_at = time.monotonic()
+            call.done.set()
+            with self.lock:
+                reusable = call.reusable and call.error is None and self.reuse_seconds > 0
+                if not reusable and self.calls.get(key) is call:
+                    del self.calls[key]
+
+    def _prune(self):
+        now = time.monotonic()
+        for key, call in list(self.calls.items()):
+            if call.done.is_set() and now - call.finished_at >= self.reuse_seconds:
+                del self.calls[key]
+
+    def forget(self):
+        '''Drop finished results so the next call reads fresh data'''
+        with self.lock:
+            for key, call in list(self.calls.items()):
+                if call.done.is_set():
+                    del self.calls[key]
+                else:
+                    call.reusable = False # may have read data from before the write, share it only with current waiters
+
+
+def coalesce_service(service, methods=COALESCED_METHODS, flight=None):
+    '''Route the given read methods of a FirebaseService instance through a SingleFlight'''
+    flight = flight or SingleFlight()
+
+    def coalesced(name, method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            try:
+                key = (name, args, tuple(sorted(kwargs.items())))
+                hash(key)
+            except TypeError:
+                return method(*args, **kwargs) # unhashable arguments, can't be shared
+            return flight.do(key, lambda: method(*args, **kwargs), label=name)
+        return wrapper
+
+    def invalidating(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                flight.forget()
+        return wrapper
+
+    for name in methods:
+        setattr(service, name, coalesced(name, getattr(service, name)))
+    for name in dir(service):
+        if name.startswith(WRITE_METHOD_PREFIXES) and callable(getattr(service, name)):
+            setattr(service, name, invalidating(getattr(service, name)))
+    service.singleflight = flight
+    return flight
@@ -0,0 +1,259 @@
+# timelines.py
+'''
+Precomputed friends-feed timelines (fan-out on write), enabled with TIMELINES_ENABLED=1.
+
+Each user has a document timelines/{user_id} whose `entries` map references the newest posts of
+the user and their friends (post id -> {userId, createdAt}). fan_out_post() queues a new post and
+a background thread appends it to the author's and every friend's timeline in batched writes of
+up to TIMELINE_FANOUT_BATCH_SIZE documents, so creating a post takes no longer than before.
+A feed page is then one document read plus one batched read of the page's posts, instead of one
+query per chunk of friends (feeds.py).
+
+Appends are blind merge writes of one map key, so concurrent fan-outs never conflict. The
+TIMELINE_MAX_ENTRIES cap is applied when a timeline is read (older entries and deleted posts
+are removed with key deletes, which commute with concurrent appends), when it is rebuilt, and
+on write: after about one in TIMELINE_TRIM_EVERY appends a timeline is read back and trimmed,
+so the timelines of users who never open their feed stay bounded too (a timeline growing past
+Firestore's 1 MiB document limit would fail every fan-out batch it is in). `entries` is exempt
+from indexing (firestore.indexes.json), every map key would otherwise be an index entry.
+A timeline is rebuilt from the posts collection when friendships change, when it is first
+read, and on demand (POST /api/admin/users/<id>/timeline/rebuild); until then, and for pages
+the timeline can't answer (a cursor no longer in it, or pages past a full timeline), reads use
+the query-based feed.
+'''
+import datetime
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from firebase_admin import firestore
+
+import feeds
+import metrics
+import records
+
+ENABLED = os.environ.get('TIMELINES_ENABLED', '0') == '1'
+MAX_ENTRIES = int(os.environ.get('TIMELINE_MAX_ENTRIES', 500))
+FANOUT_BATCH_SIZE = min(int(os.environ.get('TIMELINE_FANOUT_BATCH_SIZE', 400)), 500) # Firestore caps a batch at 500 writes
+FANOUT_WORKERS = int(os.environ.get('TIMELINE_FANOUT_WORKERS', 2))
+TRIM_EVERY = max(int(os.environ.get('TIMELINE_TRIM_EVERY', max(MAX_ENTRIES // 10, 1))), 1) # appends per trim check, on average
+
+COLLECTION = 'timelines'
+_EPOCH = datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+
+FANOUT_LAG = metrics.registry.histogram(
+    'admin_api_timeline_fanout_lag_seconds',
+    'Time from post creation until the post is in every recipient timeline'
+)
+FANOUT_PENDING = metrics.registry.gauge(
+    'admin_api_timeline_fanout_pending',
+    'Posts created but not yet fanned out to timelines'
+)
+FANOUT_WRITES = metrics.registry.counter(
+    'admin_api_timeline_fanout_writes_total',
+    'Timeline appends by result',
+    ('result',)
+)
+READS = metrics.registry.counter(
+    'admin_api_timeline_reads_total',
+    'Feed reads by source: the timeline, or the query-based feed when there is no usable timeline',
+    ('result',)
+)
+REBUILDS = metrics.registry.counter(
+    'admin_api_timeline_rebuilds_total',
+    'Timeline rebuilds by result',
+    ('result',)
+)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_rebuilding = set() # user ids with a rebuild queued in this process
+
+
+def _get_executor():
+    global _executor, _executor_pid, _rebuilding
+    with _lock:
+        # pool threads don't survive fork, workers build their own
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='timeline-fan-out')
+            _executor_pid = os.getpid()
+            _rebuilding = set()
+        return _executor
+
+
+def _timeline_ref(db, user_id):
+    return db.collection(COLLECTION).document(user_id)
+
+
+def _entry(author_id, created_at):
+    return {'userId': author_id, 'createdAt': created_at}
+
+
+def _newest_first(entries):
+    return [post_id for _, post_id in sorted(
+        ((entry.get('createdAt') or _EPOCH, post_id) for post_id, entry in entries.items()),
+        reverse=True
+    )]
+
+
+# fan-out on write
+
+def fan_out_post(db, post_id, author_id, created_at=None):
+    '''Queue a new post for the timelines of its author and the author's friends'''
+    if not ENABLED:
+        return
+    created_at = created_at or datetime.datetime.now(datetime.timezone.utc)
+    FANOUT_PENDING.inc()
+    _get_executor().submit(_fan_out, db, post_id, author_id, created_at, time.time())
+
+
+def _fan_out(db, post_id, author_id, created_at, queued_at):
+    try:
+        author = db.collection('users').document(author_id).get()
+        friends = (author.to_dict() or dict()).get('friends', []) if author.exists else []
+        recipients = list(dict.fromkeys(friends + [author_id]))
+
+        update = {'entries': {post_id: _entry(author_id, created_at)}}
+        for chunk in feeds.chunked(recipients, FANOUT_BATCH_SIZE):
+            batch = db.batch()
+            for user_id in chunk:
+                batch.set(_timeline_ref(db, user_id), update, merge=True)
+            try:
+                batch.commit()
+                FANOUT_WRITES.inc(len(chunk), result='ok')
+            except Exception as e:
+                # these timelines miss the post until their next rebuild
+                FANOUT_WRITES.inc(len(chunk), result='failed')
+                logger.warning('Timeline fan-out of post %s to %d users failed: %s', post_id, len(chunk), e)
+                continue
+            # sampled, so checking costs one read per TRIM_EVERY appends instead of one per append
+            for user_id in chunk:
+                if random.randrange(TRIM_EVERY) == 0:
+                    _trim(db, user_id)
+    except Exception as e:
+        logger.exception('Timeline fan-out of post %s failed: %s', post_id, e)
+    finally:
+        FANOUT_PENDING.dec()
+        FANOUT_LAG.observe(time.time() - queued_at)
+
+
+def _remove_entries(db, user_id, post_ids):
+    try:
+        _timeline_ref(db, user_id).set({
+            'entries': {post_id: firestore.DELETE_FIELD for post_id in post_ids}
+        }, merge=True)
+    except Exception as e:
+        logger.warning('Trimming the timeline of %s failed: %s', user_id, e)
+
+
+def _trim(db, user_id):
+    '''Delete the entries of a timeline beyond MAX_ENTRIES'''
+    try:
+        snapshot = _timeline_ref(db, user_id).get()
+        data = snapshot.to_dict() if snapshot.exists else None
+        entries = (data or dict()).get('entries') or dict()
+        if len(entries) > MAX_ENTRIES:
+            _remove_entries(db, user_id, _newest_first(entries)[MAX_ENTRIES:])
+    except Exception as e:
+        logger.warning('Trimming the timeline of %s failed: %s', user_id, e)
+
+
+# reads
+
+def read(db, user_id, limit=20, last_post=None, schema=records.POST):
+    '''Page of a user's timeline as {posts, last_post}, or None when the query-based feed has to answer'''
+    snapshot = _timeline_ref(db, user_id).get()
+    data = snapshot.to_dict() if snapshot.exists else None
+    if not data or not data.get('built_at'):
+        # appends alone don't make a timeline complete, only a rebuild does
+        READS.inc(result='missing')
+        schedule_rebuild(db, user_id)
+        return None
+
+    post_ids = _newest_first(data.get('entries') or dict())
+    stale = post_ids[MAX_ENTRIES:]
+    post_ids = post_ids[:MAX_ENTRIES]
+    capped = len(post_ids) == MAX_ENTRIES # older posts may exist beyond the timeline
+
+    start = 0
+    if last_post:
+        if last_post not in post_ids:
+            READS.inc(result='cursor_missing')
+            return None
+        start = post_ids.index(last_post) + 1
+
+    # fetch the page, skipping posts deleted since they were fanned out
+    posts = []
+    while len(posts) < limit and start < len(post_ids):
+        page_ids = post_ids[start:start + limit - len(posts)]
+        start += len(page_ids)
+        refs = [db.collection('posts').document(post_id) for post_id in page_ids]
+        found = {doc.id: doc for doc in db.get_all(refs) if doc.exists}
+        for post_id in page_ids:
+            if post_id in found:
+                posts.append(schema.from_snapshot(found[post_id]))
+            else:
+                stale.append(post_id)
+
+    if stale:
+        _get_executor().submit(_remove_entries, db, user_id, stale)
+    if not posts and capped:
+        READS.inc(result='past_end')
+        return None
+    READS.inc(result='timeline')
+    return {
+        'posts': posts,
+        'last_post': posts[-1]['id'] if posts else None
+    }
+
+
+# rebuilds
+
+def rebuild(db, user_id):
+    '''Rebuild a user's timeline from the posts collection, returns the number of entries'''
+    try:
+        user = db.collection('users').document(user_id).get()
+        if not user.exists:
+            raise Exception('User not found')
+        friends = (user.to_dict() or dict()).get('friends', [])
+
+        posts = feeds.author_feed(db, friends + [user_id], limit=MAX_ENTRIES)['posts']
+        _timeline_ref(db, user_id).set({
+            'entries': {post['id']: _entry(post.get('userId'), post.get('createdAt')) for post in posts},
+            'built_at': firestore.SERVER_TIMESTAMP
+        })
+        REBUILDS.inc(result='ok')
+        return len(posts)
+    except Exception:
+        REBUILDS.inc(result='failed')
+        raise
+
+
+def schedule_rebuild(db, *user_ids):
+    '''Rebuild timelines in the background (once per user while one is queued)'''
+    if not ENABLED:
+        return
+    executor = _get_executor()
+    for user_id in user_ids:
+        with _lock:
+            if user_id in _rebuilding:
+                continue
+            _rebuilding.add(user_id)
+        executor.submit(_background_rebuild, db, user_id)
+
+
+def _background_rebuild(db, user_id):
+    try:
+        rebuild(db, user_id)
+    except Exception as e:
+        logger.warning('Rebuilding the timeline of %s failed: %s', user_id, e)
+    finally:
+        with _lock:
+            _rebuilding.discard(user_id)
+
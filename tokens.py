@@ -0,0 +1,166 @@
+# tokens.py
+'''
+Admin access and refresh tokens.
+
+Access tokens are short lived (ACCESS_TOKEN_TTL seconds) and carry the admin's id, email and name,
+so token_required can verify them entirely in memory. Refresh tokens live longer
+(REFRESH_TOKEN_TTL) and are exchanged for a new pair on /api/admin/token/refresh, which is the
+only place the admin record is read again. Logging out revokes the token ids (jti); revocations
+are written to Firestore and every process pulls new ones into a local set every
+REVOCATION_SYNC_SECONDS, so revoked tokens stop working everywhere within that interval.
+
+Tokens are signed with HS256 and name their key in the `kid` header. ADMIN_SIGNING_KEYS holds
+`kid:secret` pairs separated by commas and ADMIN_SIGNING_KID picks the one new tokens are signed
+with (default: the first). To rotate, add the new key, make it active, and drop the old one once
+REFRESH_TOKEN_TTL has passed. Without ADMIN_SIGNING_KEYS the app's SECRET_KEY is used as kid
+`default`.
+'''
+import datetime
+import logging
+import os
+import threading
+import time
+import uuid
+
+import jwt
+
+logger = logging.getLogger(__name__)
+
+ACCESS_TOKEN_TTL = int(os.environ.get('ACCESS_TOKEN_TTL', 15 * 60))
+REFRESH_TOKEN_TTL = int(os.environ.get('REFRESH_TOKEN_TTL', 7 * 24 * 3600))
+REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', 30))
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def signing_keys_from_env(default_secret):
+    '''Returns ({kid: secret}, active kid) from ADMIN_SIGNING_KEYS/ADMIN_SIGNING_KID'''
+    keys = dict()
+    for pair in os.environ.get('ADMIN_SIGNING_KEYS', '').split(','):
+        kid, _, secret = pair.strip().partition(':')
+        if kid and secret:
+            keys[kid] = secret
+    if not keys:
+        keys['default'] = default_secret
+    active_kid = os.environ.get('ADMIN_SIGNING_KID') or next(iter(keys))
+    if active_kid not in keys:
+        raise ValueError(f'ADMIN_SIGNING_KID {active_kid!r} is not in ADMIN_SIGNING_KEYS')
+    return keys, active_kid
+
+
+class RevocationList:
+    '''Revoked token ids of this process, refreshed from Firestore by a background thread'''
+
+    def __init__(self, firebase_service, interval=REVOCATION_SYNC_SECONDS):
+        self.firebase_service = firebase_service
+        self.interval = interval
+        self.lock = threading.Lock() # guards revoked and synced_until, never held during a Firestore read
+        self.start_lock = threading.Lock() # one thread loads the revocations, the others wait for it
+        self.revoked = dict() # jti -> expiry (unix time), entries are dropped once the token expired anyway
+        self.synced_until = None
+        self.thread = None
+        self.pid = None
+
+    def ensure_started(self):
+        '''Load the revocations and start syncing them in this process, if not done yet'''
+        # the sync thread doesn't survive fork, every worker starts its own
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            with self.lock:
+                self.revoked = dict()
+                self.synced_until = None
+            self.sync() # reads outside self.lock, add() from other requests isn't held up
+            self.thread = threading.Thread(target=self._run, name='token-revocations', daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warning('Could not sync revoked tokens: %s', e)
+
+    def sync(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        # only entries revoked since the last sync, with a little overlap for clock skew
+        since = self.synced_until - datetime.timedelta(seconds=5) if self.synced_until else None
+        entries = self.firebase_service.get_revoked_tokens(since)
+        current = time.time()
+        with self.lock: # add() writes from request threads
+            for jti, expires_at in entries:
+                self.revoked[jti] = expires_at
+            for jti in [jti for jti, expires_at in self.revoked.items() if expires_at < current]:
+                self.revoked.pop(jti, None)
+            self.synced_until = now
+
+    def add(self, jti, expires_at):
+        with self.lock:
+            self.revoked[jti] = expires_at
+        self.firebase_service.revoke_token(jti, expires_at)
+
+    def __contains__(self, jti):
+        self.ensure_started()
+        return jti in self.revoked
+
+
+class TokenService:
+    def __init__(self, keys, active_kid, revocations=None, legacy_key=None,
+                 access_ttl=ACCESS_TOKEN_TTL, refresh_ttl=REFRESH_TOKEN_TTL):
+        self.keys = keys
+        self.active_kid = active_kid
+        self.revocations = revocations
+        self.legacy_key = legacy_key # key of tokens issued before kid headers, see decode()
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+
+    def _encode(self, claims, ttl):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        claims = dict(claims, jti=uuid.uuid4().hex, iat=now, exp=now + datetime.timedelta(seconds=ttl))
+        return jwt.encode(claims, self.keys[self.active_kid], algorithm='HS256', headers={'kid': self.active_kid})
+
+    def issue(self, admin):
+        '''New access and refresh token for an admin dict (id, email, name)'''
+        access_token = self._encode({
+            'typ': 'access',
+            'admin_id': admin['id'],
+            'email': admin.get('email', ''),
+            'name': admin.get('name', '')
+        }, self.access_ttl)
+        refresh_token = self._encode({'typ': 'refresh', 'admin_id': admin['id']}, self.refresh_ttl)
+        return {
+            'token': access_token,
+            'refreshToken': refresh_token,
+            'expiresIn': self.access_ttl
+        }
+
+    def decode(self, token, typ='access'):
+        '''Verified claims of a token, raises InvalidToken'''
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+            if kid is None and typ == 'access' and self.legacy_key:
+                # 24h tokens from before this module only hold admin_id, the caller looks the admin up
+                claims = jwt.decode(token, self.legacy_key, algorithms=['HS256'])
+                claims['legacy'] = True
+                return claims
+            if kid not in self.keys:
+                raise InvalidToken('Unknown signing key')
+            claims = jwt.decode(token, self.keys[kid], algorithms=['HS256'])
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+
+        if claims.get('typ') != typ or 'admin_id' not in claims:
+            raise InvalidToken('Wrong token type')
+        if self.revocations is not None and claims.get('jti') in self.revocations:
+            raise InvalidToken('Token has been revoked')
+        return claims
+
+    def revoke(self, claims):
+        if self.revocations is not None and claims.get('jti'):
+            self.revocations.add(claims['jti'], claims['exp'])
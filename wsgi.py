@@ -0,0 +1,5 @@
+# wsgi.py
+# WSGI entry point for production servers, e.g. `gunicorn -c gunicorn.conf.py wsgi:app`
+from admin_api import app
+
+__all__ = ['app']